@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+
+#     mdp - Agent keeping the derived keys in memory
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Agent holding the keys derived from the master passwords, like
+ssh-agent, so that mdp neither asks for the password nor derives the key
+again on each run.
+
+The agent listens on a Unix domain socket only accessible to its user, and
+forgets the keys by exiting after a period without any request. Each
+request and response is a Json object on a single line:
+ - {"command": "get", "file": path} gives {"kdf": parameters, "key": hex}
+   or {"key": null} if the agent doesn't know the key of the file,
+ - {"command": "add", "file": path, "kdf": parameters, "key": hex},
+ - {"command": "stop"}.
+"""
+
+import os
+import socket
+import stat
+import struct
+import tempfile
+
+from Cryptography import DerivedKey
+import JsonCodec
+from KeyDerivation import KeyDerivation
+
+
+# Environment variable giving the path of the socket
+SOCKET_ENV = "MDP_AGENT_SOCK"
+# Time without any request after which the agent exits, in seconds
+DEFAULT_TIMEOUT = 15 * 60
+# Time given to the agent or to a client to answer, in seconds
+_IO_TIMEOUT = 2
+_MAX_MESSAGE_SIZE = 64 * 1024
+
+
+class AgentError(Exception):
+    """ Raised when the agent can't be started, or answers an error
+    """
+
+
+def is_supported():
+    """ Tells if the system provides Unix domain sockets
+    :rtype: bool
+    """
+    return hasattr(socket, "AF_UNIX")
+
+
+def private_directory():
+    """ Returns the directory of the sockets of the user, created only
+    accessible to them
+    :rtype: str
+    :raise PermissionError: If it belongs to another user or is accessible
+    to anyone else
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    directory = os.path.join(runtime_dir, "mdp-{0}".format(os.getuid()))
+    _make_directory(directory, 0o077)
+    return directory
+
+
+def _make_directory(path, forbidden_mode):
+    """ Creates a directory only accessible to the user if it is missing,
+    then checks that it belongs to the user
+    :param forbidden_mode: Permissions the other users must not have on it
+    :raise PermissionError: If it belongs to another user, is a symbolic
+    link, or grants them one of the forbidden permissions
+    """
+    try:
+        os.makedirs(path, mode=0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or \
+            st.st_mode & forbidden_mode:
+        raise PermissionError("Unsafe directory: {0}".format(path))
+
+
+def socket_path():
+    """ Returns the path of the socket of the agent, given by SOCKET_ENV or
+    in private_directory() by default
+    :rtype: str
+    """
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    return os.path.join(private_directory(), "agent.sock")
+
+
+def bind_socket(path):
+    """ Creates a Unix domain socket only accessible to the user, in a
+    directory created only accessible to them if it is missing
+    :rtype: socket.socket
+    :raise PermissionError: If the directory belongs to another user, or
+    anyone else can replace the socket
+    """
+    # An existing directory, such as the home of the user, may be readable
+    # by the others, but not writable
+    _make_directory(os.path.dirname(os.path.abspath(path)), 0o022)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    return server
+
+
+def _check_socket(path):
+    """ Checks that the socket belongs to the user and is not accessible to
+    anyone else
+    :raise PermissionError: Otherwise
+    """
+    st = os.lstat(path)
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid() or \
+            st.st_mode & 0o077:
+        raise PermissionError("Unsafe agent socket: {0}".format(path))
+
+
+def peer_uid(connection):
+    """ Returns the user id of the process at the other end of the
+    connection, or None if the system doesn't tell it
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                        struct.calcsize("3i"))
+    pid, uid, gid = struct.unpack("3i", credentials)
+    return uid
+
+
+def _receive(connection):
+    """ Reads a message up to its end of line
+    :rtype: dict
+    :raise ValueError: If the message is invalid or too long
+    """
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = connection.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+        if len(data) > _MAX_MESSAGE_SIZE:
+            raise ValueError("Message too long")
+    message = JsonCodec.loads(data)
+    if not isinstance(message, dict):
+        raise ValueError("Expecting a Json object")
+    return message
+
+
+def _send(connection, message):
+    connection.sendall((JsonCodec.dumps(message) + "\n").encode("utf-8"))
+
+
+class Agent:
+    """ Server keeping the derived keys of the password files
+    """
+
+    def __init__(self, path=None, timeout=DEFAULT_TIMEOUT):
+        """
+        :param path: Path of the socket, socket_path() by default
+        :param timeout: Time without any request after which the agent
+        exits, in seconds, None to never exit
+        """
+        self.path = path if path is not None else socket_path()
+        self.timeout = timeout
+        self._socket = None
+        # Derived keys, by real path of the password files
+        self._keys = {}
+
+    def bind(self):
+        """ Creates the socket, so that the clients can connect before the
+        agent is serving
+        :raise AgentError: If another agent is running on the socket, or the
+        path is used by another kind of file
+        """
+        if os.path.lexists(self.path):
+            st = os.lstat(self.path)
+            if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+                raise AgentError("{0} is not a socket of the user"
+                                 .format(self.path))
+            try:
+                request({"command": "get", "file": ""}, self.path)
+                raise AgentError("An agent is already running on {0}"
+                                 .format(self.path))
+            except (OSError, ValueError):
+                # Left by an agent which didn't exit properly
+                os.remove(self.path)
+
+        self._socket = bind_socket(self.path)
+        self._socket.listen(8)
+
+    def serve(self):
+        """ Answers the requests until the agent is stopped or stays idle
+        for too long, then removes the socket
+        """
+        if self._socket is None:
+            self.bind()
+        self._socket.settimeout(self.timeout)
+        try:
+            running = True
+            while running:
+                try:
+                    connection, address = self._socket.accept()
+                except socket.timeout:
+                    break
+                with connection:
+                    running = self._serve_connection(connection)
+        finally:
+            self._socket.close()
+            self._socket = None
+            self._keys.clear()
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _serve_connection(self, connection):
+        """ Answers the request of a client
+        :return: False if the agent has to stop
+        :rtype: bool
+        """
+        uid = peer_uid(connection)
+        if uid is not None and uid != os.getuid():
+            return True
+
+        connection.settimeout(_IO_TIMEOUT)
+        try:
+            message = _receive(connection)
+        except (OSError, ValueError):
+            return True
+
+        try:
+            response = self.handle(message)
+        except ValueError as e:
+            response = {"error": str(e)}
+        try:
+            _send(connection, response)
+        except OSError:
+            pass
+        return message.get("command") != "stop"
+
+    def handle(self, message):
+        """ Executes a request
+        :param message: Request received from a client
+        :type message: dict
+        :return: The response
+        :rtype: dict
+        :raise ValueError: If the request is invalid
+        """
+        command = message.get("command")
+        if command == "stop":
+            return {}
+
+        file = message.get("file")
+        if not isinstance(file, str):
+            raise ValueError("Missing file")
+        if command == "get":
+            derived_key = self._keys.get(file)
+            if derived_key is None:
+                return {"key": None}
+            return {"kdf": derived_key.kdf.to_header(),
+                    "key": derived_key.key.hex()}
+        elif command == "add":
+            try:
+                self._keys[file] = DerivedKey(
+                    KeyDerivation.from_header(message.get("kdf")),
+                    bytes.fromhex(message.get("key")))
+            except TypeError:
+                raise ValueError("Invalid key")
+            return {}
+        else:
+            raise ValueError("Unknown command: {0}".format(command))
+
+
+def request(message, path=None):
+    """ Sends a request to the agent
+    :param message: Request, see the module documentation
+    :type message: dict
+    :param path: Path of the socket, socket_path() by default
+    :return: The response
+    :rtype: dict
+    :raise OSError: If the agent is not running, or its socket is unsafe
+    :raise AgentError: If the agent answers an error
+    """
+    path = path if path is not None else socket_path()
+    _check_socket(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(_IO_TIMEOUT)
+        connection.connect(path)
+        _send(connection, message)
+        response = _receive(connection)
+    if "error" in response:
+        raise AgentError(response["error"])
+    return response
+
+
+def get_key(file_path):
+    """ Asks the agent for the key of a password file
+    :return: The key, or None if the agent doesn't run or doesn't know it
+    :rtype: DerivedKey
+    """
+    if not is_supported():
+        return None
+    try:
+        response = request({"command": "get",
+                            "file": os.path.realpath(file_path)})
+        if response.get("key") is None:
+            return None
+        return DerivedKey(KeyDerivation.from_header(response.get("kdf")),
+                          bytes.fromhex(response["key"]))
+    except (OSError, ValueError, TypeError, AgentError):
+        return None
+
+
+def add_key(file_path, derived_key):
+    """ Gives the key of a password file to the agent, if it is running
+    :type derived_key: DerivedKey
+    :return: True if the agent keeps the key
+    :rtype: bool
+    """
+    if not is_supported():
+        return False
+    try:
+        request({"command": "add", "file": os.path.realpath(file_path),
+                 "kdf": derived_key.kdf.to_header(),
+                 "key": derived_key.key.hex()})
+        return True
+    except (OSError, ValueError, AgentError):
+        return False
+
+
+def stop():
+    """ Stops the agent, which forgets all the keys
+    :return: False if the agent was not running
+    :rtype: bool
+    """
+    try:
+        request({"command": "stop"})
+        return True
+    except (OSError, ValueError, AgentError):
+        return False
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+#     mdp - Binary encoding and decoding module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Binary format of the keychains, more compact and faster to decode than
+Json. It is made of:
+ - MAGIC, the version of the format (1 byte) and the number of records
+   (4 bytes),
+ - the table of the records, giving for each password the lengths in bytes
+   of its domain, its login (2 bytes each) and its password (4 bytes),
+ - the domain, login and password of each record, encoded in UTF-8 and
+   each followed by a null character.
+The integers are unsigned and big-endian.
+The table allows to skip records without decoding them. The null characters
+allow to decode all the strings at once with a single split, the table being
+only used when a string contains a null character itself.
+"""
+
+from itertools import chain
+import struct
+
+
+MAGIC = b"MDPK"
+FORMAT_VERSION = 1
+_HEADER_STRUCT = struct.Struct(">4sBI")
+_RECORD_STRUCT = struct.Struct(">HHI")
+_SEPARATOR = "\0"
+
+
+def encode(records):
+    """ Encodes the passwords
+    :param records: Iterable of (domain, login, password) strings
+    :rtype: bytes
+    :raise ValueError: If a domain or a login is longer than 65535 bytes
+    """
+    strings = list(chain.from_iterable(records))
+    number = len(strings) // 3
+
+    # Encoding all the strings at once
+    data = (_SEPARATOR.join(strings) + _SEPARATOR * (number > 0)) \
+        .encode("utf-8")
+    if len(data) == sum(map(len, strings)) + len(strings):
+        # Only ASCII characters, one byte each
+        lengths = map(len, strings)
+    else:
+        lengths = (len(s.encode("utf-8")) for s in strings)
+
+    try:
+        table = struct.pack(">" + _RECORD_STRUCT.format[1:] * number,
+                            *lengths)
+    except struct.error:
+        raise ValueError("Domain or login too long")
+
+    return b"".join((_HEADER_STRUCT.pack(MAGIC, FORMAT_VERSION, number),
+                     table, data))
+
+
+def is_binary(data):
+    """ Tells if the data starts like the binary format
+    :rtype: bool
+    """
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def count(data):
+    """ Returns the number of records, by only reading the header
+    :rtype: int
+    :raise ValueError: If the data is not in the binary format
+    """
+    return _read_header(data)
+
+
+def _read_header(data):
+    if len(data) < _HEADER_STRUCT.size or not is_binary(data):
+        raise ValueError("Not a binary keychain")
+    magic, version, number = _HEADER_STRUCT.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError("Unsupported binary keychain version: {0}"
+                         .format(version))
+    return number
+
+
+def iter_records(data, start=0):
+    """ Decodes the records
+    :param data: Bytes returned by encode()
+    :param start: Number of records to skip, without decoding them
+    :return: An iterator of (domain, login, password) strings
+    :raise ValueError: If the data is invalid or truncated
+    """
+    number = _read_header(data)
+    start = min(start, number)
+    data = memoryview(data)
+    table_start = _HEADER_STRUCT.size
+    strings_start = table_start + number * _RECORD_STRUCT.size
+    if len(data) < strings_start:
+        raise ValueError("Truncated binary keychain")
+    table = struct.iter_unpack(_RECORD_STRUCT.format,
+                               data[table_start:strings_start])
+
+    # Skipping the strings of the first records
+    pos = strings_start
+    for i in range(start):
+        domain_length, login_length, password_length = next(table)
+        pos += domain_length + login_length + password_length + 3
+
+    strings = str(data[pos:], "utf-8").split(_SEPARATOR)
+    if len(strings) == (number - start) * 3 + 1 and strings[-1] == "":
+        # Grouping the strings by three
+        strings = iter(strings)
+        return zip(strings, strings, strings)
+
+    # Some of the strings contain a null character
+    return _iter_with_table(data, pos, table)
+
+
+def _iter_with_table(data, pos, table):
+    """ Decodes the records by their lengths in the table
+    """
+    for domain_length, login_length, password_length in table:
+        login_start = pos + domain_length + 1
+        password_start = login_start + login_length + 1
+        end = password_start + password_length
+        if end >= len(data):
+            raise ValueError("Truncated binary keychain")
+        yield (str(data[pos:login_start - 1], "utf-8"),
+               str(data[login_start:password_start - 1], "utf-8"),
+               str(data[password_start:end], "utf-8"))
+        pos = end + 1
+
+    if pos != len(data):
+        raise ValueError("Invalid binary keychain")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+#     mdp - Cryptographic backends module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import json
+import os
+import platform
+import time
+
+
+class MissingBackendError(Exception):
+    pass
+
+
+class Backend:
+    """ Base class for the libraries providing AES
+        The backends only have to implement the primitives used by the
+        Cryptography module: AES-CBC by chunks and AES-GCM.
+    """
+    name = None
+
+    @staticmethod
+    def is_available():
+        """ Tells if the library is installed
+        :rtype: bool
+        """
+        return False
+
+    @staticmethod
+    def version():
+        """ Returns the version of the library
+        :rtype: str
+        """
+        return None
+
+    def cbc_encryptor(self, key, iv):
+        """ Returns a function encrypting successive chunks with AES-CBC
+        The chunks must be multiples of the block size.
+        """
+        raise NotImplementedError(self.name)
+
+    def cbc_decryptor(self, key, iv):
+        """ Returns a function decrypting successive chunks with AES-CBC
+        The chunks must be multiples of the block size.
+        """
+        raise NotImplementedError(self.name)
+
+    def gcm_encrypt(self, key, nonce, data, aad=b""):
+        """ Encrypts and authenticates data with AES-GCM
+        :return: The encrypted data followed by the 16 bytes tag
+        :rtype: bytes
+        """
+        raise NotImplementedError(self.name)
+
+    def gcm_decrypt(self, key, nonce, data, aad=b""):
+        """ Decrypts data returned by gcm_encrypt() and checks its tag
+        :rtype: bytes
+        :raise ValueError: If the data or the associated data were modified
+        """
+        raise NotImplementedError(self.name)
+
+
+class PyCryptodomeBackend(Backend):
+    """ pycryptodome, or pycrypto >= 2.7 which shares its Crypto package
+    """
+    name = "pycryptodome"
+
+    def __init__(self):
+        from Crypto.Cipher import AES
+        self._aes = AES
+
+    @staticmethod
+    def is_available():
+        try:
+            from Crypto.Cipher import AES
+        except ImportError:
+            return False
+        # The older pycrypto does not support GCM
+        return hasattr(AES, "MODE_GCM")
+
+    @staticmethod
+    def version():
+        import Crypto
+        return Crypto.__version__
+
+    def cbc_encryptor(self, key, iv):
+        return self._aes.new(key, self._aes.MODE_CBC, iv).encrypt
+
+    def cbc_decryptor(self, key, iv):
+        return self._aes.new(key, self._aes.MODE_CBC, iv).decrypt
+
+    def gcm_encrypt(self, key, nonce, data, aad=b""):
+        crypto = self._aes.new(key, self._aes.MODE_GCM, nonce=nonce)
+        crypto.update(aad)
+        encrypted, tag = crypto.encrypt_and_digest(data)
+        return encrypted + tag
+
+    def gcm_decrypt(self, key, nonce, data, aad=b""):
+        crypto = self._aes.new(key, self._aes.MODE_GCM, nonce=nonce)
+        crypto.update(aad)
+        return crypto.decrypt_and_verify(data[:-16], data[-16:])
+
+
+class OpenSSLBackend(Backend):
+    """ The cryptography library, using OpenSSL
+    """
+    name = "cryptography"
+
+    def __init__(self):
+        from cryptography.exceptions import InvalidTag
+        from cryptography.hazmat.primitives.ciphers import (Cipher,
+                                                            algorithms, modes)
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        self._invalid_tag = InvalidTag
+        self._cipher = Cipher
+        self._algorithms = algorithms
+        self._modes = modes
+        self._aesgcm = AESGCM
+
+    @staticmethod
+    def is_available():
+        try:
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        except ImportError:
+            return False
+        return True
+
+    @staticmethod
+    def version():
+        import cryptography
+        return cryptography.__version__
+
+    def cbc_encryptor(self, key, iv):
+        return self._cipher(self._algorithms.AES(key),
+                            self._modes.CBC(iv)).encryptor().update
+
+    def cbc_decryptor(self, key, iv):
+        return self._cipher(self._algorithms.AES(key),
+                            self._modes.CBC(iv)).decryptor().update
+
+    def gcm_encrypt(self, key, nonce, data, aad=b""):
+        return self._aesgcm(key).encrypt(nonce, data, aad)
+
+    def gcm_decrypt(self, key, nonce, data, aad=b""):
+        try:
+            return self._aesgcm(key).decrypt(nonce, data, aad)
+        except self._invalid_tag:
+            raise ValueError("MAC check failed")
+
+
+BACKENDS = {backend.name: backend
+            for backend in (OpenSSLBackend, PyCryptodomeBackend)}
+
+# Environment variable forcing the backend, by its name
+BACKEND_ENV = "MDP_CRYPTO_BACKEND"
+
+_selected_backend = None
+# File remembering the result of the benchmark between the runs
+CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME") or
+                          os.path.join(os.path.expanduser("~"), ".cache"),
+                          "mdp", "backend.json")
+
+
+def available_backends():
+    """ Returns the names of the backends installed
+    :rtype: list
+    """
+    return [name for name, backend in BACKENDS.items()
+            if backend.is_available()]
+
+
+def get_backend(name=None):
+    """ Returns a backend
+    Without name, the one set in the environment variable MDP_CRYPTO_BACKEND
+    is used. Otherwise, the fastest one installed is picked by a short
+    benchmark, whose result is kept in CACHE_FILE until the libraries or
+    Python change.
+    :param name: Name of the backend to use
+    :rtype: Backend
+    :raise MissingBackendError: If the backend is not installed
+    """
+    global _selected_backend
+
+    name = name or os.environ.get(BACKEND_ENV)
+    if name:
+        if name not in BACKENDS or not BACKENDS[name].is_available():
+            raise MissingBackendError(name)
+        return BACKENDS[name]()
+
+    if _selected_backend is None:
+        backends = [BACKENDS[name]() for name in available_backends()]
+        if len(backends) == 0:
+            raise MissingBackendError(", ".join(BACKENDS))
+        elif len(backends) == 1:
+            _selected_backend = backends[0]
+        else:
+            _selected_backend = _fastest(backends)
+
+    return _selected_backend
+
+
+def _fastest(backends):
+    """ Returns the fastest backend, measured only if the cache doesn't
+    tell it for these versions of the libraries
+    :rtype: Backend
+    """
+    versions = {backend.name: backend.version() for backend in backends}
+    versions["python"] = platform.python_version()
+    versions["machine"] = platform.machine()
+    try:
+        with open(CACHE_FILE) as file:
+            cache = json.load(file)
+        if cache.get("versions") == versions:
+            for backend in backends:
+                if backend.name == cache.get("backend"):
+                    return backend
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    fastest = min(backends, key=_measure)
+    try:
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        with open(CACHE_FILE, "w") as file:
+            json.dump({"versions": versions, "backend": fastest.name}, file)
+    except OSError:
+        # Measured again next time
+        pass
+    return fastest
+
+
+def _measure(backend):
+    """ Measures the time taken by a backend to process a few segments
+    :rtype: float
+    """
+    key = bytes(32)
+    data = bytes(256 * 1024)
+    best = None
+    for i in range(3):
+        start = time.perf_counter()
+        backend.gcm_decrypt(key, bytes(12),
+                            backend.gcm_encrypt(key, bytes(12), data))
+        backend.cbc_decryptor(key, bytes(16))(
+            backend.cbc_encryptor(key, bytes(16))(data))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
@@ -17,120 +17,684 @@
 #     with this program; if not, write to the Free Software Foundation, Inc.,
 #     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+import base64
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
-import sys
+import hmac
+import io
+import json
+import os
+import struct
+import zlib
 try:
-    from Crypto.Cipher import AES
-    from Crypto import Random
+    import lzma
 except ImportError:
-    print("mdp: Error: The module pycrypto (python-crypto) is missing",
-          file=sys.stderr)
-    sys.exit(1)
+    # Python can be built without lzma
+    lzma = None
+
+from CryptoBackend import get_backend
+from KeyDerivation import KeyDerivation, Sha256, default_key_derivation
+
+# Signature at the beginning of the files having a header.
+# Files without it are in the legacy format: IV followed by the AES-CBC data.
+MAGIC = b"\x89MDP"
+FORMAT_VERSION = 1
+# Version (1 byte) and length of the Json header (4 bytes) after the signature
+_HEADER_STRUCT = struct.Struct(">BI")
+_KEY_CHECK_LENGTH = 16
+# Size of the chunks read from the files, a multiple of the AES block size
+CHUNK_SIZE = 64 * 1024
+BLOCK_SIZE = 16
+# Size of the plain data in each AES-GCM segment, suggested to the callers
+# choosing them, the messages being a single AES-CBC stream by default
+DEFAULT_SEGMENT_SIZE = 1024 * 1024
+# Each segment starts with its nonce, flags and length, and ends with its tag
+_SEGMENT_STRUCT = struct.Struct(">12sBI")
+_AAD_STRUCT = struct.Struct(">QB")
+_NONCE_LENGTH = 12
+_TAG_LENGTH = 16
+_FINAL_SEGMENT = 0x01
+# Compression of the data before its encryption: name in the header and
+# functions creating the compressor and decompressor objects
+COMPRESSIONS = {"none": None,
+                "zlib": (zlib.compressobj, zlib.decompressobj)}
+if lzma is not None:
+    COMPRESSIONS["lzma"] = (lzma.LZMACompressor, lzma.LZMADecompressor)
+DEFAULT_COMPRESSION = "zlib"
 
 
 class CorruptedError(Exception):
     pass
 
 
+class _CompressingReader:
+    """ Binary file object compressing the data read from another one
+    """
+
+    def __init__(self, src, compressor):
+        self._src = src
+        self._compressor = compressor
+        self._buffer = b""
+        self._eof = False
+
+    def read(self, size):
+        while len(self._buffer) < size and not self._eof:
+            chunk = self._src.read(CHUNK_SIZE)
+            if chunk:
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class _DecompressingWriter:
+    """ Binary file object decompressing the data written to another one
+    """
+
+    def __init__(self, dst, decompressor):
+        self._dst = dst
+        self._decompressor = decompressor
+
+    def write(self, data):
+        if not data:
+            # Nothing more may be given to a decompressor at its end
+            return
+        try:
+            self._dst.write(self._decompressor.decompress(data))
+        except (zlib.error, EOFError) + \
+                ((lzma.LZMAError,) if lzma is not None else ()):
+            raise CorruptedError
+
+    def close(self):
+        """ Checks that the whole compressed data has been written
+        """
+        if not self._decompressor.eof:
+            raise CorruptedError
+        if hasattr(self._decompressor, "flush"):
+            self._dst.write(self._decompressor.flush())
+
+
+class EntryCipher:
+    """ Encrypts the passwords of a keychain one by one with AES-GCM, so
+        they can stay encrypted in memory until they are needed.
+    """
+
+    def __init__(self, key, backend=None):
+        """
+        :param key: AES key dedicated to the entries
+        :type key: bytes
+        :param backend: Library providing AES, the fastest one by default
+        :type backend: Backend
+        """
+        self._key = key
+        self._backend = backend if backend is not None else get_backend()
+
+    def encrypt(self, secret: str) -> str:
+        """ Encrypt a secret
+        :return: The nonce, encrypted secret and tag encoded in base64
+        :rtype: str
+        """
+        nonce = os.urandom(_NONCE_LENGTH)
+        encrypted = self._backend.gcm_encrypt(self._key, nonce,
+                                              secret.encode("utf-8"))
+        return base64.b64encode(nonce + encrypted).decode("ascii")
+
+    def decrypt(self, sealed: str) -> str:
+        """ Decrypt a secret returned by encrypt()
+        :rtype: str
+        :raise CorruptedError: If the secret has been modified
+        """
+        try:
+            data = base64.b64decode(sealed.encode("ascii"), validate=True)
+            if len(data) < _NONCE_LENGTH + _TAG_LENGTH:
+                raise ValueError("Truncated secret")
+            return self._backend.gcm_decrypt(self._key, data[:_NONCE_LENGTH],
+                                             data[_NONCE_LENGTH:]) \
+                .decode("utf-8")
+        except (ValueError, UnicodeError):
+            raise CorruptedError
+
+    def __eq__(self, other):
+        return isinstance(other, EntryCipher) and \
+            hmac.compare_digest(self._key, other._key)
+
+
+class DerivedKey:
+    """ Key already derived from a password, which can be given instead of
+        the password to skip its derivation, for instance by the agent.
+        It only unlocks the messages using the same key derivation function.
+    """
+    __slots__ = ("kdf", "key")
+
+    def __init__(self, kdf, key):
+        """
+        :param kdf: Key derivation function the key comes from
+        :type kdf: KeyDerivation
+        :param key: Derived key
+        :type key: bytes
+        """
+        self.kdf = kdf
+        self.key = key
+
+    def __repr__(self):
+        # Never showing the key
+        return "DerivedKey({0})".format(self.kdf)
+
+
 class Cryptography:
     """ Provides methods to encrypt and decrypt messages
-        It currently supports AES.
+        It currently supports AES, provided by one of the backends of the
+        CryptoBackend module.
+
+        The encrypted messages are made of:
+         - the signature MAGIC, the format version and a Json header holding
+           the key derivation parameters and a key check value, so a wrong
+           key is detected without deciphering the whole message;
+         - either a sequence of segments independently encrypted and
+           authenticated with AES-GCM, which can be processed in parallel,
+           or the IV followed by a single AES-CBC stream.
+        The data can be compressed before its encryption, as told by the
+        header.
+        Messages without the signature are read as the legacy format.
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, kdf=None, segment_size=None, workers=None,
+                 backend=None, compression=None):
+        """
+        :param kdf: Key derivation function used to encrypt the messages.
+        It is replaced by the one of each decrypted message, so that saving
+        a file again does not change its unlock time, and the keys of
+        entry_cipher() and journal_key() match the message.
+        :type kdf: KeyDerivation
+        :param segment_size: Size of the segments of the encrypted messages,
+        such as DEFAULT_SEGMENT_SIZE, 0 to use a single AES-CBC stream.
+        By default, the one of the last decrypted message is kept, or a
+        single stream.
+        :param workers: Number of threads processing the segments,
+        the number of processors by default.
+        :param backend: Library providing AES, the fastest one by default
+        :type backend: Backend
+        :param compression: Name of the compression applied before the
+        encryption, one of COMPRESSIONS, "none" to disable it.
+        By default, the one of the last decrypted message is kept.
+        :raise MissingBackendError: If no library providing AES is installed
+        """
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression: {0}".format(compression))
+
+        self.kdf = kdf
+        self.segment_size = segment_size
+        self.compression = compression
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        # Metadata stored by the caller in the header of the last decrypted
+        # message
+        self.metadata = {}
+        self._backend = backend if backend is not None else get_backend()
+        # Last derived key, to avoid deriving it again on each message
+        self._key_cache = (None, None, None)
 
     def validate(self, encrypted_msg, key):
         """ Checks the given key on the message
+        Prefer decrypt() when the message is needed afterwards: it performs
+        the same check without deciphering the message a second time.
         :param encrypted_msg: Message to check the validity of the key
         :param key: Key to try
         :return: True if the key is valid
         :rtype: bool
         """
-        # Creating a key by hashing the password
-        key = hashlib.sha256(key.encode("utf-8")).digest()
+        header, prefix = self._read_header(io.BytesIO(encrypted_msg))
+        if header is None:
+            # Legacy format, only the padding tells if the key is correct
+            return self.decrypt(encrypted_msg, key) is not None
 
-        # Creating a new instance of decrypter given the key and the IV.
-        crypto = AES.new(key, AES.MODE_CBC, encrypted_msg[:16])
+        kdf = self._read_kdf(header)
+        if isinstance(key, DerivedKey) and key.kdf != kdf:
+            return False
+        return self._check_key(header, self._derive_key(key, kdf))
 
+    def encrypt(self, msg, key):
+        """ Encrypt a message
+        :param msg: Message to encrypt
+        :param key: Key to protect the message
+        :return: The encrypted message
+        :rtype: bytes
+        """
+        dst = io.BytesIO()
+        self.encrypt_stream(io.BytesIO(msg.encode("utf-8")), dst, key)
+        return dst.getvalue()
+
+    def decrypt(self, encrypted_msg, key: str) -> str:
+        """ Decrypt a message and check the key in a single pass
+        The key is derived and the message deciphered only once, so there is
+        no need to call validate() beforehand.
+        :param encrypted_msg: Message to decrypt
+        :param key: Key protecting the message
+        :return: The original message, or None if the key is wrong
+        :rtype: str
+        :raise CorruptedError: If the message can't be deciphered at all
+        """
+        dst = io.BytesIO()
+        if not self.decrypt_stream(io.BytesIO(encrypted_msg), dst, key):
+            return None
+
+        # Getting back to UTF-8
         try:
-            plain = crypto.decrypt(encrypted_msg[16:])
-        except ValueError:
+            return dst.getvalue().decode("utf-8")
+        except UnicodeDecodeError:
+            # The header has been checked, so only a message in the legacy
+            # format can get there with a wrong key: it can give a valid
+            # padding by chance, but is very unlikely to be valid UTF-8.
+            return None
+
+    def encrypt_stream(self, src, dst, key, metadata=None):
+        """ Encrypt the content of a file, chunk by chunk
+        :param src: Binary file object to read the message from
+        :param dst: Binary file object to write the encrypted message to
+        :param key: Key to protect the message
+        :param metadata: Dictionary stored in clear in the header, describing
+        the content of the message
+        """
+        if self.kdf is None:
+            self.kdf = default_key_derivation()
+        if self.segment_size is None:
+            # The segments only save time on several processors and very
+            # large messages, they are opt-in
+            self.segment_size = 0
+        if self.compression is None:
+            self.compression = DEFAULT_COMPRESSION
+        key = self._derive_key(key, self.kdf)
+
+        header = {"check": self._key_check_value(key).hex(),
+                  "kdf": self.kdf.to_header()}
+        if self.segment_size > 0:
+            header["segment_size"] = self.segment_size
+        header["compression"] = self.compression
+        if self.compression != "none":
+            src = _CompressingReader(src,
+                                     COMPRESSIONS[self.compression][0]())
+        if metadata:
+            header["metadata"] = metadata
+        dst.write(self._write_header(header))
+
+        if self.segment_size > 0:
+            self._encrypt_segments(src, dst, key, self.segment_size)
+        else:
+            self._encrypt_cbc(src, dst, key)
+
+    def decrypt_stream(self, src, dst, key):
+        """ Decrypt the content of a file chunk by chunk, checking the key
+        For files in the legacy format, a wrong key is only detected at the
+        end: what has been written in dst must then be discarded.
+        :param src: Binary file object to read the encrypted message from
+        :param dst: Binary file object to write the message to
+        :param key: Key protecting the message
+        :return: True if the key is valid
+        :rtype: bool
+        :raise CorruptedError: If the message can't be deciphered at all
+        """
+        header, prefix = self._read_header(src)
+        kdf = self._read_kdf(header)
+        if isinstance(key, DerivedKey) and key.kdf != kdf:
+            # Derived for other parameters, it can't be the right key
+            return False
+        key = self._derive_key(key, kdf)
+
+        if header is not None and not self._check_key(header, key):
+            # Rejected without deciphering anything
+            return False
+
+        compression = header.get("compression", "none") \
+            if header is not None else "none"
+        if compression not in COMPRESSIONS:
             raise CorruptedError
+        if compression != "none":
+            dst = _DecompressingWriter(dst, COMPRESSIONS[compression][1]())
 
-        padding_length = int((plain[-1]))
-        if padding_length > AES.block_size and padding_length != 32:
-            # 32 is the space character and is kept for backwards compatibility
-            valid_key = False
-        elif padding_length == 32:
-            plain = plain.strip()
-            valid_key = True
-        elif plain[-padding_length:] != bytes((padding_length,)) * padding_length:
-            # Invalid padding!
-            valid_key = False
+        if header is not None and "segment_size" in header:
+            segment_size = header["segment_size"]
+            if not isinstance(segment_size, int) or segment_size <= 0:
+                raise CorruptedError
+            self._decrypt_segments(src, dst, key)
+            if self.segment_size is None:
+                self.segment_size = segment_size
         else:
-            valid_key = True
+            if not self._decrypt_cbc(src, dst, key, prefix,
+                                     key_checked=header is not None):
+                return False
+            if self.segment_size is None:
+                self.segment_size = 0
 
-        return valid_key
+        if compression != "none":
+            dst.close()
+        if self.compression is None and header is not None \
+                and "compression" in header:
+            self.compression = compression
 
-    def encrypt(self, msg, key):
-        """ Encrypt a message
-        :param msg: Message to encrypt
-        :param key: Key to protect the message
-        :return: The encrypted message
+        if not isinstance(kdf, Sha256):
+            # Keeping the parameters of the file, which another process may
+            # have tuned since the last message, for the next encryption.
+            # Files using the legacy hash are upgraded to the default one.
+            self.kdf = kdf
+
+        self.metadata = header.get("metadata", {}) \
+            if header is not None else {}
+        if not isinstance(self.metadata, dict):
+            raise CorruptedError
+
+        return True
+
+    def entry_cipher(self, key):
+        """ Returns the cipher of the passwords inside a keychain
+        Its key is derived from the one of the messages, with the same
+        key derivation function.
+        :param key: Password
+        :rtype: EntryCipher
+        """
+        return EntryCipher(self._subkey(key, b"mdp entries"), self._backend)
+
+    def journal_key(self, key):
+        """ Returns the key of the journal of the changes made after the
+        message was written, see the Journal module.
+        It is derived like the key of entry_cipher().
+        :param key: Password
+        :rtype: bytes
+        """
+        return self._subkey(key, b"mdp journal")
+
+    def derived_key(self, key):
+        """ Derives the key of the next messages, with the current key
+        derivation function
+        :param key: Password
+        :rtype: DerivedKey
+        """
+        if self.kdf is None:
+            self.kdf = default_key_derivation()
+        return DerivedKey(self.kdf, self._derive_key(key, self.kdf))
+
+    def _subkey(self, key, label):
+        """ Derives a key dedicated to another use than the messages
+        :param key: Password
+        :param label: Use of the key
         :rtype: bytes
         """
-        # Creating a key by hashing the password
-        key = hashlib.sha256(key.encode("utf-8")).digest()
+        if self.kdf is None:
+            self.kdf = default_key_derivation()
+        key = self._derive_key(key, self.kdf)
 
-        # New seed for PyCrypto
-        Random.atfork()
+        return hmac.new(key, label, hashlib.sha256).digest()
 
+    def _encrypt_cbc(self, src, dst, key):
+        """ Encrypt a file as a single AES-CBC stream, preceded by its IV
+        """
         # Generating initialization vector
-        iv = Random.new().read(AES.block_size)
+        iv = os.urandom(BLOCK_SIZE)
+        dst.write(iv)
+
+        encrypt = self._backend.cbc_encryptor(key, iv)
+        pending = b""
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
 
-        crypto = AES.new(key, AES.MODE_CBC, iv)
-        plain = msg.encode("utf-8")
+            pending += chunk
+            usable = len(pending) - len(pending) % BLOCK_SIZE
+            if usable > 0:
+                dst.write(encrypt(pending[:usable]))
+                pending = pending[usable:]
 
         # Adding some data at the end to match the block size required by AES
-        padding_length = AES.block_size - len(plain) % AES.block_size
-        plain += bytes((padding_length,)) * padding_length
+        padding_length = BLOCK_SIZE - len(pending)
+        dst.write(encrypt(pending + bytes((padding_length,)) * padding_length))
+
+    def _decrypt_cbc(self, src, dst, key, prefix, key_checked):
+        """ Decrypt a file made of an IV and a single AES-CBC stream
+        :param prefix: Beginning of the IV, already read from the file
+        :param key_checked: The key has already been checked with the header
+        :return: False if the padding shows that the key is wrong
+        :rtype: bool
+        """
+        # Creating a new instance of decrypter given the key and the IV.
+        iv = prefix + src.read(BLOCK_SIZE - len(prefix))
+        if len(iv) != BLOCK_SIZE:
+            raise CorruptedError
+        decrypt = self._backend.cbc_decryptor(key, iv)
 
-        # Finally creating the crypted data
-        return iv + crypto.encrypt(plain)
+        # The last block holds the padding, it is kept until the end
+        pending = b""
+        last_block = b""
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
 
-    def decrypt(self, encrypted_msg, key: str) -> str:
-        """ Decrypt a message
-        :rtype: str
+            pending += chunk
+            usable = len(pending) - len(pending) % BLOCK_SIZE
+            if usable > 0:
+                plain = decrypt(pending[:usable])
+                pending = pending[usable:]
+                dst.write(last_block)
+                dst.write(plain[:-BLOCK_SIZE])
+                last_block = plain[-BLOCK_SIZE:]
+
+        if pending or not last_block:
+            # The size is not a multiple of the block size
+            raise CorruptedError
+
+        last_block = self._unpad(last_block)
+        if last_block is None and key_checked:
+            # The key has been checked, so the data itself is damaged
+            raise CorruptedError
+        elif last_block is None:
+            # Invalid padding, the key is wrong
+            return False
+
+        dst.write(last_block)
+        return True
+
+    def _encrypt_segments(self, src, dst, key, segment_size):
+        """ Encrypt a file as a sequence of AES-GCM segments
         """
-        # Creating a key by hashing the password
-        key = hashlib.sha256(key.encode("utf-8")).digest()
+        def read_segments():
+            # Reading one segment ahead to know which one is the last
+            index = 0
+            segment = src.read(segment_size)
+            while True:
+                next_segment = src.read(segment_size)
+                yield key, index, segment, not next_segment
+                if not next_segment:
+                    break
+                segment = next_segment
+                index += 1
 
-        # Creating a new instance of decrypter given the key and the IV.
-        crypto = AES.new(key, AES.MODE_CBC, encrypted_msg[:16])
+        for record in self._ordered_map(self._encrypt_segment,
+                                        read_segments()):
+            dst.write(record)
+
+    def _decrypt_segments(self, src, dst, key):
+        """ Decrypt a file made of a sequence of AES-GCM segments
+        """
+        def read_segments():
+            index = 0
+            final = False
+            while not final:
+                try:
+                    nonce, flags, length = _SEGMENT_STRUCT.unpack(
+                        src.read(_SEGMENT_STRUCT.size))
+                except struct.error:
+                    # Truncated file
+                    raise CorruptedError
+                final = bool(flags & _FINAL_SEGMENT)
+                data = src.read(length + _TAG_LENGTH)
+                if len(data) != length + _TAG_LENGTH:
+                    raise CorruptedError
+                yield key, index, nonce, final, data
+                index += 1
+
+            if src.read(1):
+                # Data after the last segment
+                raise CorruptedError
+
+        for segment in self._ordered_map(self._decrypt_segment,
+                                         read_segments()):
+            dst.write(segment)
 
+    def _encrypt_segment(self, key, index, segment, final):
+        """ Encrypt and authenticate one segment
+        Its index and whether it is the last one are authenticated as well,
+        so segments can't be reordered, removed or added.
+        :rtype: bytes
+        """
+        nonce = os.urandom(_NONCE_LENGTH)
+        flags = _FINAL_SEGMENT if final else 0
+        encrypted = self._backend.gcm_encrypt(key, nonce, segment,
+                                              _AAD_STRUCT.pack(index, flags))
+        # The length does not include the tag
+        return _SEGMENT_STRUCT.pack(nonce, flags,
+                                    len(encrypted) - _TAG_LENGTH) + encrypted
+
+    def _decrypt_segment(self, key, index, nonce, final, data):
+        """ Decrypt one segment and check its authenticity
+        :rtype: bytes
+        :raise CorruptedError: If the segment has been modified
+        """
+        flags = _FINAL_SEGMENT if final else 0
         try:
-            plain = crypto.decrypt(encrypted_msg[16:])
+            return self._backend.gcm_decrypt(key, nonce, data,
+                                             _AAD_STRUCT.pack(index, flags))
         except ValueError:
             raise CorruptedError
 
+    def _ordered_map(self, func, arguments):
+        """ Applies a function on the workers and yields the results in
+        order, with a bounded number of pending tasks to limit the memory.
+        :param arguments: Iterable of the tuples of arguments
+        """
+        if self.workers <= 1:
+            for args in arguments:
+                yield func(*args)
+            return
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            pending = deque()
+            for args in arguments:
+                pending.append(executor.submit(func, *args))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _derive_key(self, key, kdf):
+        """ Creates the AES key from the password
+        :param key: Password, or a DerivedKey
+        :type kdf: KeyDerivation
+        :rtype: bytes
+        :raise ValueError: If the DerivedKey comes from another function
+        """
+        if isinstance(key, DerivedKey):
+            if key.kdf != kdf:
+                raise ValueError("Key derived with other parameters")
+            return key.key
+
+        cached_key, cached_kdf, derived_key = self._key_cache
+        if cached_key != key or cached_kdf != kdf:
+            derived_key = kdf.derive(key)
+            self._key_cache = (key, kdf, derived_key)
+
+        return derived_key
+
+    @staticmethod
+    def _read_kdf(header):
+        """ Gets the key derivation function used for a message
+        :param header: Header of the message, None for the legacy format
+        :rtype: KeyDerivation
+        :raise CorruptedError: If the parameters are invalid
+        """
+        if header is None or "kdf" not in header:
+            return Sha256()
+
+        try:
+            return KeyDerivation.from_header(header["kdf"])
+        except ValueError:
+            raise CorruptedError
+
+    @staticmethod
+    def _key_check_value(key):
+        """ Computes a value identifying the key without revealing it
+        :param key: Derived key
+        :rtype: bytes
+        """
+        return hmac.new(key, b"mdp key check",
+                        hashlib.sha256).digest()[:_KEY_CHECK_LENGTH]
+
+    def _check_key(self, header, key):
+        """ Compares the key with the check value of a header
+        :param key: Derived key
+        :rtype: bool
+        """
+        try:
+            expected = bytes.fromhex(header["check"])
+        except (KeyError, TypeError, ValueError):
+            raise CorruptedError
+
+        return hmac.compare_digest(expected, self._key_check_value(key))
+
+    @staticmethod
+    def _write_header(header):
+        """ Builds the signature and header placed before the encrypted data
+        :param header: Dictionary of the header fields
+        :rtype: bytes
+        """
+        header = json.dumps(header, sort_keys=True).encode("utf-8")
+        return MAGIC + _HEADER_STRUCT.pack(FORMAT_VERSION, len(header)) + header
+
+    @staticmethod
+    def _read_header(src):
+        """ Reads the header at the beginning of an encrypted file
+        :param src: Binary file object, positioned at the beginning
+        :return: The header fields, None for files in the legacy format, and
+        the bytes read which are part of the encrypted data.
+        :rtype: tuple
+        :raise CorruptedError: If the header can't be read
+        """
+        signature = src.read(len(MAGIC))
+        if signature != MAGIC:
+            return None, signature
+
+        try:
+            version, length = _HEADER_STRUCT.unpack(
+                src.read(_HEADER_STRUCT.size))
+            header = json.loads(src.read(length).decode("utf-8"))
+        except (struct.error, ValueError):
+            raise CorruptedError
+
+        if version > FORMAT_VERSION or not isinstance(header, dict):
+            raise CorruptedError
+
+        return header, b""
+
+    @staticmethod
+    def _unpad(plain):
+        """ Removes the padding at the end of a deciphered message
+        :return: The message without padding, or None if it is invalid
+        :rtype: bytes
+        """
+        if len(plain) == 0:
+            return None
+
         padding_length = int((plain[-1]))
-        if padding_length > AES.block_size and padding_length != 32:
+        if padding_length > BLOCK_SIZE and padding_length != 32:
             # 32 is the space character and is kept for backwards compatibility
-            wrong_password = True
+            return None
         elif padding_length == 32:
-            plain = plain.strip()
-            wrong_password = False
-        elif plain[-padding_length:] != bytes((padding_length,)) * padding_length:
+            return plain.rstrip()
+        elif padding_length == 0 or \
+                plain[-padding_length:] != bytes((padding_length,)) * padding_length:
             # Invalid padding!
-            wrong_password = True
-        else:
-            plain = plain[:-padding_length]
-            wrong_password = False
-
-        # Getting back to UTF-8
-        if not wrong_password:
-            return plain.decode("utf-8")
-        else:
             return None
-
+        else:
+            return plain[:-padding_length]
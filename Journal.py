@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+#     mdp - Journal of the changes made to a password file
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from CryptoBackend import get_backend
+from Cryptography import CorruptedError
+import JsonCodec
+
+
+# Added to the path of the password file
+JOURNAL_SUFFIX = ".journal"
+MAGIC = b"\x89MDJ"
+FORMAT_VERSION = 1
+SNAPSHOT_ID_LENGTH = 16
+# Signature, version and identifier of the snapshot the journal applies to
+_HEADER_STRUCT = struct.Struct(">4sB{0}s".format(SNAPSHOT_ID_LENGTH))
+# Length of the encrypted operation, with its nonce and tag
+_RECORD_STRUCT = struct.Struct(">I")
+# Each operation is authenticated with the snapshot and its position
+_AAD_STRUCT = struct.Struct(">{0}sQ".format(SNAPSHOT_ID_LENGTH))
+_NONCE_LENGTH = 12
+_TAG_LENGTH = 16
+# The journal is merged into a new snapshot beyond these limits
+MAX_RECORDS = 1000
+MAX_SIZE = 1024 * 1024
+
+
+def journal_path(file_path):
+    """ Returns the path of the journal of a password file
+    :rtype: str
+    """
+    return file_path + JOURNAL_SUFFIX
+
+
+def new_snapshot_id():
+    """ Returns a random identifier for a new snapshot
+    :rtype: bytes
+    """
+    return os.urandom(SNAPSHOT_ID_LENGTH)
+
+
+class Journal:
+    """ Append-only log of the changes made to a keychain since it has been
+        fully saved, the snapshot. Saving a change then only costs writing
+        it, the journal being replayed when the snapshot is loaded.
+
+        The journal is made of a header holding the identifier of its
+        snapshot, followed by a record for each operation: its length, then
+        the operation encrypted and authenticated with AES-GCM.
+        A journal written for another snapshot is ignored: the snapshot has
+        been saved again since, with its changes. An incomplete last record,
+        left by an interrupted write, is ignored and overwritten.
+    """
+
+    def __init__(self, path, snapshot_id, key, backend=None):
+        """
+        :param path: Path of the journal file
+        :param snapshot_id: Identifier of the snapshot
+        :type snapshot_id: bytes
+        :param key: AES key of the journal
+        :type key: bytes
+        :param backend: Library providing AES, the fastest one by default
+        :type backend: Backend
+        """
+        self.path = path
+        self.snapshot_id = snapshot_id
+        self._key = key
+        self._backend = backend if backend is not None else get_backend()
+        # Number of operations and size of the valid part of the file
+        self.records = 0
+        self.size = 0
+
+    def read(self):
+        """ Reads the operations of the journal
+        :return: A list of (operation, domain, login, password) tuples
+        :rtype: list
+        :raise CorruptedError: If a record has been modified
+        """
+        self.records = 0
+        self.size = 0
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return []
+
+        if len(data) < _HEADER_STRUCT.size:
+            return []
+        magic, version, snapshot_id = _HEADER_STRUCT.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION or \
+                snapshot_id != self.snapshot_id:
+            return []
+
+        operations = []
+        pos = _HEADER_STRUCT.size
+        while pos + _RECORD_STRUCT.size <= len(data):
+            length, = _RECORD_STRUCT.unpack_from(data, pos)
+            start = pos + _RECORD_STRUCT.size
+            if length < _NONCE_LENGTH + _TAG_LENGTH or \
+                    start + length > len(data):
+                break
+            operations.append(self._decrypt(data[start:start + length],
+                                            len(operations)))
+            pos = start + length
+
+        self.records = len(operations)
+        self.size = pos
+        return operations
+
+    def append(self, operations):
+        """ Appends operations at the end of the journal, creating it if
+        needed. The file is locked meanwhile, and the records appended by
+        other processes since it was last read are kept and counted.
+        :param operations: List of (operation, domain, login, password)
+        tuples
+        :return: False if the journal file belongs to another snapshot, the
+        operations are not written then
+        :rtype: bool
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "r+b") as file:
+            if fcntl is not None:
+                # Released when the file is closed
+                fcntl.lockf(fd, fcntl.LOCK_EX)
+            header = file.read(_HEADER_STRUCT.size)
+            if len(header) < _HEADER_STRUCT.size:
+                # New journal
+                file.seek(0)
+                file.truncate()
+                file.write(_HEADER_STRUCT.pack(MAGIC, FORMAT_VERSION,
+                                               self.snapshot_id))
+                self.records = 0
+                self.size = _HEADER_STRUCT.size
+            elif header != _HEADER_STRUCT.pack(MAGIC, FORMAT_VERSION,
+                                               self.snapshot_id):
+                return False
+            else:
+                self._find_end(file)
+
+            # Overwriting an incomplete record
+            file.seek(self.size)
+            file.truncate()
+            records = []
+            for operation in operations:
+                encrypted = self._encrypt(operation,
+                                          self.records + len(records) // 2)
+                records += (_RECORD_STRUCT.pack(len(encrypted)), encrypted)
+            data = b"".join(records)
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+            # Only counted once written, the next ones overwrite them if
+            # writing fails
+            self.records += len(records) // 2
+            self.size += len(data)
+
+        return True
+
+    def _find_end(self, file):
+        """ Counts the records appended after the known ones, by this
+        process or another one, up to the end of the last complete one
+        :param file: Journal file, whose header is valid
+        """
+        file_size = os.fstat(file.fileno()).st_size
+        if self.size == 0 or self.size > file_size:
+            # Never read, or rewritten since
+            self.records = 0
+            self.size = _HEADER_STRUCT.size
+        file.seek(self.size)
+        tail = file.read()
+        pos = 0
+        while pos + _RECORD_STRUCT.size <= len(tail):
+            length, = _RECORD_STRUCT.unpack_from(tail, pos)
+            end = pos + _RECORD_STRUCT.size + length
+            if length < _NONCE_LENGTH + _TAG_LENGTH or end > len(tail):
+                break
+            self.records += 1
+            pos = end
+        self.size += pos
+
+    def needs_compaction(self, pending=0):
+        """ Tells if the journal is too long, and should be merged into a new
+        snapshot
+        :param pending: Number of operations about to be appended
+        :rtype: bool
+        """
+        return self.records + pending >= MAX_RECORDS or \
+            self.size >= MAX_SIZE
+
+    def remove(self):
+        """ Deletes the journal file
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.records = 0
+        self.size = 0
+
+    def _encrypt(self, operation, number):
+        nonce = os.urandom(_NONCE_LENGTH)
+        data = JsonCodec.dumps(list(operation)).encode("utf-8")
+        return nonce + self._backend.gcm_encrypt(
+            self._key, nonce, data,
+            _AAD_STRUCT.pack(self.snapshot_id, number))
+
+    def _decrypt(self, record, number):
+        try:
+            data = self._backend.gcm_decrypt(
+                self._key, record[:_NONCE_LENGTH], record[_NONCE_LENGTH:],
+                _AAD_STRUCT.pack(self.snapshot_id, number))
+            operation = JsonCodec.loads(data.decode("utf-8"))
+            name, domain, login, password = operation
+            return name, domain, login, password
+        except (ValueError, TypeError):
+            raise CorruptedError
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+#     mdp - Json encoding and decoding module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Json codec of the keychains, using orjson or ujson when one of them is
+installed, the json module of the standard library otherwise.
+All of them raise a ValueError on invalid documents.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+# Characters read at once by iter_array()
+CHUNK_SIZE = 64 * 1024
+_WHITESPACE = " \t\n\r"
+_SEPARATORS = ",]" + _WHITESPACE
+
+
+def library():
+    """ Returns the name and the version of the library used
+    :rtype: tuple
+    """
+    if orjson is not None:
+        return "orjson", orjson.__version__
+    elif ujson is not None:
+        return "ujson", ujson.__version__
+    else:
+        return "json", json.__version__
+
+
+def loads(text):
+    """ Decodes a Json document
+    :param text: Json string or UTF-8 bytes
+    :raise ValueError: If the document is invalid
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    elif ujson is not None:
+        return ujson.loads(text)
+    else:
+        return json.loads(text)
+
+
+def dumps(obj, indent=None):
+    """ Encodes an object made of lists, dictionaries, strings and numbers
+    :param indent: Number of spaces of the indentation, or None to get a
+    string without spaces nor new lines
+    :rtype: str
+    """
+    if indent is None:
+        # The fast libraries don't support any indentation
+        if orjson is not None:
+            return orjson.dumps(obj).decode("utf-8")
+        elif ujson is not None:
+            return ujson.dumps(obj, ensure_ascii=False,
+                               escape_forward_slashes=False)
+        else:
+            return json.dumps(obj, ensure_ascii=False,
+                              separators=(",", ":"))
+
+    return json.dumps(obj, ensure_ascii=False, indent=indent)
+
+
+class _ArrayReader:
+    """ Reads a Json array from a text file, chunk by chunk
+    """
+
+    def __init__(self, file, chunk_size):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _read(self):
+        """ Appends a chunk to the buffer, dropping the characters parsed
+        :return: False at the end of the file
+        :rtype: bool
+        """
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def next_char(self):
+        """ Returns the next character which is not a whitespace, or an
+        empty string at the end of the file
+        """
+        while True:
+            while self._pos < len(self._buffer) and \
+                    self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                self._pos += 1
+                return self._buffer[self._pos - 1]
+            if not self._read():
+                return ""
+
+    def decode(self):
+        """ Decodes the next value, reading more chunks until it is complete
+        """
+        if self.next_char():
+            self.back()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # A number may go on in the next chunk, a complete value is
+                # followed by a separator
+                if self._eof or (end < len(self._buffer) and
+                                 self._buffer[end] in _SEPARATORS):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._read()
+
+    def back(self):
+        """ Goes back to the character returned by next_char()
+        """
+        self._pos -= 1
+
+
+def iter_array(file, chunk_size=CHUNK_SIZE):
+    """ Decodes a Json array progressively, yielding each element as soon as
+    it is read, so that the whole document is never in memory.
+    :param file: Text file containing the array
+    :raise ValueError: If the document is not a valid Json array
+    """
+    reader = _ArrayReader(file, chunk_size)
+    if reader.next_char() != "[":
+        raise ValueError("Expecting a Json array")
+
+    c = reader.next_char()
+    if c == "":
+        raise ValueError("Unexpected end of the Json array")
+    elif c != "]":
+        reader.back()
+        while True:
+            yield reader.decode()
+            c = reader.next_char()
+            if c == "]":
+                break
+            elif c != ",":
+                raise ValueError("Expecting ',' or ']' in the Json array")
+
+    if reader.next_char() != "":
+        raise ValueError("Extra data after the Json array")
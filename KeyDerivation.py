@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+#     mdp - Key derivation module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import hashlib
+import math
+import os
+import time
+
+
+KEY_LENGTH = 32
+SALT_LENGTH = 16
+# Unlock latency aimed by the calibration, in seconds
+DEFAULT_TARGET = 0.25
+
+
+class KeyDerivation:
+    """ Base class for the functions turning the master password into a key
+        Each subclass has a name and a cost parameter, stored with the salt
+        in the header of the encrypted files.
+    """
+    name = None
+    # Bounds of the cost parameter explored by calibrate()
+    MIN_COST = 1
+    MAX_COST = 1
+
+    def derive(self, password: str) -> bytes:
+        """ Derives a key from the password
+        :rtype: bytes
+        """
+        raise NotImplementedError(self.name)
+
+    def to_header(self) -> dict:
+        """ Returns the parameters to store in the file header
+        :rtype: dict
+        """
+        return {"name": self.name}
+
+    @staticmethod
+    def from_header(fields):
+        """ Builds a key derivation function from the file header
+        :param fields: Parameters returned by to_header()
+        :rtype: KeyDerivation
+        :raise ValueError: If the parameters are unknown or invalid
+        """
+        try:
+            kdf_class = KEY_DERIVATIONS[fields["name"]]
+            return kdf_class._from_header(fields)
+        except (KeyError, TypeError, AttributeError):
+            raise ValueError("Invalid key derivation parameters")
+
+    @classmethod
+    def _from_header(cls, fields):
+        return cls()
+
+    @classmethod
+    def from_cost(cls, cost):
+        """ Builds an instance with a new salt and the given cost
+        """
+        return cls()
+
+    @classmethod
+    def calibrate(cls, target=DEFAULT_TARGET):
+        """ Finds the cost for which a derivation takes about the given time
+        on this machine.
+        :param target: Time aimed for a derivation, in seconds
+        :return: An instance with a new salt and the calibrated cost
+        :rtype: KeyDerivation
+        """
+        # Increasing the cost until the measure is significant enough,
+        # then extrapolating, as the time is proportional to the cost.
+        cost = cls.MIN_COST
+        elapsed = cls._measure(cost)
+        while elapsed < target / 8 and cost < cls.MAX_COST:
+            cost *= 2
+            elapsed = cls._measure(cost)
+
+        ideal_cost = cost * target / max(elapsed, 1e-6)
+        cost = cls._round_cost(ideal_cost)
+        return cls.from_cost(min(max(cost, cls.MIN_COST), cls.MAX_COST))
+
+    @classmethod
+    def _measure(cls, cost):
+        kdf = cls.from_cost(cost)
+        start = time.perf_counter()
+        kdf.derive("calibration")
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _round_cost(cost):
+        return int(cost)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            self.to_header() == other.to_header()
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__, self.to_header())
+
+    def __str__(self):
+        params = ["{0}={1}".format(k, v) for k, v in self.to_header().items()
+                  if k not in ("name", "salt")]
+        return "{0} ({1})".format(self.name, ", ".join(params)) \
+            if params else self.name
+
+
+class Sha256(KeyDerivation):
+    """ Single unsalted SHA-256 hash, used by the files prior to the
+        key derivation parameters in the header.
+    """
+    name = "sha256"
+
+    def derive(self, password):
+        return hashlib.sha256(password.encode("utf-8")).digest()
+
+
+class Pbkdf2(KeyDerivation):
+    """ PBKDF2 with HMAC-SHA256
+    """
+    name = "pbkdf2"
+    MIN_COST = 1000
+    MAX_COST = 100000000
+
+    def __init__(self, iterations=600000, salt=None):
+        self.iterations = iterations
+        self.salt = salt if salt is not None else os.urandom(SALT_LENGTH)
+
+    def derive(self, password):
+        return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"),
+                                   self.salt, self.iterations, KEY_LENGTH)
+
+    def to_header(self):
+        return {"name": self.name,
+                "iterations": self.iterations,
+                "salt": self.salt.hex()}
+
+    @classmethod
+    def _from_header(cls, fields):
+        iterations = int(fields["iterations"])
+        if iterations < 1:
+            raise ValueError("Invalid number of iterations")
+        return cls(iterations, bytes.fromhex(fields["salt"]))
+
+    @classmethod
+    def from_cost(cls, cost):
+        return cls(iterations=cost)
+
+
+class Scrypt(KeyDerivation):
+    """ scrypt, a memory-hard key derivation function
+        The cost is the parameter n, which must be a power of 2.
+    """
+    name = "scrypt"
+    # Memory a calibrated derivation may use, 128 * r * n bytes
+    MAX_MEMORY = 128 * 1024 * 1024
+    MIN_COST = 2 ** 10
+    MAX_COST = MAX_MEMORY // (128 * 8)
+
+    def __init__(self, n=2 ** 14, r=8, p=1, salt=None):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.salt = salt if salt is not None else os.urandom(SALT_LENGTH)
+
+    def derive(self, password):
+        # Leaving some room above the memory actually needed (128 * r * n)
+        maxmem = 129 * self.r * (self.n + self.p + 2) + 1024 * 1024
+        return hashlib.scrypt(password.encode("utf-8"), salt=self.salt,
+                              n=self.n, r=self.r, p=self.p, maxmem=maxmem,
+                              dklen=KEY_LENGTH)
+
+    def to_header(self):
+        return {"name": self.name,
+                "n": self.n,
+                "r": self.r,
+                "p": self.p,
+                "salt": self.salt.hex()}
+
+    @classmethod
+    def _from_header(cls, fields):
+        n, r, p = int(fields["n"]), int(fields["r"]), int(fields["p"])
+        if n < 2 or n & (n - 1) != 0 or r < 1 or p < 1:
+            raise ValueError("Invalid scrypt parameters")
+        return cls(n, r, p, bytes.fromhex(fields["salt"]))
+
+    @classmethod
+    def from_cost(cls, cost):
+        return cls(n=cost)
+
+    @staticmethod
+    def _round_cost(cost):
+        # Nearest power of 2
+        return 2 ** max(round(math.log2(max(cost, 2))), 1)
+
+
+KEY_DERIVATIONS = {kdf.name: kdf for kdf in (Sha256, Pbkdf2, Scrypt)}
+
+
+def default_key_derivation():
+    """ Returns the key derivation function used for the new files
+    :rtype: KeyDerivation
+    """
+    if hasattr(hashlib, "scrypt"):
+        return Scrypt()
+    else:
+        # scrypt is missing when Python is linked to an old OpenSSL
+        return Pbkdf2()
@@ -17,32 +17,164 @@
 #     with this program; if not, write to the Free Software Foundation, Inc.,
 #     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
-import json
+import bisect
+from collections import OrderedDict
+from contextlib import contextmanager
+import gc
+import heapq
+from operator import attrgetter
+import re
+import sys
+
+import BinaryCodec
+import JsonCodec
+
+
+# Number of results of filter() kept in cache
+FILTER_CACHE_SIZE = 16
+
+# Scores of the fuzzy search, see fuzzy_score()
+SCORE_MATCH = 16
+BONUS_LABEL_START = 10
+BONUS_BOUNDARY = 8
+BONUS_CAMEL_CASE = 7
+BONUS_CONSECUTIVE = 4
+PENALTY_GAP_START = 3
+PENALTY_GAP_EXTENSION = 1
+SEPARATORS = " -_@/:+"
+
+
+def fuzzy_score(pattern, text):
+    """ Scores how well the characters of a pattern appear, in order, in a
+    text, like fzf does. Matches at the start of the text or of a domain
+    label, after a separator, on a camel case hump, or consecutive ones are
+    favored, gaps between them are penalized.
+    :param pattern: Casefolded pattern
+    :param text: Text to search the pattern in
+    :return: The score, or None if the text does not contain the pattern
+    characters in order
+    :rtype: int
+    """
+    folded = text.casefold()
+    if len(folded) != len(text):
+        # Some characters are folded in several ones, the case of the
+        # original text can't be used.
+        text = folded
+
+    # Finding the end of the first occurrence...
+    end = -1
+    for c in pattern:
+        end = folded.find(c, end + 1)
+        if end < 0:
+            return None
+
+    # ...then going back from it to find the shortest one
+    positions = []
+    pos = end + 1
+    for c in reversed(pattern):
+        pos = folded.rfind(c, 0, pos)
+        positions.append(pos)
+    positions.reverse()
+
+    score = 0
+    previous = None
+    for pos in positions:
+        score += SCORE_MATCH
+        if pos == 0 or text[pos - 1] == ".":
+            score += BONUS_LABEL_START
+        elif text[pos - 1] in SEPARATORS:
+            score += BONUS_BOUNDARY
+        elif text[pos - 1].islower() and text[pos].isupper():
+            score += BONUS_CAMEL_CASE
+
+        if previous is not None:
+            if pos == previous + 1:
+                score += BONUS_CONSECUTIVE
+            else:
+                gap = pos - previous - 1
+                score -= PENALTY_GAP_START + \
+                    (gap - 1) * PENALTY_GAP_EXTENSION
+        previous = pos
+
+    return score
 
 
 class Password:
     """ Represents a password for a couple login/domain
+        With a cipher, the password is kept encrypted and only decrypted when
+        it is read.
+        As a keychain may hold a lot of them, the attributes are stored in
+        slots rather than in a dictionary, and the domains and logins are
+        interned: the logins of a domain, and the accounts sharing a login,
+        refer to a single string.
+        The passwords are ordered by their casefolded domain and login,
+        computed once in sort_key.
     """
-    def __init__(self, domain="", login="", password=""):
-        self.domain = domain
-        self.login = login
+    __slots__ = ("domain", "login", "sort_key", "_cipher", "_password")
+
+    def __init__(self, domain="", login="", password="", cipher=None):
+        self.domain = sys.intern(domain)
+        self.login = sys.intern(login)
+        # Most of the domains and logins are already in lower case, interning
+        # the casefolded strings avoids storing them twice.
+        self.sort_key = (sys.intern(domain.casefold()),
+                         sys.intern(login.casefold()))
+        self._cipher = cipher
         self.password = password
 
-    def __lt__(self, other):
-        """ Compares by domain and login
+    @classmethod
+    def from_sealed(cls, domain, login, sealed, cipher):
+        """ Creates a password from its encrypted value
+        :param sealed: Password encrypted by the cipher
+        :type cipher: EntryCipher
+        :rtype: Password
         """
-        if self.domain == other.domain:
-            return self.login.lower() < other.login.lower()
+        p = cls(domain, login)
+        p._cipher = cipher
+        p._password = sealed
+        return p
+
+    @property
+    def password(self):
+        if self._cipher is None:
+            return self._password
+        return self._cipher.decrypt(self._password)
+
+    @password.setter
+    def password(self, value):
+        if self._cipher is None:
+            self._password = value
         else:
-            return self.domain.lower() < other.domain.lower()
+            self._password = self._cipher.encrypt(value)
+
+    def seal(self, cipher):
+        """ Encrypts the password with another cipher, or decrypts it if
+        cipher is None
+        """
+        if cipher != self._cipher:
+            password = self.password
+            self._cipher = cipher
+            self.password = password
+
+    def to_dict(self):
+        """ Returns the fields stored in the Json file, the password being
+        encrypted if it is sealed. The keys are in alphabetical order, like
+        in the files written before.
+        :rtype: dict
+        """
+        return {"domain": self.domain,
+                "login": self.login,
+                "password": self._password}
+
+    def __lt__(self, other):
+        """ Compares by domain and login, without case
+        """
+        return self.sort_key < other.sort_key
 
     def __gt__(self, other):
-        """ Compares by domain and login
+        """ Compares by domain and login, without case
         """
-        if self.domain == other.domain:
-            return self.login.lower() > other.login.lower()
-        else:
-            return self.domain.lower() > other.domain.lower()
+        return self.sort_key > other.sort_key
 
     def __repr__(self):
         return "{0} {1}".format(self.domain, self.login)
@@ -51,26 +183,249 @@ class Password:
         return "{0}\t{1}".format(self.domain, self.login)
 
 
+class TrigramIndex:
+    """ Index of the passwords by the trigrams (substrings of 3 characters)
+        of their casefolded domain and login.
+        A password containing a pattern contains all of its trigrams, so the
+        intersection of their posting lists gives the candidates for a
+        substring search without scanning the whole keychain.
+    """
+
+    def __init__(self):
+        # Passwords containing each trigram. Dictionaries are used as ordered
+        # sets, to keep the insertion order of the keychain.
+        self._postings = {}
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _password_trigrams(self, password_obj):
+        return self._trigrams(password_obj.domain.casefold()) | \
+            self._trigrams(password_obj.login.casefold())
+
+    def add(self, password_obj):
+        for trigram in self._password_trigrams(password_obj):
+            self._postings.setdefault(trigram, {})[password_obj] = None
+
+    def remove(self, password_obj):
+        for trigram in self._password_trigrams(password_obj):
+            posting = self._postings.get(trigram)
+            if posting is not None:
+                posting.pop(password_obj, None)
+                if not posting:
+                    del self._postings[trigram]
+
+    def candidates(self, pattern):
+        """ Returns the passwords which may contain the pattern, with or
+        without case, in insertion order.
+        :return: A list of passwords, or None if the pattern is too short to
+        use the index.
+        :rtype: list
+        """
+        trigrams = self._trigrams(pattern.casefold())
+        if not trigrams:
+            return None
+
+        postings = sorted((self._postings.get(t, {}) for t in trigrams),
+                          key=len)
+        smallest, others = postings[0], postings[1:]
+        return [p for p in smallest if all(p in o for o in others)]
+
+
+class ChangeSet:
+    """ Passwords added, updated and deleted in a keychain, so that a storage
+        can only write the differences.
+    """
+
+    def __init__(self, added=None, updated=None, deleted=None):
+        """
+        :param added: List of the new passwords
+        :param updated: List of the passwords whose password has changed
+        :param deleted: List of the passwords removed
+        """
+        self.added = added if added is not None else []
+        self.updated = updated if updated is not None else []
+        self.deleted = deleted if deleted is not None else []
+
+    def __bool__(self):
+        return bool(self.added or self.updated or self.deleted)
+
+    def __repr__(self):
+        return "ChangeSet(added={0}, updated={1}, deleted={2})".format(
+            self.added, self.updated, self.deleted)
+
+
 class Keychain:
     """ Contains a list of passwords and provide methods to manipulate them
+        The passwords are stored in insertion order, and indexed
+        by domain and login, so that finding, adding and deleting one of them
+        takes a constant time. They are also kept sorted by domain and login,
+        so that filter() returns ordered results without sorting them. Their
+        domain and login must therefore not be modified outside of the
+        keychain.
     """
 
-    def __init__(self, json_string=None):
+    def __init__(self, json_string=None, cipher=None, substring_index=False):
+        """
+        :param json_string: Keychain exported by to_json()
+        :param cipher: Cipher of the passwords, if each of them is encrypted
+        :type cipher: EntryCipher
+        :param substring_index: Maintains a trigram index to speed up
+        filter(), at the cost of some memory
+        """
+        self.cipher = cipher
+        # Passwords, in insertion order. A dictionary is used as an ordered
+        # set, the passwords being hashed by identity.
+        self._entries = {}
+        # Passwords sorted by their sort_key, and the keys themselves, to
+        # find the position of a password by bisection
+        self._sorted = []
+        self._sort_keys = []
+        # Passwords by (domain, login)
+        self._index = {}
+        self._trigram_index = None
+        # Recent results of filter(), by (pattern, ignore_case), the most
+        # recently used last
+        self._filter_cache = OrderedDict()
+        # Last pattern given to search() and the entries containing it
+        self._search_cache = (None, None)
+        # Operations made by set() and delete() since the keychain was
+        # saved: "add", "update" or "delete", with the password modified and
+        # the previous value of an updated one
+        self._operations = []
         if json_string is not None:
             self._from_json(json_string)
-        else:
-            self._passwords = []
+        if substring_index:
+            self.enable_substring_index()
+
+    @property
+    def _passwords(self):
+        """ List of the passwords, in insertion order
+        """
+        return list(self._entries)
+
+    @classmethod
+    def from_file(cls, file, cipher=None, substring_index=False):
+        """ Loads a keychain from a text file containing the Json export,
+        building the passwords while the file is decoded, without loading
+        the whole document in memory.
+        :param file: Text file, or file-like object
+        :param cipher: Cipher of the passwords, see __init__()
+        :param substring_index: See __init__()
+        :rtype: Keychain
+        :raise ValueError: If the file is not a valid Json export
+        """
+        keychain = cls(cipher=cipher)
+        keychain._load(cls._json_records(JsonCodec.iter_array(file)))
+        if substring_index:
+            keychain.enable_substring_index()
+        return keychain
+
+    @classmethod
+    def from_binary(cls, data, cipher=None, substring_index=False):
+        """ Loads a keychain exported by to_binary()
+        :param data: Bytes, or bytes-like object
+        :param cipher: Cipher of the passwords, see __init__()
+        :param substring_index: See __init__()
+        :rtype: Keychain
+        :raise ValueError: If the data is not a valid binary export
+        """
+        keychain = cls(cipher=cipher)
+        keychain._load(BinaryCodec.iter_records(data))
+        if substring_index:
+            keychain.enable_substring_index()
+        return keychain
 
     def _from_json(self, json_string: str):
         """ Loads a keychain from a Json string.
         """
-        json_passwords = json.loads(json_string)
+        self._load(self._json_records(JsonCodec.loads(json_string)))
+
+    @staticmethod
+    def _json_records(json_passwords):
+        return ((p["domain"], p["login"], p["password"])
+                for p in json_passwords)
+
+    def _load(self, records):
+        """ Adds the passwords decoded from an export
+        :param records: Iterable of (domain, login, password) tuples, the
+        passwords being encrypted by the cipher of the keychain if it has one
+        """
+        # Filling the indexes in bulk rather than through _add(), the caches
+        # being empty
+        entries = self._entries
+        index = self._index
+        cipher = self.cipher
+        # The garbage collector would scan the new objects over and over,
+        # while none of them can be garbage.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if cipher is not None:
+                # The passwords are decrypted only when they are needed
+                from_sealed = Password.from_sealed
+                for domain, login, password in records:
+                    password_obj = from_sealed(domain, login, password,
+                                               cipher)
+                    entries[password_obj] = None
+                    index.setdefault((password_obj.domain,
+                                      password_obj.login), password_obj)
+            else:
+                for domain, login, password in records:
+                    password_obj = Password(domain, login, password)
+                    entries[password_obj] = None
+                    index.setdefault((password_obj.domain,
+                                      password_obj.login), password_obj)
 
-        # TODO: Add an automatic Json parser
-        self._passwords = []
-        for p in json_passwords:
-            self._passwords.append(Password(p["domain"], p["login"],
-                                            p["password"]))
+            # Sorting them all at once rather than inserting them one by one
+            self._sorted = sorted(entries, key=attrgetter("sort_key"))
+            self._sort_keys = [p.sort_key for p in self._sorted]
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def enable_substring_index(self):
+        """ Builds a trigram index of the domains and logins, maintained by
+        set() and delete(), to speed up filter() on large keychains.
+        """
+        if self._trigram_index is None:
+            self._trigram_index = TrigramIndex()
+            for p in self._entries:
+                self._trigram_index.add(p)
+
+    def _add(self, password_obj):
+        """ Adds a password to the keychain and its indexes
+        """
+        self._entries[password_obj] = None
+        # After the equal ones, like a stable sort would
+        i = bisect.bisect_right(self._sort_keys, password_obj.sort_key)
+        self._sorted.insert(i, password_obj)
+        self._sort_keys.insert(i, password_obj.sort_key)
+        if self._trigram_index is not None:
+            self._trigram_index.add(password_obj)
+        self._modified()
+        # Files edited by hand may contain duplicates, only the first one is
+        # indexed, as set() only ever modified the first one.
+        self._index.setdefault((password_obj.domain, password_obj.login),
+                               password_obj)
+
+    def get(self, domain, login):
+        """ Returns the password of a domain and login
+        :return: The Password object, or None if it does not exist
+        :rtype: Password
+        """
+        return self._index.get((domain, login))
+
+    def seal(self, cipher):
+        """ Encrypts each password with the cipher, or decrypts them all if
+        cipher is None.
+        :type cipher: EntryCipher
+        """
+        if cipher != self.cipher:
+            for p in self._entries:
+                p.seal(cipher)
+            self.cipher = cipher
 
     def to_json(self, reduced=True):
         """ Converts the password list in a Json string.
@@ -78,51 +433,214 @@ class Keychain:
         (no spaces nor new lines) or prettily formatted
         :return: A Json string containing all the information
         """
-        json_passwords = json.dumps(obj=self._passwords,
-                                    default=lambda o: o.__dict__,
-                                    sort_keys=True,
-                                    indent=4 if not reduced else None)
+        json_passwords = [p.to_dict() for p in self._entries]
+
+        return JsonCodec.dumps(json_passwords,
+                               indent=4 if not reduced else None)
 
-        return json_passwords
+    def to_binary(self):
+        """ Converts the password list in the binary format, more compact
+        and faster to load than Json, see the BinaryCodec module.
+        :rtype: bytes
+        """
+        return BinaryCodec.encode(map(attrgetter("domain", "login",
+                                                 "_password"),
+                                      self._entries))
 
     def filter(self, pattern="", ignore_case=False):
         """ Returns a list of passwords filtered by their domain and login.
         :param pattern: Filter by domain or login.
         :param ignore_case: The search is not case sensitive.
-        :return: A list of passwords matching the filters.
+        :return: A list of passwords matching the filters, sorted by domain
+        and login.
         """
+        key = (pattern.lower() if ignore_case else pattern, ignore_case)
+        if key in self._filter_cache:
+            # For instance when the user deletes the last character typed
+            self._filter_cache.move_to_end(key)
+            return list(self._filter_cache[key])
+
+        candidates = self._cached_candidates(*key)
+        if candidates is None and self._trigram_index is not None:
+            candidates = self._trigram_index.candidates(pattern)
+            if candidates is not None:
+                # The index keeps the insertion order
+                candidates.sort(key=attrgetter("sort_key"))
+        if candidates is None:
+            candidates = self._sorted
+
         if ignore_case:
             pattern = pattern.lower()
-            filtered = [p for p in self._passwords
+            filtered = [p for p in candidates
                         if pattern in p.domain.lower()
                         or pattern in p.login.lower()]
         else:
-            filtered = [p for p in self._passwords
+            filtered = [p for p in candidates
                         if pattern in p.domain or pattern in p.login]
 
-        return filtered
+        self._filter_cache[key] = filtered
+        if len(self._filter_cache) > FILTER_CACHE_SIZE:
+            self._filter_cache.popitem(last=False)
+
+        return list(filtered)
+
+    def search(self, pattern, limit=None):
+        """ Returns the passwords whose domain or login contains the
+        characters of the pattern in order, without case, best matches first.
+        :param pattern: Characters to search
+        :param limit: Maximum number of results, all of them by default
+        :return: A list of passwords, sorted by decreasing score, then by
+        domain and login
+        :rtype: list
+        """
+        pattern = pattern.casefold()
+        if not pattern:
+            return self.filter()[:limit]
+
+        # Discarding most of the entries with a regular expression, which is
+        # much faster than scoring them one by one. It searches the
+        # casefolded sort keys, like fuzzy_score(), as "ss" matches "ß".
+        subsequence = re.compile(".*?".join(re.escape(c) for c in pattern),
+                                 re.DOTALL)
+        search = subsequence.search
+        # The entries matching "gth" are among the ones matching "gt"
+        last_pattern, candidates = self._search_cache
+        if last_pattern is None or not pattern.startswith(last_pattern):
+            candidates = self._sorted
+        candidates = [p for p in candidates
+                      if search(p.sort_key[0]) or search(p.sort_key[1])]
+        self._search_cache = (pattern, candidates)
+
+        def scored():
+            for p in candidates:
+                domain_score = fuzzy_score(pattern, p.domain)
+                login_score = fuzzy_score(pattern, p.login)
+                scores = [score for score in (domain_score, login_score)
+                          if score is not None]
+                if scores:
+                    yield max(scores), p
+
+        if limit is None:
+            results = sorted(scored(), key=lambda r: r[0], reverse=True)
+        else:
+            # Only keeping the best ones in a heap
+            results = heapq.nlargest(limit, scored(), key=lambda r: r[0])
+
+        return [p for score, p in results]
+
+    def _cached_candidates(self, pattern, ignore_case):
+        """ Finds the smallest cached result of a pattern contained in the
+        given one, as its matches are a superset of the new matches.
+        For instance, the results of "gith" are among the ones of "git".
+        :return: A list of passwords, or None if no result is usable
+        :rtype: list
+        """
+        candidates = None
+        for (cached_pattern, cached_ignore_case), cached_result \
+                in self._filter_cache.items():
+            if cached_ignore_case == ignore_case \
+                    and cached_pattern in pattern \
+                    and (candidates is None
+                         or len(cached_result) < len(candidates)):
+                candidates = cached_result
+
+        return candidates
+
+    def _modified(self):
+        """ Invalidates the cached results after an entry has been added or
+        deleted.
+        """
+        self._filter_cache.clear()
+        self._search_cache = (None, None)
 
     def set(self, domain, login, password, replace=False):
         """ Defines a new password or change an existing one
         :param replace: Replace the password if the entry already exists
         :return: True if the password has been stored
         """
-        matching_passwords = [p for p in self._passwords
-                              if p.domain == domain and p.login == login]
-        nb_matching_passwords = len(matching_passwords)
-        already_exists = nb_matching_passwords > 0
+        existing_password = self._index.get((domain, login))
         password_saved = False
 
-        if already_exists:
+        if existing_password is not None:
             if replace:
-                matching_passwords[0].password = password
+                self._update(existing_password, password)
                 password_saved = True
         else:
-            self._passwords.append(Password(domain, login, password))
+            password_obj = Password(domain, login, password, self.cipher)
+            self._add(password_obj)
+            self._operations.append(("add", password_obj, None))
             password_saved = True
 
         return password_saved
 
+    def _update(self, password_obj, password):
+        """ Changes the password of an entry, if it is different
+        """
+        if password_obj.password != password:
+            previous = password_obj._password
+            password_obj.password = password
+            self._operations.append(("update", password_obj, previous))
+
+    def set_many(self, entries, replace=False):
+        """ Defines many passwords at once, faster than calling set() for
+        each of them. The entries are all checked before any of them is
+        stored.
+        :param entries: Iterable of (domain, login, password) strings
+        :param replace: Replace the passwords of the entries already existing
+        :return: The number of passwords stored
+        :rtype: int
+        :raise ValueError: If an entry is not made of three strings, nothing
+        is stored then
+        """
+        entries = list(entries)
+        for entry in entries:
+            if not isinstance(entry, (tuple, list)) or len(entry) != 3 or \
+                    not all(isinstance(field, str) for field in entry):
+                raise ValueError("Invalid entry: {0!r}".format(entry))
+
+        stored = 0
+        new_passwords = []
+        for domain, login, password in entries:
+            existing_password = self._index.get((domain, login))
+            if existing_password is not None:
+                if replace:
+                    self._update(existing_password, password)
+                    stored += 1
+            else:
+                password_obj = Password(domain, login, password, self.cipher)
+                self._entries[password_obj] = None
+                self._index[(domain, login)] = password_obj
+                if self._trigram_index is not None:
+                    self._trigram_index.add(password_obj)
+                self._operations.append(("add", password_obj, None))
+                new_passwords.append(password_obj)
+                stored += 1
+
+        if new_passwords:
+            # Merging the new passwords, sorted, into the sorted list by
+            # copying the slices between their positions, rather than
+            # inserting them one by one
+            new_passwords.sort(key=attrgetter("sort_key"))
+            merged_passwords = []
+            merged_keys = []
+            previous = 0
+            for password_obj in new_passwords:
+                # After the equal ones, like in _add()
+                i = bisect.bisect_right(self._sort_keys, password_obj.sort_key,
+                                        previous)
+                merged_passwords += self._sorted[previous:i]
+                merged_keys += self._sort_keys[previous:i]
+                merged_passwords.append(password_obj)
+                merged_keys.append(password_obj.sort_key)
+                previous = i
+            merged_passwords += self._sorted[previous:]
+            merged_keys += self._sort_keys[previous:]
+            self._sorted = merged_passwords
+            self._sort_keys = merged_keys
+            self._modified()
+
+        return stored
+
     def delete(self, password_obj):
         """ Removes the password from the keychain
         :param password_obj: Password object to remove from the list
@@ -130,14 +648,177 @@ class Keychain:
         """
         success = False
 
-        try:
-            self._passwords.remove(password_obj)
+        if password_obj in self._entries:
+            del self._entries[password_obj]
+            i = bisect.bisect_left(self._sort_keys, password_obj.sort_key)
+            while self._sorted[i] is not password_obj:
+                # Another password with the same key
+                i += 1
+            del self._sorted[i]
+            del self._sort_keys[i]
+            if self._trigram_index is not None:
+                self._trigram_index.remove(password_obj)
+            self._modified()
+            self._unindex(password_obj)
+            self._operations.append(("delete", password_obj, None))
             success = True
-        except ValueError:
-            success = False
 
         return success
 
-    def __str__(self):
-        return "Keychain: {0} passwords".format(len(self._passwords))
+    def _unindex(self, password_obj):
+        """ Removes a password deleted from the sorted list from the index
+        of the domains and logins. If it was the indexed one of duplicates,
+        the first remaining one is indexed instead.
+        """
+        key = (password_obj.domain, password_obj.login)
+        if self._index.get(key) is not password_obj:
+            return
+        del self._index[key]
+        # The duplicates have the same sort key, in the order they were added
+        i = bisect.bisect_left(self._sort_keys, password_obj.sort_key)
+        while i < len(self._sorted) and \
+                self._sort_keys[i] == password_obj.sort_key:
+            p = self._sorted[i]
+            if (p.domain, p.login) == key:
+                self._index[key] = p
+                break
+            i += 1
+
+    def delete_many(self, password_objs):
+        """ Removes many passwords at once, faster than calling delete() for
+        each of them.
+        :param password_objs: Iterable of Password objects, the ones not in
+        the keychain are ignored
+        :return: The number of passwords deleted
+        :rtype: int
+        """
+        # Dictionary used as an ordered set, without the duplicates
+        to_delete = {p: None for p in password_objs if p in self._entries}
+        if len(to_delete) < 16:
+            # Removing them from the sorted list one by one is faster
+            for password_obj in to_delete:
+                self.delete(password_obj)
+            return len(to_delete)
+
+        for password_obj in to_delete:
+            del self._entries[password_obj]
+            if self._trigram_index is not None:
+                self._trigram_index.remove(password_obj)
+            self._operations.append(("delete", password_obj, None))
+
+        # Rebuilding the sorted list in a single pass
+        self._sorted = [p for p in self._sorted if p not in to_delete]
+        self._sort_keys = [p.sort_key for p in self._sorted]
+        self._modified()
+        for password_obj in to_delete:
+            self._unindex(password_obj)
+
+        return len(to_delete)
+
+    @contextmanager
+    def transaction(self):
+        """ Context manager making the modifications of the keychain inside
+        it atomic: if an exception is raised, the keychain is restored as it
+        was before, and the exception is propagated.
+        Entering it copies the list of the passwords, it is meant for batches
+        of modifications.
+        """
+        operations_count = len(self._operations)
+        entries = list(self._entries)
+        sorted_passwords = list(self._sorted)
+        sort_keys = list(self._sort_keys)
+        index = dict(self._index)
+        try:
+            yield self
+        except BaseException:
+            for name, password_obj, previous in \
+                    reversed(self._operations[operations_count:]):
+                if name == "update":
+                    password_obj._password = previous
+                elif self._trigram_index is not None:
+                    if name == "add":
+                        self._trigram_index.remove(password_obj)
+                    else:
+                        self._trigram_index.add(password_obj)
+            del self._operations[operations_count:]
+            self._entries = dict.fromkeys(entries)
+            self._sorted = sorted_passwords
+            self._sort_keys = sort_keys
+            self._index = index
+            self._modified()
+            raise
+
+    @property
+    def is_dirty(self):
+        """ Tells if the keychain has been modified since it was loaded or
+        marked clean
+        :rtype: bool
+        """
+        return bool(self.changes())
+
+    def changes(self):
+        """ Returns the passwords added, updated and deleted since the
+        keychain was loaded or marked clean. A password added then deleted
+        does not appear, an added password modified is only added.
+        :rtype: ChangeSet
+        """
+        # Dictionaries used as ordered sets
+        added, updated, deleted = {}, {}, {}
+        for name, p, previous in self._operations:
+            if name == "add":
+                added[p] = None
+            elif name == "update":
+                if p not in added:
+                    updated[p] = None
+            elif p in added:
+                del added[p]
+            else:
+                updated.pop(p, None)
+                deleted[p] = None
+
+        return ChangeSet(list(added), list(updated), list(deleted))
+
+    def mark_clean(self):
+        """ Forgets the modifications, once they have been saved
+        """
+        self._operations = []
+
+    def pending_operations(self):
+        """ Returns the operations made by set() and delete() since the
+        keychain was loaded or marked clean, to save them without saving the
+        whole keychain. The keychain is marked clean once they are saved.
+        :return: A list of (operation, domain, login, password) tuples, the
+        operation being "set" or "delete"
+        :rtype: list
+        """
+        return [("delete" if name == "delete" else "set",
+                 p.domain, p.login, p.password)
+                for name, p, previous in self._operations]
 
+    def apply(self, operations):
+        """ Replays operations returned by pending_operations(), they are
+        not returned again by pending_operations().
+        :param operations: List of (operation, domain, login, password)
+        tuples
+        """
+        count = len(self._operations)
+        for name, domain, login, password in operations:
+            if name == "set":
+                self.set(domain, login, password, replace=True)
+            elif name == "delete":
+                password_obj = self._index.get((domain, login))
+                if password_obj is None or password_obj.password != password:
+                    # One of the duplicates of the domain and login
+                    password_obj = next(
+                        (p for p in self._entries
+                         if p.domain == domain and p.login == login
+                         and p.password == password), password_obj)
+                if password_obj is not None:
+                    self.delete(password_obj)
+        del self._operations[count:]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return "Keychain: {0} passwords".format(len(self._entries))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+#     mdp - Benchmark of the parallel decryption of the segments
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Compares the decryption time of a segmented vault with 1, 2, 4 and 8
+workers, and with a single AES-CBC stream.
+
+Usage: python -m benchmarks.bench_segments [size in MB]
+"""
+
+import io
+import os
+import sys
+import timeit
+
+from Cryptography import Cryptography, DEFAULT_SEGMENT_SIZE
+
+
+def main(argv):
+    size = int(float(argv[0]) * 1024 * 1024) if len(argv) > 0 else 64 * 1024 * 1024
+    key = "key1234"
+    msg = os.urandom(size)
+    print("Vault size: {0:.1f} MB, {1} processors"
+          .format(size / 1024 / 1024, os.cpu_count()))
+
+    def measure(c, encrypted):
+        def decrypt():
+            c.decrypt_stream(io.BytesIO(encrypted), io.BytesIO(), key)
+        return min(timeit.repeat(decrypt, number=1, repeat=3))
+
+    c = Cryptography(segment_size=0)
+    encrypted = io.BytesIO()
+    c.encrypt_stream(io.BytesIO(msg), encrypted, key)
+    print("AES-CBC:    {0:.4f} s".format(measure(c, encrypted.getvalue())))
+
+    encrypted = io.BytesIO()
+    Cryptography(c.kdf, DEFAULT_SEGMENT_SIZE).encrypt_stream(
+        io.BytesIO(msg), encrypted, key)
+    reference = None
+    for workers in (1, 2, 4, 8):
+        elapsed = measure(Cryptography(workers=workers), encrypted.getvalue())
+        reference = reference or elapsed
+        print("{0} worker(s): {1:.4f} s ({2:.2f}x)"
+              .format(workers, elapsed, reference / elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+#     mdp - Benchmark of the vault unlocking
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Compares the former two-pass unlock (validate() then decrypt()) with the
+single-pass decrypt().
+
+Usage: python -m benchmarks.bench_unlock [size in MB]
+"""
+
+import os
+import sys
+import timeit
+
+from Cryptography import Cryptography
+
+
+def main(argv):
+    size = int(float(argv[0]) * 1024 * 1024) if len(argv) > 0 else 4 * 1024 * 1024
+    key = "key1234"
+    c = Cryptography()
+    # Hex keeps the message valid UTF-8 while being hard to compress
+    encrypted = c.encrypt(os.urandom(size // 2).hex(), key)
+
+    def two_passes():
+        if c.validate(encrypted, key):
+            c.decrypt(encrypted, key)
+
+    def single_pass():
+        c.decrypt(encrypted, key)
+
+    number = 5
+    before = min(timeit.repeat(two_passes, number=number, repeat=3)) / number
+    after = min(timeit.repeat(single_pass, number=number, repeat=3)) / number
+
+    print("Vault size:  {0:.1f} MB".format(size / 1024 / 1024))
+    print("Two passes:  {0:.4f} s".format(before))
+    print("Single pass: {0:.4f} s".format(after))
+    print("Speedup:     {0:.2f}x".format(before / after))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
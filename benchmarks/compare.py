@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+#     mdp - Comparison of benchmark results
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Compares two results of the benchmark suite, for instance before and
+after a change.
+
+Usage: python -m benchmarks.compare <before.json> <after.json>
+"""
+
+import json
+import sys
+
+
+def load(file_path):
+    """ Reads the best times of a result file, by benchmark and size
+    :rtype: dict
+    """
+    with open(file_path) as file:
+        report = json.load(file)
+    return report.get("commit"), {(r["benchmark"], r["entries"]): r["best"]
+                                  for r in report["results"]}
+
+
+def main(argv):
+    if len(argv) != 2:
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        sys.exit(1)
+
+    before_commit, before = load(argv[0])
+    after_commit, after = load(argv[1])
+    print("Before: {0}".format(before_commit))
+    print("After:  {0}".format(after_commit))
+    print()
+    print("{0:<14} {1:>10} {2:>12} {3:>12} {4:>9}"
+          .format("benchmark", "entries", "before (s)", "after (s)",
+                  "speedup"))
+    for key in before:
+        if key in after:
+            print("{0:<14} {1:>10} {2:>12.6f} {3:>12.6f} {4:>8.2f}x"
+                  .format(key[0], key[1], before[key], after[key],
+                          before[key] / max(after[key], 1e-12)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+#     mdp - Synthetic vault generator for the benchmarks
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Generates keychains looking like real ones: a few logins per domain,
+domains sharing their top level domains, and random passwords.
+
+Usage: python -m benchmarks.generator <number of entries> [output file]
+"""
+
+import json
+import random
+import string
+import sys
+
+from Keychain import Keychain
+
+
+TLDS = ("com", "org", "net", "fr", "de", "io", "co.uk")
+SYLLABLES = ("ba", "ko", "mi", "tra", "zen", "lu", "pho", "ri", "xa", "dor",
+             "gi", "ne", "sto", "ve", "qui", "mar", "tel", "op", "ur", "can")
+PASSWORD_CHARS = string.ascii_letters + string.digits + string.punctuation
+
+
+def _word(rnd, min_syllables=2, max_syllables=4):
+    return "".join(rnd.choice(SYLLABLES)
+                   for i in range(rnd.randint(min_syllables, max_syllables)))
+
+
+def generate_entries(size, seed=0):
+    """ Yields the domain, login and password of synthetic entries
+    :param size: Number of entries
+    :param seed: Seed of the random generator, the same seed giving the
+    same entries
+    """
+    rnd = random.Random(seed)
+    used = set()
+    generated = 0
+    while generated < size:
+        domain = "{0}.{1}".format(_word(rnd), rnd.choice(TLDS))
+        if rnd.random() < 0.3:
+            domain = "{0}.{1}".format(rnd.choice(("www", "mail", "login",
+                                                  "account")), domain)
+
+        # Most of the domains have a single login, some have many of them
+        nb_logins = 1 if rnd.random() < 0.7 else rnd.randint(2, 6)
+        for i in range(min(nb_logins, size - generated)):
+            login = "{0}.{1}{2}@{3}.{4}".format(
+                _word(rnd, 1, 2), _word(rnd, 2, 3), rnd.randint(0, 99),
+                rnd.choice(("gmail", "yahoo", "outlook", "mail")),
+                rnd.choice(TLDS))
+            if (domain, login) in used:
+                continue
+            used.add((domain, login))
+            password = "".join(rnd.choice(PASSWORD_CHARS)
+                               for j in range(rnd.randint(12, 24)))
+            yield domain, login, password
+            generated += 1
+
+
+def generate_json(size, seed=0):
+    """ Returns the Json export of a synthetic keychain
+    It is built directly, to not depend on the performance of Keychain.
+    :rtype: str
+    """
+    return json.dumps([{"domain": domain, "login": login,
+                        "password": password}
+                       for domain, login, password
+                       in generate_entries(size, seed)], sort_keys=True)
+
+
+def generate_keychain(size, seed=0):
+    """ Returns a keychain made of synthetic entries
+    :rtype: Keychain
+    """
+    return Keychain(generate_json(size, seed))
+
+
+def main(argv):
+    if len(argv) == 0:
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        sys.exit(1)
+
+    json_string = generate_json(int(argv[0]))
+    if len(argv) > 1:
+        with open(argv[1], "w") as file:
+            file.write(json_string)
+    else:
+        print(json_string)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
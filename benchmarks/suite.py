@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+#     mdp - Benchmark suite of the cryptography and the keychain
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Times the main operations of mdp on synthetic vaults of several sizes
+and outputs the results in Json, to compare them across commits.
+
+Usage: python -m benchmarks.suite [options]
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.generator import generate_json
+from CryptoBackend import get_backend
+from Cryptography import Cryptography
+from Keychain import Keychain
+
+
+DEFAULT_SIZES = (10, 1000, 100000)
+KEY = "key1234"
+
+# Benchmarks, by name. Each one is a function taking the context of a vault
+# size and returning the function to time, or a tuple of a function called
+# before each call without being timed, and the function to time.
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """ Registers a benchmark
+    """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+class Context:
+    """ Data shared by the benchmarks of a vault size
+        The costly data is only built when a benchmark needs it.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.crypto = Cryptography()
+        self._json = None
+        self._encrypted = None
+
+    @property
+    def json(self):
+        if self._json is None:
+            self._json = generate_json(self.size)
+        return self._json
+
+    @property
+    def encrypted(self):
+        if self._encrypted is None:
+            self._encrypted = self.crypto.encrypt(self.json, KEY)
+        return self._encrypted
+
+    def keychain(self):
+        """ Returns a new keychain, for the benchmarks modifying it
+        :rtype: Keychain
+        """
+        return Keychain(self.json)
+
+
+@benchmark("encrypt")
+def bench_encrypt(ctx):
+    json_string = ctx.json
+    # Deriving the key beforehand, it is cached afterwards
+    ctx.crypto.encrypt("", KEY)
+    return lambda: ctx.crypto.encrypt(json_string, KEY)
+
+
+@benchmark("decrypt")
+def bench_decrypt(ctx):
+    encrypted = ctx.encrypted
+    return lambda: ctx.crypto.decrypt(encrypted, KEY)
+
+
+@benchmark("validate")
+def bench_validate(ctx):
+    encrypted = ctx.encrypted
+    return lambda: ctx.crypto.validate(encrypted, KEY)
+
+
+@benchmark("keychain_load")
+def bench_keychain_load(ctx):
+    json_string = ctx.json
+    return lambda: Keychain(json_string)
+
+
+@benchmark("keychain_load_stream")
+def bench_keychain_load_stream(ctx):
+    json_string = ctx.json
+    return lambda: Keychain.from_file(io.StringIO(json_string))
+
+
+@benchmark("keychain_load_binary")
+def bench_keychain_load_binary(ctx):
+    data = ctx.keychain().to_binary()
+    return lambda: Keychain.from_binary(data)
+
+
+@benchmark("to_json")
+def bench_to_json(ctx):
+    keychain = ctx.keychain()
+    return keychain.to_json
+
+
+@benchmark("to_binary")
+def bench_to_binary(ctx):
+    keychain = ctx.keychain()
+    return keychain.to_binary
+
+
+@benchmark("filter")
+def bench_filter(ctx):
+    keychain = ctx.keychain()
+
+    def filter_uncached():
+        # Scanning the whole keychain rather than returning the last result
+        keychain._filter_cache.clear()
+        return keychain.filter("mar", True)
+    return filter_uncached
+
+
+@benchmark("filter_cached")
+def bench_filter_cached(ctx):
+    keychain = ctx.keychain()
+    # The user typing back a pattern already filtered
+    keychain.filter("mar", True)
+    return lambda: keychain.filter("mar", True)
+
+
+@benchmark("search")
+def bench_search(ctx):
+    keychain = ctx.keychain()
+
+    def search_uncached():
+        # Scanning the whole keychain rather than the last results
+        keychain._search_cache = (None, None)
+        return keychain.search("mrtel", 50)
+    return search_uncached
+
+
+@benchmark("search_typing")
+def bench_search_typing(ctx):
+    keychain = ctx.keychain()
+
+    def search_typing():
+        # Each key stroke narrows the results of the previous one
+        keychain._search_cache = (None, None)
+        for end in range(1, len("mrtel") + 1):
+            keychain.search("mrtel"[:end], 50)
+    return search_typing
+
+
+@benchmark("set")
+def bench_set(ctx):
+    keychain = ctx.keychain()
+    counter = iter(range(sys.maxsize))
+    return lambda: keychain.set("new.example.com",
+                                "login{0}".format(next(counter)), "password")
+
+
+@benchmark("delete")
+def bench_delete(ctx):
+    keychain = ctx.keychain()
+    # Deleting entries from the middle of the keychain, each one being
+    # added back before the next deletion
+    passwords = keychain.filter()
+    middle = len(passwords) // 2
+    to_delete = itertools.cycle(passwords[middle:] + passwords[:middle])
+    deleted = []
+
+    def add_back():
+        if deleted:
+            keychain._add(deleted.pop())
+
+    def delete():
+        password_obj = next(to_delete)
+        keychain.delete(password_obj)
+        deleted.append(password_obj)
+    return add_back, delete
+
+
+@benchmark("sorted")
+def bench_sorted(ctx):
+    keychain = ctx.keychain()
+
+    def sorted_uncached():
+        # The list shown by the interface, the keychain keeping it sorted
+        keychain._filter_cache.clear()
+        return keychain.filter()
+    return sorted_uncached
+
+
+def run(func, min_time, max_number):
+    """ Calls a function repeatedly for about min_time seconds
+    :param func: Function returned by a benchmark
+    :return: The number of calls, and the best and mean times of a call
+    :rtype: tuple
+    """
+    setup = None
+    if isinstance(func, tuple):
+        setup, func = func
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_number and \
+            (len(times) == 0 or time.perf_counter() - start < min_time):
+        if setup is not None:
+            setup()
+        call_start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - call_start)
+
+    return len(times), min(times), sum(times) / len(times)
+
+
+def git_commit():
+    """ Returns the current commit, if the sources are in a git repository
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                              cwd=os.path.dirname(os.path.dirname(
+                                  os.path.realpath(__file__))),
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL,
+                              universal_newlines=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.suite",
+        description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-s", "--sizes", default=",".join(
+                            str(size) for size in DEFAULT_SIZES),
+                        help="comma separated numbers of entries "
+                             "(default: %(default)s)")
+    parser.add_argument("-b", "--benchmarks", default=",".join(BENCHMARKS),
+                        help="comma separated benchmarks to run "
+                             "(default: all of them)")
+    parser.add_argument("-t", "--min-time", type=float, default=0.5,
+                        help="minimum time spent on each benchmark, in "
+                             "seconds (default: %(default)s)")
+    parser.add_argument("-n", "--max-number", type=int, default=1000,
+                        help="maximum number of calls of each benchmark "
+                             "(default: %(default)s)")
+    parser.add_argument("-o", "--output",
+                        help="file to write the results to (default: "
+                             "standard output)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    names = args.benchmarks.split(",")
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmarks: {0}".format(", ".join(unknown)))
+
+    results = []
+    for size in sizes:
+        ctx = Context(size)
+        for name in names:
+            number, best, mean = run(BENCHMARKS[name](ctx), args.min_time,
+                                     args.max_number)
+            results.append({"benchmark": name,
+                            "entries": size,
+                            "number": number,
+                            "best": best,
+                            "mean": mean})
+            print("{0:>10} entries  {1:<14} {2:.6f} s"
+                  .format(size, name, best), file=sys.stderr)
+
+    report = {"commit": git_commit(),
+              "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "processors": os.cpu_count(),
+              "backend": get_backend().name,
+              "results": results}
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
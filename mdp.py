@@ -71,12 +71,15 @@ def print_version():
         print(" - Colorama\t{0}".format(colorama.VERSION))
     except ImportError:
         pass
-    try:
-        import Crypto
-        print(" - pycrypto\t{0}".format(Crypto.__version__))
-    except ImportError:
-        print(" - pycrypto\t{0}".format(_("MISSING")))
+    from CryptoBackend import BACKENDS, available_backends
+    backends = available_backends()
+    for name in backends:
+        print(" - {0}\t{1}".format(name, BACKENDS[name].version()))
+    if len(backends) == 0:
+        print(" - {0}\t{1}".format(" / ".join(BACKENDS), _("MISSING")))
         missing_dep += 1
+    import JsonCodec
+    print(" - {0}\t{1}".format(*JsonCodec.library()))
     try:
         import pyperclip
         print(" - pyperclip\t{0}".format(pyperclip.__version__))
@@ -108,16 +111,213 @@ def print_help():
           "You can also use one of these commands:"))
     print(_("\t-h, --help\n\t\tShows this help and exits"))
     print(_("\t-v, --version\n\t\tShows version information and exits"))
+    print(_("\t-t, --tune-kdf [MILLISECONDS]\n\t\tAdjusts the cost of the key "
+            "derivation to unlock the file in the given time\n\t\t(250 ms "
+            "by default) on this machine, then exits"))
+    print(_("\tget DOMAIN [LOGIN]\n\t\tPrints the password of an account, "
+            "the login being optional\n\t\tif the domain has a single one"))
+    print(_("\tset DOMAIN LOGIN [PASSWORD]\n\t\tDefines the password of "
+            "an account, read on the standard input\n\t\tif it is not "
+            "given"))
+    print(_("\tdel DOMAIN LOGIN\n\t\tDeletes an account"))
+    print(_("\tlist [PATTERN]\n\t\tPrints the domain and login of the "
+            "accounts matching the pattern"))
+    print(_("\texport [FILE]\n\t\tWrites all the accounts with their "
+            "passwords in clear, in Json"))
+    print(_("\tbatch [FILE]\n\t\tExecutes the commands above read from the "
+            "file or the standard\n\t\tinput, one per line, unlocking and "
+            "saving the password file once.\n\t\tNothing is saved if one "
+            "of them fails"))
+    print(_("\trpc\n\t\tAnswers Json requests read line by line on the "
+            "standard input, keeping\n\t\tthe file unlocked, for the "
+            "programs running mdp"))
+    print(_("\tserve [SOCKET | --http [PORT]]\n\t\tServes the requests "
+            "of the rpc command to many local clients at once,\n\t\ton a "
+            "Unix domain socket or over HTTP on the loopback interface"))
+    print(_("\tagent [-f, --foreground] [MINUTES]\n\t\tStarts an agent "
+            "keeping the key of the file, so that the password\n\t\tis "
+            "only asked once, until the agent stays idle for the given time"
+            "\n\t\t(15 minutes by default, 0 to never expire)"))
+    print(_("\tagent stop\n\t\tStops the agent, which forgets the keys"))
     print()
     print(_("mdp depends on these third party libraries:"))
     print(_(" - Pyperclip, by Al Sweigart"))
     print(_(" - Urwid, Copyright (C) 2004-2012 Ian Ward"))
-    print(_(" - pycrypto, by Dwayne Litzenberger"))
+    print(_(" - pycryptodome, by Helder Eijs, or cryptography, by the "
+            "Python Cryptographic\n   Authority"))
     print(_(" - Colorama, Copyright Jonathan Hartley 2013"))
     print(_("Make sure to have them installed on your system in order to"
             "access all the\nfeatures."))
 
 
+def tune_kdf(pass_file_path, argv):
+    """ Calibrates the key derivation of the password file
+    :param argv: Optional unlock time aimed, in milliseconds
+    """
+    from ui.BaseInterface import BaseInterface
+
+    try:
+        target = float(argv[0]) / 1000 if len(argv) > 0 else None
+    except ValueError:
+        target = -1
+    if target is not None and target <= 0:
+        print(_("mdp: error: invalid time: {0}").format(argv[0]),
+              file=sys.stderr)
+        sys.exit(errno.EINVAL)
+
+    if not os.path.isfile(pass_file_path):
+        print(_("mdp: error: {filename} is not found")
+              .format(filename=pass_file_path), file=sys.stderr)
+        sys.exit(errno.ENOENT)
+
+    ui_obj = BaseInterface(pass_file_path)
+    kdf = ui_obj.tune_kdf() if target is None else ui_obj.tune_kdf(target)
+    print(_("Key derivation set to {kdf}").format(kdf=kdf))
+
+
+def run_agent(argv):
+    """ Starts the agent in the background, like ssh-agent, or stops it
+    :param argv: "stop", or the optional -f option to stay in the
+    foreground and idle time in minutes
+    """
+    import Agent
+
+    if not Agent.is_supported() or not hasattr(os, "fork"):
+        print(_("mdp: error: the agent is not supported on this system"),
+              file=sys.stderr)
+        sys.exit(errno.ENOSYS)
+
+    if argv[:1] == ['stop']:
+        if not Agent.stop():
+            print(_("mdp: error: no agent is running"), file=sys.stderr)
+            sys.exit(errno.ESRCH)
+        return
+
+    foreground = False
+    timeout = Agent.DEFAULT_TIMEOUT
+    for arg in argv:
+        if arg in ('-f', '--foreground'):
+            foreground = True
+            continue
+        try:
+            minutes = float(arg)
+        except ValueError:
+            minutes = -1
+        if minutes < 0:
+            print(_("mdp: error: invalid time: {0}").format(arg),
+                  file=sys.stderr)
+            sys.exit(errno.EINVAL)
+        timeout = minutes * 60 if minutes > 0 else None
+
+    try:
+        agent = Agent.Agent(timeout=timeout)
+        agent.bind()
+    except (Agent.AgentError, OSError) as e:
+        print(_("mdp: error: unable to start the agent: {error}")
+              .format(error=e), file=sys.stderr)
+        sys.exit(1)
+
+    if foreground:
+        print("{0}={1}; export {0};".format(Agent.SOCKET_ENV, agent.path))
+        agent.serve()
+        return
+
+    pid = os.fork()
+    if pid == 0:
+        # Detaching the agent from the terminal
+        os.setsid()
+        os.chdir("/")
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in range(3):
+            os.dup2(devnull, fd)
+        try:
+            agent.serve()
+        finally:
+            os._exit(0)
+
+    # To be evaluated by the shell, like the output of ssh-agent
+    print("{0}={1}; export {0};".format(Agent.SOCKET_ENV, agent.path))
+    print("echo Agent pid {0};".format(pid))
+
+
+def run_commands(pass_file_path, argv):
+    """ Executes commands without any interaction
+    :param argv: A command with its arguments, or batch and the optional
+    file of the commands
+    """
+    from ui.Batch import Batch, BatchError, parse_command, read_batch, \
+        read_password
+
+    try:
+        if argv[0] == 'batch':
+            if len(argv) > 2:
+                raise BatchError(_("wrong number of arguments for batch"))
+            if len(argv) == 1 or argv[1] == '-':
+                commands = read_batch(sys.stdin)
+            else:
+                try:
+                    with open(argv[1]) as file:
+                        commands = read_batch(file)
+                except OSError as e:
+                    raise BatchError(_("unable to read {filename}: {error}")
+                                     .format(filename=argv[1],
+                                             error=e.strerror), e.errno)
+        else:
+            if argv[0] == 'set' and len(argv) == 3:
+                # Not given in the arguments, which other users can see
+                argv = argv + [read_password()]
+            commands = [parse_command(argv)]
+
+        if not os.path.isfile(pass_file_path):
+            raise BatchError(_("{filename} is not found")
+                             .format(filename=pass_file_path), errno.ENOENT)
+
+        Batch(pass_file_path).run(commands)
+    except BatchError as e:
+        print(_("mdp: error: {0}").format(e), file=sys.stderr)
+        sys.exit(e.code)
+
+
+def serve(pass_file_path, argv):
+    """ Serves the password file to local clients
+    :param argv: Optional path of the socket, or --http and the optional
+    port
+    """
+    from ui.Rpc import RpcError
+    from ui.Server import run
+
+    socket_path = None
+    http_port = None
+    if argv[:1] == ['--http']:
+        try:
+            http_port = int(argv[1]) if len(argv) > 1 else 0
+        except ValueError:
+            http_port = -1
+        if not 0 <= http_port <= 65535 or len(argv) > 2:
+            print(_("mdp: error: invalid port: {0}")
+                  .format(" ".join(argv[1:])),
+                  file=sys.stderr)
+            sys.exit(errno.EINVAL)
+    elif len(argv) == 1:
+        socket_path = argv[0]
+    elif len(argv) > 1:
+        print(_("mdp: error: unrecognized argument: {0}").format(argv[1]),
+              file=sys.stderr)
+        sys.exit(errno.EINVAL)
+
+    if not os.path.isfile(pass_file_path):
+        print(_("mdp: error: {filename} is not found")
+              .format(filename=pass_file_path), file=sys.stderr)
+        sys.exit(errno.ENOENT)
+
+    try:
+        run(pass_file_path, socket_path, http_port)
+    except (OSError, RpcError) as e:
+        print(_("mdp: error: unable to start the server: {error}")
+              .format(error=e), file=sys.stderr)
+        sys.exit(1)
+
+
 def main(argv):
     mode = ''
 
@@ -130,6 +330,17 @@ def main(argv):
     elif argv[0] in ('-h', '--help'):
         print_help()
         sys.exit(0)
+    elif argv[0] in ('-t', '--tune-kdf'):
+        mode = 'tune-kdf'
+    elif argv[0] == 'agent':
+        run_agent(argv[1:])
+        return
+    elif argv[0] in ('get', 'set', 'del', 'list', 'export', 'batch'):
+        mode = 'command'
+    elif argv[0] == 'rpc':
+        mode = 'rpc'
+    elif argv[0] == 'serve':
+        mode = 'serve'
     else:
         print(_("mdp: error: unrecognized argument: {0}").format(argv[0]),
               file=sys.stderr)
@@ -139,6 +350,31 @@ def main(argv):
     # Getting pass file
     pass_file_path = os.path.join(DEFAULT_OUTPUT_DIR, 'pass.txt')
 
+    if mode == 'tune-kdf':
+        tune_kdf(pass_file_path, argv[1:])
+        return
+    elif mode == 'command':
+        run_commands(pass_file_path, argv)
+        return
+    elif mode == 'rpc':
+        if not os.path.isfile(pass_file_path):
+            print(_("mdp: error: {filename} is not found")
+                  .format(filename=pass_file_path), file=sys.stderr)
+            sys.exit(errno.ENOENT)
+        from ui.Rpc import Rpc, RpcError
+        try:
+            Rpc(pass_file_path).serve()
+        except RpcError as e:
+            print(_("mdp: error: {0}").format(e), file=sys.stderr)
+            sys.exit(1)
+        except OSError as e:
+            print(_("mdp: error: {0}").format(e), file=sys.stderr)
+            sys.exit(1)
+        return
+    elif mode == 'serve':
+        serve(pass_file_path, argv[1:])
+        return
+
     # Starting user interface
     try:
         # Using Urwid as default interface
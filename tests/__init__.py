@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import tempfile
+
+import CryptoBackend
+
+# The backend chosen by the tests is not remembered for the user
+_cache_directory = tempfile.TemporaryDirectory()
+CryptoBackend.CACHE_FILE = os.path.join(_cache_directory.name,
+                                        "backend.json")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests for the Agent module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import stat
+import tempfile
+import threading
+from unittest import TestCase, skipUnless
+
+import Agent
+from Cryptography import Cryptography
+from KeyDerivation import Pbkdf2
+
+
+@skipUnless(Agent.is_supported(), "Unix domain sockets are not supported")
+class TestAgent(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "agent", "agent.sock")
+        self.environ = os.environ.get(Agent.SOCKET_ENV)
+        os.environ[Agent.SOCKET_ENV] = self.path
+        self.derived_key = Cryptography(Pbkdf2(iterations=1000)) \
+            .derived_key("key1234")
+
+    def tearDown(self):
+        if self.environ is None:
+            del os.environ[Agent.SOCKET_ENV]
+        else:
+            os.environ[Agent.SOCKET_ENV] = self.environ
+        self.directory.cleanup()
+
+    def start(self, timeout=None):
+        agent = Agent.Agent(timeout=timeout)
+        agent.bind()
+        thread = threading.Thread(target=agent.serve)
+        thread.start()
+        return thread
+
+    def test_keys(self):
+        self.assertIsNone(Agent.get_key("passwords"),
+                          "Without an agent, there should be no key.")
+        self.assertFalse(Agent.add_key("passwords", self.derived_key))
+
+        thread = self.start()
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600,
+                         "Only the user should access the socket.")
+        self.assertIsNone(Agent.get_key("passwords"))
+        self.assertTrue(Agent.add_key("passwords", self.derived_key))
+
+        derived_key = Agent.get_key("passwords")
+        self.assertEqual(derived_key.kdf, self.derived_key.kdf)
+        self.assertEqual(derived_key.key, self.derived_key.key)
+        self.assertIsNone(Agent.get_key("other"))
+
+        self.assertTrue(Agent.stop())
+        thread.join()
+        self.assertFalse(os.path.exists(self.path),
+                         "The socket should be removed when stopping.")
+        self.assertFalse(Agent.stop())
+
+    def test_timeout(self):
+        thread = self.start(timeout=0.1)
+        thread.join(5)
+        self.assertFalse(thread.is_alive(),
+                         "The agent should exit when staying idle.")
+        self.assertIsNone(Agent.get_key("passwords"))
+
+    def test_unsafe_path(self):
+        os.makedirs(os.path.dirname(self.path), mode=0o700)
+        with open(self.path, "w") as file:
+            file.write("data")
+        self.assertRaises(Agent.AgentError, Agent.Agent().bind)
+        self.assertTrue(os.path.isfile(self.path),
+                        "Another kind of file should not be removed.")
+
+        os.remove(self.path)
+        os.chmod(os.path.dirname(self.path), 0o777)
+        self.assertRaises(PermissionError, Agent.Agent().bind)
+
+        environ = os.environ.get("XDG_RUNTIME_DIR")
+        os.environ["XDG_RUNTIME_DIR"] = self.directory.name
+        try:
+            directory = Agent.private_directory()
+            self.assertEqual(stat.S_IMODE(os.stat(directory).st_mode), 0o700,
+                             "Only the user should access the directory.")
+            os.chmod(directory, 0o755)
+            self.assertRaises(PermissionError, Agent.private_directory)
+        finally:
+            if environ is None:
+                del os.environ["XDG_RUNTIME_DIR"]
+            else:
+                os.environ["XDG_RUNTIME_DIR"] = environ
+
+    def test_unsafe_socket(self):
+        thread = self.start()
+        Agent.add_key("passwords", self.derived_key)
+        os.chmod(self.path, 0o666)
+        self.assertIsNone(Agent.get_key("passwords"),
+                          "A socket accessible to others should not be used.")
+
+        os.chmod(self.path, 0o600)
+        self.assertTrue(Agent.stop())
+        thread.join()
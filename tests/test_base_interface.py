@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests for the BaseInterface module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import tempfile
+import threading
+from unittest import TestCase, skipUnless
+
+import Agent
+from Journal import journal_path
+from KeyDerivation import Pbkdf2
+from Keychain import Keychain
+from ui.BaseInterface import BaseInterface
+
+
+class TestBaseInterface(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "passwords")
+        self.interface = self.interface_of(self.path)
+        # Faster to derive, the other interfaces use the one of the file
+        self.interface._crypto.kdf = Pbkdf2(iterations=1000)
+        keychain = Keychain()
+        keychain.set("google.com", "me", "password1")
+        self.interface._save_pass_file(keychain, compact=True)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @staticmethod
+    def interface_of(path):
+        interface = BaseInterface(path)
+        interface._master_password = "key1234"
+        return interface
+
+    def test_cache(self):
+        passwords = self.interface._load_pass_file()
+        self.assertIs(self.interface._load_pass_file(), passwords,
+                      "An unchanged file should not be loaded again.")
+
+        passwords.set("google.com", "you", "password2")
+        self.assertIsNot(self.interface._load_pass_file(), passwords,
+                         "Unsaved changes should be discarded.")
+
+        passwords = self.interface._load_pass_file()
+        passwords.set("google.com", "you", "password2")
+        self.interface._save_pass_file(passwords)
+        self.assertIs(self.interface._load_pass_file(), passwords,
+                      "The keychain saved should be kept.")
+
+    def test_cache_invalidation(self):
+        passwords = self.interface._load_pass_file()
+
+        # Another process appending to the journal
+        other = self.interface_of(self.path)
+        other_passwords = other._load_pass_file()
+        other_passwords.set("google.com", "you", "password2")
+        other._save_pass_file(other_passwords)
+
+        reloaded = self.interface._load_pass_file()
+        self.assertIsNot(reloaded, passwords)
+        self.assertEqual(reloaded.get("google.com", "you").password,
+                         "password2")
+
+        # Both processes appending to the journal
+        reloaded.set("google.com", "them", "password3")
+        other_passwords = other._load_pass_file()
+        other_passwords.set("google.com", "us", "password4")
+        other._save_pass_file(other_passwords)
+        self.interface._save_pass_file(reloaded)
+        reloaded = self.interface._load_pass_file()
+        self.assertEqual(reloaded.get("google.com", "us").password,
+                         "password4",
+                         "The changes of the other process should be "
+                         "loaded.")
+        self.assertEqual(reloaded.get("google.com", "them").password,
+                         "password3")
+
+        # Another process writing the whole file
+        other_passwords = other._load_pass_file()
+        other_passwords.delete(other_passwords.get("google.com", "me"))
+        other._save_pass_file(other_passwords, compact=True)
+
+        reloaded = self.interface._load_pass_file()
+        self.assertIsNone(reloaded.get("google.com", "me"))
+        self.assertEqual(len(reloaded), 3)
+
+        # Another process tuning the key derivation
+        other._crypto.kdf = Pbkdf2(iterations=2000)
+        other._save_pass_file(other_passwords, compact=True)
+        other_passwords.set("google.com", "me", "password3")
+        other._save_pass_file(other_passwords)
+
+        reloaded = self.interface._load_pass_file()
+        self.assertEqual(reloaded.get("google.com", "me").password,
+                         "password3",
+                         "The file should be read with its new parameters.")
+        reloaded.set("google.com", "they", "password5")
+        self.interface._save_pass_file(reloaded)
+        self.assertEqual(other._load_pass_file().get("google.com", "they")
+                         .password, "password5")
+
+    def test_save_failure(self):
+        passwords = self.interface._load_pass_file()
+        passwords.set("google.com", "you", "password2")
+        # The journal can't be written
+        os.mkdir(journal_path(self.path))
+        self.assertRaises(OSError, self.interface._save_pass_file, passwords)
+        self.assertTrue(passwords.is_dirty,
+                        "The changes not saved should be kept.")
+
+        os.rmdir(journal_path(self.path))
+        self.interface._save_pass_file(passwords)
+        self.assertFalse(passwords.is_dirty)
+        reloaded = self.interface_of(self.path)._load_pass_file()
+        self.assertEqual(reloaded.get("google.com", "you").password,
+                         "password2",
+                         "The changes should be saved on the next attempt.")
+
+    def test_interrupted_write(self):
+        passwords = self.interface._load_pass_file()
+        passwords.set("google.com", "you", "password2")
+        encrypt_stream = self.interface._crypto.encrypt_stream
+
+        def interrupted(src, dst, *args, **kwargs):
+            dst.write(b"partial")
+            raise KeyboardInterrupt
+        self.interface._crypto.encrypt_stream = interrupted
+        self.assertRaises(KeyboardInterrupt, self.interface._save_pass_file,
+                          passwords, compact=True)
+        self.interface._crypto.encrypt_stream = encrypt_stream
+
+        self.assertEqual(os.listdir(self.directory.name), ["passwords"],
+                         "The temporary file should be removed.")
+        reloaded = self.interface_of(self.path)._load_pass_file()
+        self.assertEqual(reloaded.get("google.com", "me").password,
+                         "password1",
+                         "The previous file should be kept.")
+        self.assertTrue(passwords.is_dirty)
+
+    @skipUnless(Agent.is_supported(), "Unix domain sockets are not supported")
+    def test_agent(self):
+        environ = os.environ.get(Agent.SOCKET_ENV)
+        os.environ[Agent.SOCKET_ENV] = os.path.join(self.directory.name,
+                                                    "agent.sock")
+        agent = Agent.Agent()
+        agent.bind()
+        thread = threading.Thread(target=agent.serve)
+        thread.start()
+        try:
+            self.interface._remember_key()
+
+            # Without the password, which would be prompted otherwise
+            interface = BaseInterface(self.path)
+            passwords = interface._load_pass_file()
+            self.assertEqual(passwords.get("google.com", "me").password,
+                             "password1")
+            passwords.set("google.com", "you", "password2")
+            interface._save_pass_file(passwords)
+
+            reloaded = self.interface._load_pass_file()
+            self.assertEqual(reloaded.get("google.com", "you").password,
+                             "password2")
+        finally:
+            Agent.stop()
+            thread.join()
+            if environ is None:
+                del os.environ[Agent.SOCKET_ENV]
+            else:
+                os.environ[Agent.SOCKET_ENV] = environ
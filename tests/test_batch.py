@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests for the Batch interface
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from KeyDerivation import Pbkdf2
+from Keychain import Keychain
+from ui.Batch import Batch, BatchError, parse_command, read_batch
+
+
+class TestBatch(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "passwords")
+        self.output = io.StringIO()
+        self.batch = Batch(self.path, self.output)
+        self.batch._master_password = "key1234"
+        self.batch._crypto.kdf = Pbkdf2(iterations=1000)
+        keychain = Keychain()
+        keychain.set("google.com", "me", "password1")
+        keychain.set("github.com", "me", "password2")
+        self.batch._save_pass_file(keychain, compact=True)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_batch(self, text):
+        self.batch.run(read_batch(io.StringIO(text)))
+        return self.output.getvalue().splitlines()
+
+    def test_read_batch(self):
+        self.assertEqual(read_batch(io.StringIO(
+            "# Comment\n"
+            "\n"
+            "set example.com 'my login' \"pass word\" # New account\n"
+            "get example.com\n")),
+            [("set", ["example.com", "my login", "pass word"]),
+             ("get", ["example.com"])])
+
+        with self.assertRaises(BatchError):
+            read_batch(io.StringIO("get google.com\nunknown\n"))
+        with self.assertRaises(BatchError):
+            read_batch(io.StringIO("set 'google.com me password\n"))
+        with self.assertRaises(BatchError):
+            parse_command(["del", "google.com"])
+
+    def test_run(self):
+        self.assertEqual(self.run_batch(
+            "set example.com me password3\n"
+            "set example.com you password4\n"
+            "get example.com you\n"
+            "del google.com me\n"
+            "del example.com me\n"
+            "list\n"
+            "get github.com\n"),
+            ["password4", "example.com\tyou", "github.com\tme", "password2"])
+
+        self.assertEqual(self.batch._journal.records, 4,
+                         "The changes should be saved at once at the end.")
+        passwords = self.batch._load_pass_file()
+        self.assertEqual([str(p) for p in passwords.filter()],
+                         ["example.com\tyou", "github.com\tme"])
+
+    def test_failure(self):
+        with self.assertRaises(BatchError):
+            self.run_batch("set example.com me password3\n"
+                           "del google.com you\n")
+        self.assertIsNone(self.batch._load_pass_file().get("example.com",
+                                                            "me"),
+                          "Nothing should be saved when a command fails.")
+
+        with self.assertRaises(BatchError):
+            self.run_batch("del google.com me\n"
+                           "del google.com me\n")
+        with self.assertRaises(BatchError):
+            self.run_batch("set google.com you password3\n"
+                           "get google.com\n")
+        self.assertEqual(len(self.batch._load_pass_file()), 2)
+
+    def test_export(self):
+        export_path = os.path.join(self.directory.name, "export.json")
+        # Replacing a file readable by everyone
+        with open(export_path, "w") as file:
+            file.write("[]")
+        os.chmod(export_path, 0o644)
+        self.run_batch("export {0}\n".format(export_path))
+        with open(export_path) as file:
+            self.assertEqual(json.load(file),
+                             [{"domain": "github.com", "login": "me",
+                               "password": "password2"},
+                              {"domain": "google.com", "login": "me",
+                               "password": "password1"}])
+        self.assertEqual(os.stat(export_path).st_mode & 0o077, 0,
+                         "The export should only be readable by the user.")
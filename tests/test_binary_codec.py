@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests for the BinaryCodec module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from unittest import TestCase
+
+import BinaryCodec
+
+
+class TestBinaryCodec(TestCase):
+
+    def setUp(self):
+        self.records = [("superwebsite.com", "my_account_login", "password1"),
+                        ("Wifi Password", "", "*7@._:#Er#j{r/\\J"),
+                        ("dé.com", "☃", "é")]
+
+    def test_encode(self):
+        data = BinaryCodec.encode(self.records)
+        self.assertTrue(BinaryCodec.is_binary(data))
+        self.assertEqual(BinaryCodec.count(data), 3)
+        self.assertEqual(list(BinaryCodec.iter_records(data)), self.records,
+                         "The records should be decoded as they were.")
+        self.assertEqual(list(BinaryCodec.iter_records(
+                             BinaryCodec.encode([]))), [])
+
+        self.assertRaises(ValueError, BinaryCodec.encode,
+                          [("a" * 70000, "", "")])
+
+    def test_skip(self):
+        # With and without null characters in the strings
+        for records in (self.records,
+                        self.records + [("a\0b", "\0", "c\0")]):
+            data = BinaryCodec.encode(records)
+            for start in range(len(records) + 2):
+                self.assertEqual(list(BinaryCodec.iter_records(data, start)),
+                                 records[start:],
+                                 "The first {0} records should be skipped."
+                                 .format(start))
+
+    def test_invalid(self):
+        data = BinaryCodec.encode(self.records)
+        invalid = [b"", b"{}", data[:8], data[:20], data[:-1], data + b"\0",
+                   data[:4] + b"\x02" + data[5:]]
+        for invalid_data in invalid:
+            with self.assertRaises(ValueError, msg=repr(invalid_data)):
+                list(BinaryCodec.iter_records(invalid_data))
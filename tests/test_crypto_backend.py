@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests for the CryptoBackend module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import CryptoBackend
+from CryptoBackend import (available_backends, get_backend,
+                           MissingBackendError)
+from Cryptography import Cryptography
+
+
+class TestCryptoBackend(TestCase):
+
+    def setUp(self):
+        self.msg = "My dirty secret message."
+        self.key = "key1234"
+
+    def test_get_backend(self):
+        self.assertIn(get_backend().name, available_backends(),
+                      "The backend picked should be installed.")
+        self.assertRaises(MissingBackendError, get_backend, "unknown")
+
+    def test_cache(self):
+        backends = [get_backend(name) for name in available_backends()]
+        with tempfile.TemporaryDirectory() as directory:
+            cache_file = CryptoBackend.CACHE_FILE
+            CryptoBackend.CACHE_FILE = os.path.join(directory, "backend.json")
+            try:
+                fastest = CryptoBackend._fastest(backends)
+                with open(CryptoBackend.CACHE_FILE) as file:
+                    self.assertEqual(json.load(file)["backend"],
+                                     fastest.name,
+                                     "The result should be kept.")
+                self.assertIs(CryptoBackend._fastest(backends), fastest)
+
+                # Another backend remembered
+                with open(CryptoBackend.CACHE_FILE) as file:
+                    cache = json.load(file)
+                cache["backend"] = backends[-1].name
+                with open(CryptoBackend.CACHE_FILE, "w") as file:
+                    json.dump(cache, file)
+                self.assertIs(CryptoBackend._fastest(backends), backends[-1],
+                              "The cached result should be used.")
+            finally:
+                CryptoBackend.CACHE_FILE = cache_file
+
+    def test_compatibility(self):
+        # Each backend should read what the others have written
+        backends = [get_backend(name) for name in available_backends()]
+        for segment_size in (0, 1000):
+            for encrypting in backends:
+                c = Cryptography(segment_size=segment_size,
+                                 backend=encrypting)
+                encrypted = c.encrypt(self.msg, self.key)
+                sealed = c.entry_cipher(self.key).encrypt(self.msg)
+
+                for decrypting in backends:
+                    c = Cryptography(backend=decrypting)
+                    self.assertEqual(self.msg, c.decrypt(encrypted, self.key),
+                                     "{0} should read the messages of {1}."
+                                     .format(decrypting.name,
+                                             encrypting.name))
+                    self.assertEqual(self.msg,
+                                     c.entry_cipher(self.key).decrypt(sealed),
+                                     "{0} should read the secrets of {1}."
+                                     .format(decrypting.name,
+                                             encrypting.name))
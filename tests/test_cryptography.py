@@ -17,9 +17,14 @@
 #     with this program; if not, write to the Free Software Foundation, Inc.,
 #     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+import hashlib
+import io
 from unittest import TestCase
 
-from Cryptography import Cryptography
+from CryptoBackend import get_backend
+from Cryptography import (Cryptography, CorruptedError, EntryCipher, MAGIC,
+                          BLOCK_SIZE, COMPRESSIONS)
+from KeyDerivation import Pbkdf2
 
 
 class TestCryptography(TestCase):
@@ -52,3 +57,187 @@ class TestCryptography(TestCase):
         self.assertEqual(self.msg, self.c.decrypt(encrypted, self.key),
                          "The message should stay the same after encryption "
                          "and decryption.")
+
+    def test_decrypt_wrong_key(self):
+        encrypted = self.c.encrypt(self.msg, self.key)
+
+        self.assertIsNone(self.c.decrypt(encrypted, "wrong_key"),
+                          "Decrypting with a wrong key should return None.")
+
+    def test_header(self):
+        encrypted = self.c.encrypt(self.msg, self.key)
+        src = io.BytesIO(encrypted)
+        header, prefix = self.c._read_header(src)
+        offset = src.tell()
+
+        self.assertTrue(encrypted.startswith(MAGIC),
+                        "Encrypted messages should start with the signature.")
+        self.assertIn("check", header,
+                      "The header should contain a key check value.")
+
+        # Damaging the data, not the header
+        damaged = encrypted[:offset] + bytes(len(encrypted) - offset)
+        self.assertTrue(self.c.validate(damaged, self.key),
+                        "The key should be checked with the header only.")
+        self.assertFalse(self.c.validate(damaged, "wrong_key"),
+                         "A wrong key should be rejected by the header.")
+
+    def test_decrypt_legacy(self):
+        key = hashlib.sha256(self.key.encode("utf-8")).digest()
+        iv = bytes(range(16))
+        plain = self.msg.encode("utf-8")
+
+        padding_length = BLOCK_SIZE - len(plain) % BLOCK_SIZE
+        padded = plain + bytes((padding_length,)) * padding_length
+        legacy = iv + get_backend().cbc_encryptor(key, iv)(padded)
+        self.assertEqual(self.msg, self.c.decrypt(legacy, self.key),
+                         "Files without header should still be readable.")
+        self.assertIsNone(self.c.decrypt(legacy, "wrong_key"),
+                          "Wrong keys should be detected on legacy files.")
+
+        # The oldest files were padded with spaces
+        padded = plain + b" " * padding_length
+        legacy = iv + get_backend().cbc_encryptor(key, iv)(padded)
+        self.assertEqual(self.msg, self.c.decrypt(legacy, self.key),
+                         "Files padded with spaces should still be readable.")
+
+    def test_kdf(self):
+        kdf = Pbkdf2(iterations=1000)
+        encrypted = Cryptography(kdf).encrypt(self.msg, self.key)
+        header, prefix = self.c._read_header(io.BytesIO(encrypted))
+        self.assertEqual(header["kdf"], kdf.to_header(),
+                         "The key derivation parameters should be stored in "
+                         "the header.")
+
+        self.assertEqual(self.msg, self.c.decrypt(encrypted, self.key),
+                         "The parameters should be read from the header.")
+        self.assertEqual(self.c.kdf, kdf,
+                         "The parameters of the file should be kept for the "
+                         "next encryption.")
+
+        tuned_kdf = Pbkdf2(iterations=2000)
+        encrypted = Cryptography(tuned_kdf).encrypt(self.msg, self.key)
+        self.assertEqual(self.msg, self.c.decrypt(encrypted, self.key))
+        self.assertEqual(self.c.kdf, tuned_kdf,
+                         "The parameters of a file tuned since should "
+                         "replace the previous ones.")
+        self.assertEqual(self.c.journal_key(self.key),
+                         Cryptography(tuned_kdf).journal_key(self.key))
+
+    def test_derived_key(self):
+        kdf = Pbkdf2(iterations=1000)
+        encrypted = Cryptography(kdf).encrypt(self.msg, self.key)
+        derived_key = Cryptography(kdf).derived_key(self.key)
+
+        self.assertEqual(self.msg, self.c.decrypt(encrypted, derived_key),
+                         "A derived key should replace the password.")
+        self.assertEqual(self.c.entry_cipher(derived_key),
+                         self.c.entry_cipher(self.key))
+        self.assertIsNone(
+            self.c.decrypt(encrypted, Cryptography(Pbkdf2(iterations=1000))
+                           .derived_key(self.key)),
+            "A key derived with another salt should be rejected.")
+
+    def test_stream(self):
+        # Several chunks, not aligned on the block size
+        msg = self.msg.encode("utf-8") * 10000
+        encrypted = io.BytesIO()
+        self.c.encrypt_stream(io.BytesIO(msg), encrypted, self.key)
+
+        decrypted = io.BytesIO()
+        self.assertTrue(self.c.decrypt_stream(io.BytesIO(encrypted.getvalue()),
+                                              decrypted, self.key),
+                        "The key should be valid.")
+        self.assertEqual(msg, decrypted.getvalue(),
+                         "The message should stay the same after encryption "
+                         "and decryption.")
+        self.assertEqual(self.msg * 10000,
+                         self.c.decrypt(encrypted.getvalue(), self.key),
+                         "Streams and messages should have the same format.")
+        self.assertFalse(self.c.decrypt_stream(io.BytesIO(encrypted.getvalue()),
+                                               io.BytesIO(), "wrong_key"),
+                         "A wrong key should be detected.")
+
+    def test_segments(self):
+        msg = self.msg * 1000
+        c = Cryptography(segment_size=1000, workers=4, compression="none")
+        encrypted = c.encrypt(msg, self.key)
+        header, prefix = c._read_header(io.BytesIO(encrypted))
+        self.assertEqual(header["segment_size"], 1000,
+                         "The segment size should be stored in the header.")
+
+        self.assertEqual(msg, Cryptography(workers=1).decrypt(encrypted,
+                                                              self.key),
+                         "The segments should be decrypted in order.")
+        self.assertEqual(msg, Cryptography(workers=4).decrypt(encrypted,
+                                                              self.key),
+                         "The segments should be decrypted in order.")
+        self.assertIsNone(c.decrypt(encrypted, "wrong_key"),
+                          "A wrong key should be detected.")
+
+        self.assertRaises(CorruptedError, c.decrypt, encrypted[:-1000],
+                          self.key)
+        damaged = bytearray(encrypted)
+        damaged[-1000] ^= 1
+        self.assertRaises(CorruptedError, c.decrypt, bytes(damaged), self.key)
+
+    def test_single_stream(self):
+        c = Cryptography()
+        encrypted = c.encrypt(self.msg, self.key)
+        header, prefix = c._read_header(io.BytesIO(encrypted))
+        self.assertNotIn("segment_size", header,
+                         "A single AES-CBC stream should be the default.")
+        self.assertEqual(self.msg, c.decrypt(encrypted, self.key),
+                         "The message should stay the same after encryption "
+                         "and decryption.")
+
+        other = Cryptography()
+        other.decrypt(encrypted, self.key)
+        header, prefix = other._read_header(io.BytesIO(
+            other.encrypt(self.msg, self.key)))
+        self.assertNotIn("segment_size", header,
+                         "The single stream of a file should be kept.")
+
+        other = Cryptography()
+        other.decrypt(Cryptography(segment_size=1000).encrypt(self.msg,
+                                                              self.key),
+                      self.key)
+        header, prefix = other._read_header(io.BytesIO(
+            other.encrypt(self.msg, self.key)))
+        self.assertEqual(header["segment_size"], 1000,
+                         "The segments of a file should be kept.")
+
+    def test_entry_cipher(self):
+        cipher = self.c.entry_cipher(self.key)
+        sealed = cipher.encrypt(self.msg)
+
+        self.assertNotEqual(self.msg, sealed,
+                            "The secret should be encrypted.")
+        self.assertEqual(self.msg, cipher.decrypt(sealed),
+                         "The secret should stay the same after encryption "
+                         "and decryption.")
+        self.assertEqual(cipher, self.c.entry_cipher(self.key),
+                         "The same key should give the same cipher.")
+        self.assertRaises(CorruptedError,
+                          EntryCipher(bytes(32)).decrypt, sealed)
+
+    def test_compression(self):
+        msg = self.msg * 10000
+        for compression in COMPRESSIONS:
+            c = Cryptography(compression=compression)
+            encrypted = c.encrypt(msg, self.key)
+            header, prefix = c._read_header(io.BytesIO(encrypted))
+            self.assertEqual(header.get("compression", "none"), compression,
+                             "The compression should be stored in the "
+                             "header.")
+            if compression != "none":
+                self.assertLess(len(encrypted), len(msg) / 10,
+                                "A repetitive message should be compressed.")
+
+            new_c = Cryptography()
+            self.assertEqual(msg, new_c.decrypt(encrypted, self.key),
+                             "The message should stay the same after "
+                             "compression and decompression.")
+            self.assertEqual(new_c.compression, compression,
+                             "The compression of the message should be kept "
+                             "for the next encryption.")
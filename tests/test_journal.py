@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests for the Journal module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import tempfile
+from unittest import TestCase
+
+from Cryptography import CorruptedError
+import Journal
+
+
+class TestJournal(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Journal.journal_path(os.path.join(self.directory.name,
+                                                      "passwords"))
+        self.snapshot_id = Journal.new_snapshot_id()
+        self.key = bytes(32)
+        self.operations = [("set", "google.com", "me", "password1"),
+                           ("set", "dé.com", "☃", "é"),
+                           ("delete", "google.com", "me", "password1")]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def journal(self, snapshot_id=None, key=None):
+        return Journal.Journal(self.path, snapshot_id or self.snapshot_id,
+                               key or self.key)
+
+    def test_append(self):
+        self.assertEqual(self.journal().read(), [],
+                         "A missing journal should be empty.")
+
+        journal = self.journal()
+        self.assertTrue(journal.append(self.operations[:2]))
+        self.assertTrue(journal.append(self.operations[2:]))
+        self.assertEqual(journal.records, 3)
+        self.assertEqual(journal.size, os.path.getsize(self.path))
+
+        self.assertEqual(self.journal().read(), self.operations,
+                         "The operations should be read back in order.")
+        self.assertEqual(self.journal(Journal.new_snapshot_id()).read(), [],
+                         "The journal of another snapshot should be "
+                         "ignored.")
+        self.assertFalse(self.journal(Journal.new_snapshot_id())
+                         .append(self.operations),
+                         "The journal of another snapshot should not be "
+                         "appended to.")
+
+        journal.remove()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_concurrent_append(self):
+        # Two processes saving changes to the same snapshot
+        journal = self.journal()
+        other = self.journal()
+        journal.append(self.operations[:1])
+        other.append(self.operations[1:2])
+        journal.append(self.operations[2:])
+        self.assertEqual(journal.records, 3,
+                         "The records of the other process should be "
+                         "counted.")
+        self.assertEqual(self.journal().read(), self.operations,
+                         "The records of both processes should be kept.")
+
+    def test_incomplete_record(self):
+        self.journal().append(self.operations[:2])
+        with open(self.path, "ab") as file:
+            file.write(b"\x00\x00\x01\x00partial")
+
+        journal = self.journal()
+        self.assertEqual(journal.read(), self.operations[:2],
+                         "An incomplete last record should be ignored.")
+        journal.append(self.operations[2:])
+        self.assertEqual(self.journal().read(), self.operations,
+                         "An incomplete last record should be overwritten.")
+
+    def test_corrupted(self):
+        self.journal().append(self.operations)
+        with open(self.path, "rb") as file:
+            data = bytearray(file.read())
+        data[-1] ^= 1
+        with open(self.path, "wb") as file:
+            file.write(data)
+
+        self.assertRaises(CorruptedError, self.journal().read)
+        self.assertRaises(CorruptedError,
+                          self.journal(key=bytes(31) + b"\x01").read)
+
+    def test_needs_compaction(self):
+        journal = self.journal()
+        journal.append(self.operations)
+        self.assertFalse(journal.needs_compaction())
+        self.assertTrue(journal.needs_compaction(Journal.MAX_RECORDS),
+                        "Appending too many operations should compact the "
+                        "journal.")
+        journal.append([self.operations[0]] * Journal.MAX_RECORDS)
+        self.assertTrue(journal.needs_compaction(),
+                        "A long journal should be compacted.")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests for the JsonCodec module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import io
+import json
+from unittest import TestCase
+from unittest.mock import patch
+
+import JsonCodec
+
+
+class TestJsonCodec(TestCase):
+
+    def setUp(self):
+        self.passwords = [{"domain": "example.com", "login": "me",
+                           "password": "é\"\\/ ☃"},
+                          {"domain": "", "login": "", "password": ""}]
+
+    def test_loads_dumps(self):
+        libraries = [(JsonCodec.orjson, JsonCodec.ujson),
+                     (None, JsonCodec.ujson),
+                     (None, None)]
+        for orjson, ujson in libraries:
+            with patch.object(JsonCodec, "orjson", orjson), \
+                    patch.object(JsonCodec, "ujson", ujson):
+                name = JsonCodec.library()[0]
+                for indent in (None, 4):
+                    json_string = JsonCodec.dumps(self.passwords, indent)
+                    self.assertIsInstance(json_string, str)
+                    self.assertEqual(json.loads(json_string), self.passwords,
+                                     "{0} should write valid Json."
+                                     .format(name))
+                    self.assertEqual(JsonCodec.loads(json_string),
+                                     self.passwords,
+                                     "{0} should read its Json back."
+                                     .format(name))
+                self.assertNotIn("\n", JsonCodec.dumps(self.passwords),
+                                 "The reduced Json should be on one line.")
+                self.assertRaises(ValueError, JsonCodec.loads, "[{]")
+
+    def test_iter_array(self):
+        documents = ["[]", " [ ] ", "[1, 23 ,456]",
+                     json.dumps(self.passwords, indent=4),
+                     '[{"a": [1, {"b": null}]}, "x", true, 1.5e3]']
+        for document in documents:
+            for chunk_size in (1, 2, 7, JsonCodec.CHUNK_SIZE):
+                self.assertEqual(
+                    list(JsonCodec.iter_array(io.StringIO(document),
+                                              chunk_size)),
+                    json.loads(document),
+                    "iter_array() should decode {0!r} by chunks of {1} "
+                    "characters.".format(document, chunk_size))
+
+        for document in ("", "{}", "[", "[1", "[1,", "[1 2]", "[1]]",
+                         '[{"a":}]'):
+            for chunk_size in (1, JsonCodec.CHUNK_SIZE):
+                with self.assertRaises(ValueError,
+                                       msg="{0!r} is not a valid array."
+                                       .format(document)):
+                    list(JsonCodec.iter_array(io.StringIO(document),
+                                              chunk_size))
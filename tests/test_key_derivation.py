@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests for the KeyDerivation module
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from unittest import TestCase
+
+from KeyDerivation import KeyDerivation, Pbkdf2, Scrypt, Sha256
+
+
+class TestKeyDerivation(TestCase):
+
+    def test_from_header(self):
+        for kdf in (Sha256(), Pbkdf2(iterations=1000), Scrypt(n=2 ** 10)):
+            new_kdf = KeyDerivation.from_header(kdf.to_header())
+            self.assertEqual(kdf, new_kdf,
+                             "The parameters should be the same after "
+                             "reading them back from the header.")
+            self.assertEqual(kdf.derive("key1234"), new_kdf.derive("key1234"),
+                             "The same parameters should give the same key.")
+
+        self.assertRaises(ValueError, KeyDerivation.from_header,
+                          {"name": "unknown"})
+        self.assertRaises(ValueError, KeyDerivation.from_header,
+                          {"name": "scrypt", "n": 1000, "r": 8, "p": 1,
+                           "salt": ""})
+
+    def test_salt(self):
+        self.assertNotEqual(Scrypt(n=2 ** 10).derive("key1234"),
+                            Scrypt(n=2 ** 10).derive("key1234"),
+                            "Each new instance should have its own salt.")
+
+    def test_calibrate(self):
+        kdf = Pbkdf2.calibrate(0.01)
+        self.assertGreaterEqual(kdf.iterations, Pbkdf2.MIN_COST,
+                                "The cost should stay in the bounds.")
+
+        kdf = Scrypt.calibrate(0.01)
+        self.assertEqual(kdf.n & (kdf.n - 1), 0,
+                         "The scrypt cost should be a power of 2.")
+
+        kdf = Scrypt.calibrate(1000)
+        self.assertLessEqual(128 * kdf.r * kdf.n, Scrypt.MAX_MEMORY,
+                             "The memory used by scrypt should be bounded.")
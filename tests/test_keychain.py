@@ -17,10 +17,14 @@
 #     with this program; if not, write to the Free Software Foundation, Inc.,
 #     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+import gc
+import io
 import json
+import tracemalloc
 from unittest import TestCase
 
-from Keychain import Keychain, Password
+from Cryptography import EntryCipher
+from Keychain import ChangeSet, Keychain, Password, fuzzy_score
 
 
 class TestKeychain(TestCase):
@@ -85,6 +89,175 @@ class TestKeychain(TestCase):
                          "We should get back all the 5 passwords from the "
                          "exported json string.")
 
+    def test_to_binary(self):
+        self.keychain.set("google.com", "my_mail@gmail.com", "password4")
+        self.keychain._add(Password("google.com", "my_mail@gmail.com",
+                                    "duplicate"))
+        new_keychain = Keychain.from_binary(self.keychain.to_binary())
+        self.assertEqual(new_keychain.to_json(), self.keychain.to_json(),
+                         "The binary export should keep all the passwords, "
+                         "in the same order.")
+        self.assertEqual(Keychain(new_keychain.to_json()).to_binary(),
+                         self.keychain.to_binary(),
+                         "The conversion to Json should be lossless.")
+
+        cipher = EntryCipher(bytes(32))
+        self.keychain.seal(cipher)
+        new_keychain = Keychain.from_binary(self.keychain.to_binary(), cipher)
+        self.assertEqual(new_keychain.get("google.com",
+                                          "my_mail@gmail.com").password,
+                         "password2",
+                         "Sealed passwords should be exported as is.")
+        self.assertRaises(ValueError, Keychain.from_binary,
+                          self.keychain.to_json().encode("utf-8"))
+
+    def test_operations(self):
+        self.keychain.mark_clean()
+        self.keychain.set("google.com", "my_mail@gmail.com", "password4")
+        self.keychain.set("google.com", "my_mail@gmail.com", "password5",
+                          replace=True)
+        self.keychain.set("new.com", "login", "password6")
+        self.keychain.delete(self.keychain.get("mail.yahoo.com",
+                                               "my_mail@yahoo.com"))
+        operations = self.keychain.pending_operations()
+        self.assertEqual(operations, [
+            ("set", "google.com", "my_mail@gmail.com", "password5"),
+            ("set", "new.com", "login", "password6"),
+            ("delete", "mail.yahoo.com", "my_mail@yahoo.com", "password3")],
+            "Only the modifications should be recorded.")
+        self.assertEqual(self.keychain.pending_operations(), operations,
+                         "The operations should be kept until saved.")
+        self.keychain.mark_clean()
+        self.assertEqual(self.keychain.pending_operations(), [])
+
+        self.setUp()
+        self.keychain._add(Password("google.com", "my_mail@gmail.com",
+                                    "duplicate"))
+        self.keychain.apply(operations + [
+            ("delete", "google.com", "my_mail@gmail.com", "duplicate")])
+        self.assertEqual(self.keychain.get("google.com",
+                                           "my_mail@gmail.com").password,
+                         "password5")
+        self.assertEqual(len(self.keychain), 5,
+                         "The operations should be replayed, deleting the "
+                         "right duplicate.")
+        self.assertIsNone(self.keychain.get("mail.yahoo.com",
+                                            "my_mail@yahoo.com"))
+        self.assertEqual(self.keychain.pending_operations(), [],
+                         "Replayed operations should not be recorded.")
+
+    def test_changes(self):
+        self.assertFalse(self.keychain.is_dirty,
+                         "A keychain just loaded should not be modified.")
+        self.assertFalse(self.keychain.set("google.com", "my_mail@gmail.com",
+                                           "password4"))
+        self.keychain.set("google.com", "my_mail@gmail.com", "password2",
+                          replace=True)
+        self.assertFalse(self.keychain.is_dirty,
+                         "Setting the same password should change nothing.")
+
+        google = self.keychain.get("google.com", "my_mail@gmail.com")
+        yahoo = self.keychain.get("mail.yahoo.com", "my_mail@yahoo.com")
+        self.keychain.set("google.com", "my_mail@gmail.com", "password4",
+                          replace=True)
+        self.keychain.set("new.com", "login", "password5")
+        new = self.keychain.get("new.com", "login")
+        self.keychain.set("new.com", "login", "password6", replace=True)
+        self.keychain.set("temporary.com", "login", "password7")
+        self.keychain.delete(self.keychain.get("temporary.com", "login"))
+        self.keychain.delete(yahoo)
+        self.assertTrue(self.keychain.is_dirty)
+        changes = self.keychain.changes()
+        self.assertIsInstance(changes, ChangeSet)
+        self.assertEqual((changes.added, changes.updated, changes.deleted),
+                         ([new], [google], [yahoo]),
+                         "Only the differences should be in the change set.")
+
+        self.keychain.delete(google)
+        changes = self.keychain.changes()
+        self.assertEqual((changes.updated, changes.deleted),
+                         ([], [yahoo, google]),
+                         "A deleted password should not be updated.")
+
+        self.keychain.mark_clean()
+        self.assertFalse(self.keychain.is_dirty)
+        self.assertFalse(self.keychain.changes())
+
+    def test_set_many(self):
+        stored = self.keychain.set_many([
+            ("google.com", "my_mail@gmail.com", "password4"),
+            ("a.com", "login", "password5"),
+            ("z.com", "login", "password6"),
+            ("a.com", "login", "password7")])
+        self.assertEqual(stored, 2,
+                         "Existing passwords should not be replaced.")
+        self.assertEqual(self.keychain.get("a.com", "login").password,
+                         "password5")
+        passwords = self.keychain.filter()
+        self.assertEqual(passwords, sorted(passwords),
+                         "The new passwords should be sorted.")
+        self.assertEqual(len(self.keychain.filter("login")), 3)
+
+        self.assertEqual(self.keychain.set_many(
+            [("google.com", "my_mail@gmail.com", "password4")], True), 1)
+        self.assertEqual(self.keychain.get("google.com",
+                                           "my_mail@gmail.com").password,
+                         "password4")
+
+        with self.assertRaises(ValueError):
+            self.keychain.set_many([("b.com", "login", "password8"),
+                                    ("c.com", None, "password9")])
+        self.assertIsNone(self.keychain.get("b.com", "login"),
+                          "An invalid batch should not be stored at all.")
+
+    def test_delete_many(self):
+        self.keychain.set_many(("domain{0}.com".format(i), "login",
+                                "password") for i in range(50))
+        passwords = self.keychain.filter()
+        to_delete = passwords[::2] + passwords[:4:2]
+        self.assertEqual(self.keychain.delete_many(to_delete), 28,
+                         "Each password should be deleted once.")
+        self.assertEqual(self.keychain.filter(), passwords[1::2])
+        self.assertIsNone(self.keychain.get(to_delete[0].domain,
+                                            to_delete[0].login))
+        self.assertEqual(self.keychain.delete_many(to_delete[:2] +
+                                                   passwords[1:2]), 1)
+        self.assertEqual(len(self.keychain), 26)
+
+    def test_transaction(self):
+        self.keychain.enable_substring_index()
+        before = self.keychain.to_json()
+        google = self.keychain.get("google.com", "my_mail@gmail.com")
+        with self.assertRaises(KeyError):
+            with self.keychain.transaction():
+                self.keychain.set("new.com", "login", "password4")
+                self.keychain.set("google.com", "my_mail@gmail.com",
+                                  "password5", replace=True)
+                self.keychain.delete_many(self.keychain.filter("mail"))
+                raise KeyError
+        self.assertEqual(self.keychain.to_json(), before,
+                         "The keychain should be restored.")
+        self.assertEqual(google.password, "password2")
+        self.assertIs(self.keychain.get("google.com", "my_mail@gmail.com"),
+                      google)
+        self.assertEqual(len(self.keychain.filter("mail")), 2)
+        self.assertFalse(self.keychain.is_dirty)
+
+        with self.keychain.transaction():
+            self.keychain.set("new.com", "login", "password4")
+        self.assertEqual(len(self.keychain.filter("new.c")), 1,
+                         "The modifications should be kept without error.")
+
+    def test_from_file(self):
+        json_string = self.keychain.to_json(reduced=False)
+        new_keychain = Keychain.from_file(io.StringIO(json_string))
+        self.assertEqual(new_keychain.to_json(), self.keychain.to_json(),
+                         "The streamed keychain should be the same.")
+        self.assertEqual(new_keychain.filter(), sorted(new_keychain.filter()),
+                         "The streamed passwords should be sorted.")
+        self.assertRaises(ValueError, Keychain.from_file,
+                          io.StringIO(json_string[:-10]))
+
     def test_filter(self):
         self.assertEqual(len(self.keychain.filter("")), 5,
                          "Before filtering, the method 'filter()' "
@@ -131,3 +304,226 @@ class TestKeychain(TestCase):
                          "of them.")
         self.assertTrue(success, "delete() should return True on a successful "
                                  "deletion.")
+
+    def test_seal(self):
+        cipher = EntryCipher(bytes(32))
+        self.keychain.seal(cipher)
+        json_string = self.keychain.to_json()
+        self.assertNotIn("password1", json_string,
+                         "Sealed passwords should be exported encrypted.")
+
+        new_keychain = Keychain(json_string, cipher)
+        self.assertEqual(new_keychain._passwords[0].password, "password1",
+                         "Sealed passwords should be decrypted when read.")
+        self.assertNotEqual(new_keychain._passwords[0]._password, "password1",
+                            "Sealed passwords should stay encrypted in "
+                            "memory.")
+
+        new_keychain.set("New domain", "New login", "password4")
+        self.assertEqual(new_keychain._passwords[-1].password, "password4",
+                         "New passwords should be sealed as well.")
+
+        new_keychain.seal(None)
+        self.assertEqual(new_keychain._passwords[0]._password, "password1",
+                         "Unsealing should decrypt all the passwords.")
+
+    def test_get(self):
+        p = self.keychain.get("google.com", "my_mail@gmail.com")
+        self.assertEqual(p.password, "password2",
+                         "get() should return the password of the domain and "
+                         "login.")
+        self.assertIsNone(self.keychain.get("google.com", "unknown"),
+                          "get() should return None for an unknown login.")
+
+        self.keychain.delete(p)
+        self.assertIsNone(self.keychain.get("google.com", "my_mail@gmail.com"),
+                          "A deleted password should not be found anymore.")
+        self.assertTrue(self.keychain.set("google.com", "my_mail@gmail.com",
+                                          "password4"),
+                        "A deleted password should be defined again.")
+
+    def test_duplicates(self):
+        keychain = Keychain(json.dumps([
+            {"domain": "a", "login": "b", "password": "1"},
+            {"domain": "a", "login": "b", "password": "2"}]))
+        self.assertEqual(len(keychain), 2,
+                         "Duplicates in a file should be kept.")
+        self.assertTrue(keychain.delete(keychain._passwords[1]),
+                        "A duplicate should be deleted.")
+        self.assertEqual(keychain.get("a", "b").password, "1",
+                         "Deleting a duplicate should keep the first entry.")
+
+        json_passwords = [{"domain": "a", "login": "b", "password": str(i)}
+                          for i in range(3)]
+        keychain = Keychain(json.dumps(json_passwords))
+        keychain.delete(keychain.get("a", "b"))
+        self.assertEqual(keychain.get("a", "b").password, "1",
+                         "The remaining duplicate should be found.")
+
+        json_passwords += [{"domain": "c", "login": str(i), "password": ""}
+                           for i in range(20)]
+        keychain = Keychain(json.dumps(json_passwords))
+        keychain.delete_many([keychain.get("a", "b")] + keychain.filter("c"))
+        self.assertEqual(keychain.get("a", "b").password, "1",
+                         "The remaining duplicate should be found after "
+                         "deleting many passwords.")
+
+    def test_substring_index(self):
+        self.keychain.enable_substring_index()
+
+        for pattern in ("", "my", "my_mail", "MAIL", "com", "wifi", "xyz"):
+            for ignore_case in (False, True):
+                expected = [p for p in sorted(self.keychain._passwords)
+                            if (pattern.lower() in p.domain.lower()
+                                or pattern.lower() in p.login.lower())
+                            if ignore_case
+                            or pattern in p.domain or pattern in p.login]
+                self.assertEqual(self.keychain.filter(pattern, ignore_case),
+                                 expected,
+                                 "The index should not change the result of "
+                                 "filter('{0}', {1}).".format(pattern,
+                                                               ignore_case))
+
+        self.keychain.set("New domain", "New login", "password4")
+        self.assertEqual(len(self.keychain.filter("new dom", True)), 1,
+                         "New passwords should be indexed.")
+        self.keychain.delete(self.keychain.filter("yahoo")[0])
+        self.assertEqual(len(self.keychain.filter("yahoo")), 0,
+                         "Deleted passwords should be removed from the "
+                         "index.")
+
+    def test_filter_cache(self):
+        self.assertEqual(len(self.keychain.filter("mail", True)), 2,
+                         "Two passwords contain 'mail'.")
+        self.assertEqual(len(self.keychain.filter("mail@y", True)), 1,
+                         "Refining the pattern should give a subset of the "
+                         "previous results.")
+        self.assertEqual(len(self.keychain.filter("MAIL", True)), 2,
+                         "The cached results should be returned back.")
+        self.assertEqual(len(self.keychain.filter("MAIL")), 0,
+                         "The cache should depend on the case sensitivity.")
+
+        result = self.keychain.filter("mail", True)
+        result.clear()
+        self.assertEqual(len(self.keychain.filter("mail", True)), 2,
+                         "Modifying a result should not alter the cache.")
+
+        self.keychain.set("yahoo.fr", "my_mail@yahoo.fr", "password4")
+        self.assertEqual(len(self.keychain.filter("mail@y", True)), 2,
+                         "New passwords should invalidate the cache.")
+        self.keychain.delete(self.keychain.get("yahoo.fr", "my_mail@yahoo.fr"))
+        self.assertEqual(len(self.keychain.filter("mail@y", True)), 1,
+                         "Deleted passwords should invalidate the cache.")
+
+    def test_fuzzy_score(self):
+        self.assertIsNone(fuzzy_score("gh", "gitlab.com"),
+                          "The characters should all be in the text.")
+        self.assertIsNone(fuzzy_score("hg", "github.com"),
+                          "The characters should be in order.")
+        self.assertGreater(fuzzy_score("gh", "my.gh.io"),
+                           fuzzy_score("gh", "github.com"),
+                           "Consecutive matches should score higher.")
+        self.assertGreater(fuzzy_score("hub", "mail.hub.io"),
+                           fuzzy_score("hub", "github.io"),
+                           "Matches at the start of a label should score "
+                           "higher.")
+        self.assertGreater(fuzzy_score("gh", "GitHub"),
+                           fuzzy_score("gh", "github"),
+                           "Camel case humps should score higher.")
+
+    def test_search(self):
+        results = self.keychain.search("mmg")
+        self.assertEqual([p.login for p in results], ["my_mail@gmail.com"],
+                         "Only the logins containing m, m and g in order "
+                         "should be found.")
+
+        results = self.keychain.search("mya")
+        self.assertEqual(len(results), 3,
+                         "Three logins contain m, y and a in order.")
+        self.assertEqual(results[0].login, "my_account_login",
+                         "The best match should be first.")
+        self.assertEqual(len(self.keychain.search("mya", limit=2)), 2,
+                         "The number of results should be limited.")
+        self.assertEqual(self.keychain.search("mya", limit=2),
+                         results[:2],
+                         "The limited results should be the best ones.")
+        self.assertEqual(len(self.keychain.search("")), 5,
+                         "An empty pattern should match all the passwords.")
+
+        self.keychain.set("straße.de", "Me", "password4")
+        self.assertEqual([p.domain for p in self.keychain.search("strasse")],
+                         ["straße.de"],
+                         "The pattern should be searched without case, like "
+                         "it is scored.")
+
+    def test_footprint(self):
+        # Few domains and logins shared by many entries, like in a real
+        # keychain
+        json_string = json.dumps([
+            {"domain": "domain{0}.example.com".format(i % 50),
+             "login": "user{0}@example.com".format(i // 50),
+             "password": "password{0}".format(i)}
+            for i in range(5000)])
+
+        def footprint(function):
+            gc.collect()
+            tracemalloc.start()
+            try:
+                result = function()
+                return tracemalloc.get_traced_memory()[0], result
+            finally:
+                tracemalloc.stop()
+
+        json_size, json_passwords = footprint(lambda: json.loads(json_string))
+        keychain_size, keychain = footprint(lambda: Keychain(json_string))
+        self.assertLess(keychain_size, json_size,
+                        "The keychain should take less memory than the "
+                        "parsed Json, despite its indexes.")
+
+        first = keychain.get("domain0.example.com", "user0@example.com")
+        self.assertIs(first.domain,
+                      keychain.get("domain0.example.com",
+                                   "user1@example.com").domain,
+                      "Equal domains should share the same string.")
+        self.assertIs(first.login,
+                      keychain.get("domain1.example.com",
+                                   "user0@example.com").login,
+                      "Equal logins should share the same string.")
+        with self.assertRaises(AttributeError,
+                               msg="Passwords should not have a __dict__."):
+            first.comment = ""
+        self.assertEqual(json.loads(keychain.to_json()), json_passwords,
+                         "The Json export should not change.")
+
+    def test_sorted_order(self):
+        def keys(passwords):
+            return [(p.domain, p.login) for p in passwords]
+
+        self.assertEqual(keys(self.keychain.filter()), [
+            ("google.com", "my_mail@gmail.com"),
+            ("House alarm", ""),
+            ("mail.yahoo.com", "my_mail@yahoo.com"),
+            ("superwebsite.com", "my_account_login"),
+            ("Wifi Password", "")],
+            "The passwords should be sorted by domain and login, without "
+            "case.")
+
+        self.keychain.set("GOOGLE.com", "a_login", "password4")
+        self.keychain.set("zzz.com", "", "password5")
+        self.keychain.set("google.com", "Z_login", "password6")
+        passwords = self.keychain.filter()
+        self.assertEqual(passwords, sorted(passwords),
+                         "New passwords should be inserted in order.")
+        self.assertEqual(keys(passwords[:3]), [
+            ("GOOGLE.com", "a_login"),
+            ("google.com", "my_mail@gmail.com"),
+            ("google.com", "Z_login")],
+            "Domains differing by their case should be ordered by login.")
+
+        self.keychain.delete(passwords[1])
+        self.assertEqual(self.keychain.filter(), passwords[:1] + passwords[2:],
+                         "Deleting a password should keep the order.")
+        self.assertEqual(self.keychain.filter("com"),
+                         [p for p in passwords[:1] + passwords[2:]
+                          if "com" in p.domain or "com" in p.login],
+                         "The filtered passwords should be sorted.")
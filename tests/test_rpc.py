@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests for the Rpc interface
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from Journal import journal_path
+from KeyDerivation import Pbkdf2
+from Keychain import Keychain
+import ui.Rpc
+from ui.Rpc import Rpc, RpcError
+
+
+class TestRpc(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "passwords")
+        self.rpc = Rpc(self.path)
+        self.rpc._master_password = "key1234"
+        self.rpc._crypto.kdf = Pbkdf2(iterations=1000)
+        keychain = Keychain()
+        keychain.set("google.com", "me", "password1")
+        keychain.set("github.com", "me", "password2")
+        self.rpc._save_pass_file(keychain, compact=True)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def serve(self, *requests):
+        output = io.BytesIO()
+        self.rpc.serve(io.BytesIO("".join(json.dumps(request) + "\n"
+                                          for request in requests)
+                                  .encode("utf-8")), output)
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_requests(self):
+        responses = self.serve(
+            {"id": 1, "method": "get",
+             "params": {"domain": "google.com", "login": "me"}},
+            {"id": 2, "method": "get",
+             "params": {"domain": "google.com", "login": "you"}},
+            {"id": 3, "method": "filter", "params": {"pattern": "g"}},
+            {"id": 4, "method": "set",
+             "params": {"domain": "example.com", "login": "me",
+                        "password": "password3"}},
+            {"id": 5, "method": "delete",
+             "params": {"domain": "github.com", "login": "me"}},
+            {"id": 6, "method": "set",
+             "params": {"entries": [["a.com", "me", "p"],
+                                    ["b.com", "me", "p"]]}},
+            {"id": 7, "method": "delete",
+             "params": {"entries": [["a.com", "me"], ["c.com", "me"]]}},
+            {"id": 8, "method": "save"})
+        self.assertEqual([response["result"] for response in responses],
+                         ["password1", None,
+                          [["github.com", "me"], ["google.com", "me"]],
+                          True, True, 2, 1, None])
+        self.assertEqual([response["id"] for response in responses],
+                         list(range(1, 9)))
+
+        passwords = Rpc(self.path)
+        passwords._master_password = "key1234"
+        self.assertEqual([str(p) for p in
+                          passwords._load_pass_file().filter()],
+                         ["b.com\tme", "example.com\tme", "google.com\tme"])
+
+    def test_save_at_end(self):
+        self.serve({"method": "set",
+                    "params": {"domain": "example.com", "login": "me",
+                               "password": "password3"}})
+        self.rpc._cache = None
+        self.assertIsNotNone(self.rpc._load_pass_file()
+                             .get("example.com", "me"),
+                             "The changes should be saved at the end.")
+
+    def test_errors(self):
+        responses = self.serve(
+            "not an object",
+            {"id": 1, "method": "unknown"},
+            {"id": 2, "method": "get", "params": {"domain": "google.com"}},
+            {"id": 3, "method": "set", "params": {"entries": [["a.com"]]}})
+        self.assertEqual([response["id"] for response in responses],
+                         [None, 1, 2, 3])
+        self.assertTrue(all("error" in response for response in responses))
+
+        output = io.BytesIO()
+        self.rpc.serve(io.BytesIO(b"{invalid\n"), output)
+        self.assertIn("error", json.loads(output.getvalue().decode("utf-8")))
+
+    def test_file_errors(self):
+        with open(self.path, "rb") as file:
+            data = file.read()
+        get = {"id": 1, "method": "get",
+               "params": {"domain": "google.com", "login": "me"}}
+        requests = [json.dumps(request).encode("utf-8") for request in (
+            get, {"id": 2, "method": "set",
+                  "params": {"domain": "a", "login": "b", "password": "c"}},
+            {"id": 3, "method": "save"})]
+
+        self.rpc._passwords = self.rpc._load_pass_file()
+        # Another process writing the file
+        with open(self.path, "wb") as file:
+            file.write(data[:len(data) // 2])
+        self.assertIn("error", self.rpc.handle(requests[0]),
+                      "A damaged file should be reported.")
+        with open(self.path, "wb") as file:
+            file.write(data)
+        self.assertEqual(self.rpc.handle(requests[0])["result"], "password1",
+                         "The file should be loaded once restored.")
+
+        self.assertTrue(self.rpc.handle(requests[1])["result"])
+        # The journal can't be written
+        os.mkdir(journal_path(self.path))
+        self.assertIn("error", self.rpc.handle(requests[2]),
+                      "A failed save should be reported.")
+
+    def test_no_terminal(self):
+        rpc = Rpc(self.path)
+        rpc._use_agent = False
+        rpc._master_password = "wrong"
+        terminal = ui.Rpc.TERMINAL
+        ui.Rpc.TERMINAL = os.path.join(self.directory.name, "tty")
+        try:
+            requests = io.BytesIO(b'{"method": "save"}\n')
+            output = io.BytesIO()
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.assertRaises(RpcError, rpc.serve, requests, output)
+            self.assertEqual(requests.tell(), 0,
+                             "The password should not be read on the input.")
+            self.assertEqual(output.getvalue(), b"",
+                             "Nothing should be written on the output.")
+        finally:
+            ui.Rpc.TERMINAL = terminal
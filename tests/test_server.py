@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+#     mdp - Unit tests for the Server interface
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import asyncio
+import json
+import os
+import tempfile
+from unittest import TestCase, skipUnless
+
+import Agent
+from KeyDerivation import Pbkdf2
+from Keychain import Keychain
+from ui.Rpc import Rpc
+from ui.Server import ReadWriteLock, Server
+
+
+class TestServer(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "passwords")
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self.server = Server(self.path)
+        self.server._master_password = "key1234"
+        self.server._crypto.kdf = Pbkdf2(iterations=1000)
+        keychain = Keychain()
+        keychain.set("google.com", "me", "password1")
+        self.server._save_pass_file(keychain, compact=True)
+        self.server.start(self.loop)
+
+        # Counting the saves
+        self.saves = 0
+        save_pass_file = self.server._save_pass_file
+
+        def counting_save(*args, **kwargs):
+            self.saves += 1
+            save_pass_file(*args, **kwargs)
+        self.server._save_pass_file = counting_save
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.directory.cleanup()
+
+    def request(self, method, **params):
+        return json.dumps({"id": 1, "method": method, "params": params})
+
+    def test_concurrent_requests(self):
+        async def requests():
+            sets = [self.server.handle_request(
+                self.request("set", domain="example.com",
+                             login="login{0}".format(i), password="p"))
+                for i in range(20)]
+            gets = [self.server.handle_request(
+                self.request("get", domain="google.com", login="me"))
+                for i in range(20)]
+            return await asyncio.gather(*(sets + gets))
+
+        responses = self.loop.run_until_complete(requests())
+        self.assertEqual([response["result"] for response in responses],
+                         [True] * 20 + ["password1"] * 20)
+        self.assertEqual(self.saves, 1,
+                         "The concurrent changes should be saved at once.")
+
+        reader = Rpc(self.path)
+        reader._master_password = "key1234"
+        self.assertEqual(len(reader._load_pass_file()), 21)
+
+    def test_external_change(self):
+        other = Rpc(self.path)
+        other._master_password = "key1234"
+        passwords = other._load_pass_file()
+        passwords.set("github.com", "me", "password2")
+        other._save_pass_file(passwords)
+
+        # Checking the file again
+        self.server._last_check = 0
+        response = self.loop.run_until_complete(self.server.handle_request(
+            self.request("filter", pattern="hub")))
+        self.assertEqual(response["result"], [["github.com", "me"]])
+        self.assertIsNotNone(self.server._passwords._trigram_index,
+                             "The file loaded again should be indexed.")
+
+    @skipUnless(Agent.is_supported(), "Unix domain sockets are not supported")
+    def test_unix_socket(self):
+        socket_path = os.path.join(self.directory.name, "server.sock")
+
+        async def client():
+            listener = await self.server.listen_unix(socket_path)
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            writer.write(self.request("set", domain="a.com", login="me",
+                                      password="p").encode() + b"\n")
+            writer.write(self.request("filter").encode() + b"\n")
+            responses = [json.loads((await reader.readline()).decode())
+                         for i in range(2)]
+            writer.close()
+            await self.server.stop([listener])
+            return responses
+
+        responses = self.loop.run_until_complete(client())
+        self.assertEqual([response["result"] for response in responses],
+                         [True, [["a.com", "me"], ["google.com", "me"]]])
+        self.assertEqual(os.stat(socket_path).st_mode & 0o077, 0,
+                         "Only the user should access the socket.")
+
+    def test_http(self):
+        async def client(token):
+            listener, token = await self.server.listen_http(token=token)
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            responses = []
+            for authorization in ("Bearer secret", "Bearer wrong"):
+                body = self.request("get", domain="google.com",
+                                    login="me").encode()
+                writer.write("POST / HTTP/1.1\r\n"
+                             "Authorization: {0}\r\n"
+                             "Content-Length: {1}\r\n\r\n"
+                             .format(authorization, len(body)).encode() + body)
+                status = (await reader.readline()).split()[1]
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line == b"\r\n":
+                        break
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                responses.append((int(status), json.loads(
+                    (await reader.readexactly(length)).decode())))
+            writer.close()
+            await self.server.stop([listener])
+            return responses
+
+        (status, response), (wrong_status, wrong_response) = \
+            self.loop.run_until_complete(client("secret"))
+        self.assertEqual((status, response["result"]), (200, "password1"))
+        self.assertEqual(wrong_status, 401,
+                         "A request without the token should be refused.")
+
+    def test_read_write_lock(self):
+        lock = ReadWriteLock()
+        events = []
+
+        async def read(name, delay):
+            async with lock.reading():
+                events.append(name)
+                await asyncio.sleep(delay)
+                events.append(name)
+
+        async def write(name):
+            async with lock.writing():
+                events.append(name)
+                await asyncio.sleep(0)
+                events.append(name)
+
+        async def scenario():
+            first = self.loop.create_task(read("r1", 0.02))
+            await asyncio.sleep(0)
+            second = self.loop.create_task(read("r2", 0.01))
+            await asyncio.sleep(0)
+            # Waiting for the readers, the next reader waiting for it
+            third = self.loop.create_task(write("w"))
+            await asyncio.sleep(0)
+            fourth = self.loop.create_task(read("r3", 0))
+            await asyncio.gather(first, second, third, fourth)
+
+        self.loop.run_until_complete(scenario())
+        self.assertEqual(events, ["r1", "r2", "r2", "r1", "w", "w",
+                                  "r3", "r3"])
+
+    def test_cancelled_writer(self):
+        lock = ReadWriteLock()
+        events = []
+
+        async def read(name, delay):
+            async with lock.reading():
+                events.append(name)
+                await asyncio.sleep(delay)
+                events.append(name)
+
+        async def write():
+            async with lock.writing():
+                events.append("w")
+
+        async def scenario():
+            first = self.loop.create_task(read("r1", 0.05))
+            await asyncio.sleep(0)
+            writer = self.loop.create_task(write())
+            await asyncio.sleep(0)
+            second = self.loop.create_task(read("r2", 0))
+            await asyncio.sleep(0)
+            writer.cancel()
+            await asyncio.gather(first, second)
+
+        self.loop.run_until_complete(scenario())
+        self.assertEqual(events, ["r1", "r2", "r2", "r1"],
+                         "The readers waiting for a cancelled writer should "
+                         "go on.")
+
+    def test_damaged_file(self):
+        with open(self.path, "rb") as file:
+            data = file.read()
+        # Another process writing the file
+        with open(self.path, "wb") as file:
+            file.write(data[:len(data) // 2])
+
+        self.server._last_check = 0
+        response = self.loop.run_until_complete(self.server.handle_request(
+            self.request("get", domain="google.com", login="me")))
+        self.assertIn("error", response,
+                      "A damaged file should be reported.")
+
+        with open(self.path, "wb") as file:
+            file.write(data)
+        self.server._last_check = 0
+        response = self.loop.run_until_complete(self.server.handle_request(
+            self.request("get", domain="google.com", login="me")))
+        self.assertEqual(response["result"], "password1",
+                         "The keychain should be kept.")
@@ -17,9 +17,14 @@
 #     with this program; if not, write to the Free Software Foundation, Inc.,
 #     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+from contextlib import contextmanager
 from getpass import getpass
+import hashlib
+import io
+import os
 from os import path
 import sys
+import tempfile
 
 # l10n configuration
 # To generate POT file:
@@ -41,74 +46,312 @@ except FileNotFoundError:
     # If the localization is not found, fall back to the default strings.
     _ = lambda s: s
 
-from Cryptography import Cryptography, CorruptedError
+import Agent
+from CryptoBackend import BACKENDS, MissingBackendError
+from Cryptography import Cryptography, CorruptedError, DerivedKey
+from Journal import Journal, journal_path, new_snapshot_id
+from KeyDerivation import DEFAULT_TARGET, default_key_derivation
 from Keychain import Keychain
 
 
+# Format of the keychain inside the encrypted files, named in their metadata.
+# The files without it are in Json.
+KEYCHAIN_FORMAT = "binary"
+# Bytes hashed at the start of the files to identify their versions. They
+# hold the header, which changes each time a file is written.
+FINGERPRINT_SIZE = 4096
+
+
+def file_fingerprint(file_path):
+    """ Identifies the current version of a password file and of its journal,
+    without decrypting them
+    :return: The device, inode, modification time and size of the file, a
+    hash of its first bytes, and the inode, modification time and size of
+    its journal if it exists
+    :rtype: tuple
+    :raise OSError: If the file can't be read
+    """
+    with open(file_path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        digest = hashlib.sha256(file.read(FINGERPRINT_SIZE)).digest()
+    try:
+        journal_stat = os.stat(journal_path(file_path))
+        journal = (journal_stat.st_ino, journal_stat.st_mtime_ns,
+                   journal_stat.st_size)
+    except FileNotFoundError:
+        journal = None
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size, digest,
+            journal)
+
+
+class LoadError(Exception):
+    """ Raised when the password file can't be loaded, with the message
+    shown to the user
+    """
+
+
+def replace_file(file_path, write):
+    """ Writes a file atomically: it is written to a temporary file next to
+    it, which then replaces it. The other processes read either the previous
+    content or the new one, and the previous one is kept if writing fails.
+    :param write: Function writing the content to the binary file given
+    """
+    # Next to the file a symbolic link points to, rather than replacing it
+    file_path = os.path.realpath(file_path)
+    fd, temp_path = tempfile.mkstemp(
+        prefix=".{0}.".format(os.path.basename(file_path)), suffix=".tmp",
+        dir=os.path.dirname(file_path))
+    try:
+        with open(fd, 'wb') as file:
+            if hasattr(os, "fchmod") and os.path.exists(file_path):
+                os.fchmod(fd, os.stat(file_path).st_mode & 0o7777)
+            write(file)
+            file.flush()
+            os.fsync(fd)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
 class BaseInterface:
     """ Base class for all user interfaces
     """
 
     def __init__(self, file_path):
+        # Password typed by the user, or DerivedKey given by the agent
         self._master_password = None
         self._file_path = file_path
+        # Asking the agent for the key before prompting for the password
+        self._use_agent = True
+        # Changes saved since the file has been fully written
+        self._journal = None
+        # Fingerprint of the file and keychain last loaded or saved, to not
+        # decrypt the file again while it is unchanged
+        self._cache = None
+        # Kept between loading and saving to reuse the derived key
+        try:
+            self._crypto = Cryptography()
+        except MissingBackendError:
+            print(_("mdp: Error: No cryptography library found, please "
+                    "install one of them: {libraries}")
+                  .format(libraries=", ".join(BACKENDS)), file=sys.stderr)
+            sys.exit(1)
 
     def start(self):
         pass
 
     def _load_pass_file(self):
+        """ Loads passwords from the crypted Json file, exiting with an
+        error if it can't be loaded
+        :return: List of the passwords in the file
+        :rtype : Keychain
+        """
+        try:
+            return self._read_pass_file()
+        except LoadError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+    def _read_pass_file(self, ask_password=True):
         """ Loads passwords from the crypted Json file
+        The keychain is kept in memory, and returned again as long as
+        neither the file nor its journal have been modified, and the keychain
+        has no unsaved changes.
+        :param ask_password: Asks the user for the password if it is
+        unknown or wrong, rather than failing
         :return: List of the passwords in the file
         :rtype : Keychain
+        :raise LoadError: If the file is corrupted, or the password is wrong
+        and can't be asked
+        :raise OSError: If the file can't be read
         """
+        # Taken before reading, a change made meanwhile is detected next time
+        fingerprint = file_fingerprint(self._file_path)
+        if self._cache is not None:
+            cached_fingerprint, passwords = self._cache
+            if cached_fingerprint == fingerprint and not passwords.is_dirty:
+                return passwords
+            self._cache = None
+
+        c = self._crypto
+        if self._master_password is None and self._use_agent:
+            self._master_password = Agent.get_key(self._file_path)
+
+        file_decrypted = None
+        binary = False
+        typed = False
         with open(self._file_path, 'rb') as file:
-            file_crypted = file.read()
-
-        c = Cryptography()
-        correct_password = False
-        while not correct_password:
-            if self._master_password is not None:
-                try:
-                    correct_password = c.validate(file_crypted,
-                                                  self._master_password)
-                except CorruptedError:
-                    print(_("mdp: Error: The file '{filename}' seems to be"
-                            "corrupted.").format(filename=self._file_path),
-                          file=sys.stderr)
-                    sys.exit(1)
-
-            if not correct_password:
+            while file_decrypted is None:
                 if self._master_password is not None:
-                    print(_("Wrong password, try again."))
-                self._master_password = getpass(prompt=_("Password: "))
+                    try:
+                        # Checking the password and decrypting in a single
+                        # pass, without loading the encrypted file in memory
+                        file.seek(0)
+                        buffer = io.BytesIO()
+                        if c.decrypt_stream(file, buffer,
+                                            self._master_password):
+                            binary = c.metadata.get("format") == "binary"
+                            file_decrypted = buffer.getvalue()
+                            if not binary:
+                                file_decrypted = \
+                                    file_decrypted.decode("utf-8")
+                    except CorruptedError:
+                        raise LoadError(_("mdp: Error: The file '{filename}' "
+                                          "seems to be corrupted.")
+                                        .format(filename=self._file_path))
+                    except UnicodeDecodeError:
+                        # Wrong password on a file in the legacy format
+                        file_decrypted = None
 
-        try:
-            file_decrypted = c.decrypt(file_crypted, self._master_password)
-        except UnicodeDecodeError as e:
-            print(_("mdp: Error: Unable to decrypt the file. {error}")
-                  .format(error=e.__str__()),
-                  file=sys.stderr)
-            sys.exit(1)
+                if file_decrypted is None and not ask_password:
+                    raise LoadError(_("mdp: Error: The password of the file "
+                                      "'{filename}' has changed.")
+                                    .format(filename=self._file_path))
+                if file_decrypted is None:
+                    # The key of the agent is outdated if the key derivation
+                    # of the file has been tuned since
+                    if self._master_password is not None and \
+                            not isinstance(self._master_password, DerivedKey):
+                        print(_("Wrong password, try again."),
+                              file=sys.stderr)
+                    self._master_password = self._ask_password()
+                    typed = True
+
+        if typed:
+            self._remember_key()
+
+        # Each password may be encrypted again inside the file, to be
+        # decrypted only when it is used
+        cipher = None
+        if c.metadata.get("entries") == "sealed":
+            cipher = c.entry_cipher(self._master_password)
 
         try:
-            passwords = Keychain(file_decrypted)
+            if binary:
+                passwords = Keychain.from_binary(file_decrypted, cipher)
+            else:
+                passwords = Keychain(file_decrypted, cipher)
         except ValueError as e:
-            print(_("mdp: Error: Unable to parse the file. {error}")
-                  .format(error=e.__str__()),
-                  file=sys.stderr)
-            sys.exit(1)
+            raise LoadError(_("mdp: Error: Unable to parse the file. {error}")
+                            .format(error=e.__str__()))
+
+        # Replaying the changes saved after the file
+        self._journal = None
+        snapshot_id = c.metadata.get("journal")
+        if snapshot_id is not None:
+            try:
+                self._journal = Journal(journal_path(self._file_path),
+                                        bytes.fromhex(snapshot_id),
+                                        c.journal_key(self._master_password))
+                passwords.apply(self._journal.read())
+            except (CorruptedError, ValueError, TypeError):
+                raise LoadError(_("mdp: Error: The file '{filename}' seems "
+                                  "to be corrupted.")
+                                .format(filename=journal_path(
+                                    self._file_path)))
 
+        self._cache = (fingerprint, passwords)
         return passwords
 
-    def _save_pass_file(self, passwords):
+    def _ask_password(self):
+        """ Asks the user for the master password
+        :rtype: str
+        """
+        return getpass(prompt=_("Password: "))
+
+    def _remember_key(self):
+        """ Gives the key of the file to the agent, if it is running, so that
+        the next runs don't ask for the password
+        """
+        if not isinstance(self._master_password, DerivedKey):
+            Agent.add_key(self._file_path,
+                          self._crypto.derived_key(self._master_password))
+
+    def _save_pass_file(self, passwords, compact=False):
         """ Encrypt and save a Json file containing the passwords
+        Once the file has been loaded, only the changes made to the keychain
+        are appended to its journal, until the journal grows too long.
         :param passwords: List of the passwords to write
         :type passwords: Keychain
+        :param compact: Writes the whole file, even if nothing has changed
+        or if the journal could be used
+        """
+        if not compact and not passwords.is_dirty:
+            # Nothing to write, for instance when set() did not replace an
+            # existing password
+            passwords.mark_clean()
+            return
+
+        # Until the file is written, the keychain may not match it
+        self._cache = None
+        c = self._crypto
+        cipher = c.entry_cipher(self._master_password)
+        # Kept until they are written, in case writing fails
+        operations = passwords.pending_operations()
+        journal = self._journal
+        if not compact and journal is not None and \
+                passwords.cipher == cipher and \
+                not journal.needs_compaction(len(operations)):
+            records = journal.records
+            if not operations or journal.append(operations):
+                passwords.mark_clean()
+                if journal.records == records + len(operations):
+                    self._cache = (file_fingerprint(self._file_path),
+                                   passwords)
+                # Otherwise, the changes appended by another process are
+                # missing, the file is loaded again next time
+                return
+
+        # Keeping each password encrypted, this also upgrades older files
+        passwords.seal(cipher)
+        if KEYCHAIN_FORMAT == "binary":
+            exported = io.BytesIO(passwords.to_binary())
+        else:
+            exported = io.BytesIO(passwords.to_json().encode("utf-8"))
+
+        # The journal of the previous file, already included, is ignored
+        # from now on
+        snapshot_id = new_snapshot_id()
+        replace_file(self._file_path, lambda file: c.encrypt_stream(
+            exported, file, self._master_password,
+            metadata={"entries": "sealed",
+                      "format": KEYCHAIN_FORMAT,
+                      "journal": snapshot_id.hex()}))
+
+        self._journal = Journal(journal_path(self._file_path), snapshot_id,
+                                c.journal_key(self._master_password))
+        self._journal.remove()
+        passwords.mark_clean()
+        self._cache = (file_fingerprint(self._file_path), passwords)
+
+    @contextmanager
+    def _transaction(self, passwords):
+        """ Context manager modifying the keychain atomically, and saving it
+        once at the end, unless an exception is raised.
+        :type passwords: Keychain
+        """
+        with passwords.transaction():
+            yield passwords
+        self._save_pass_file(passwords)
+
+    def tune_kdf(self, target=DEFAULT_TARGET):
+        """ Calibrates the key derivation for this machine and saves the file
+        with the new parameters.
+        :param target: Unlock time aimed, in seconds
+        :return: The new key derivation function
+        :rtype: KeyDerivation
         """
-        json_passwords = passwords.to_json()
+        # The password is needed to derive the new key
+        self._use_agent = False
+        passwords = self._load_pass_file()
 
-        c = Cryptography()
-        crypted_passwords = c.encrypt(json_passwords, self._master_password)
+        kdf = type(default_key_derivation()).calibrate(target)
+        self._crypto.kdf = kdf
+        self._save_pass_file(passwords, compact=True)
+        self._remember_key()
 
-        with open(self._file_path, 'wb') as file:
-            file.write(crypted_passwords)
+        return kdf
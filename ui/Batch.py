@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+#     mdp - Non-interactive user interface, for the scripts
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import errno
+from getpass import getpass
+import os
+from os import path
+import shlex
+import sys
+
+# l10n configuration
+# To generate POT file:
+# $ xgettext --language=Python --keyword=_ --add-comments="." --output=./locale/mdp.pot *.py ui/*.py
+import locale
+import gettext
+# ./../locale
+locale_dir = path.join(path.dirname(path.dirname(path.realpath(__file__))),
+                       'locale')
+USER_LOCALE = locale.getlocale()[0]
+USER_LOCALE = USER_LOCALE if USER_LOCALE is not None else 'en'
+try:
+    # Trying to get the translations given the user localization.
+    lang = gettext.translation('mdp',
+                               localedir=locale_dir,
+                               languages=[USER_LOCALE])
+    lang.install()
+except FileNotFoundError:
+    # If the localization is not found, fall back to the default strings.
+    _ = lambda s: s
+
+import JsonCodec
+from ui.BaseInterface import BaseInterface
+
+
+# Minimum and maximum numbers of arguments of each command
+COMMANDS = {'get': (1, 2),
+            'set': (3, 3),
+            'del': (2, 2),
+            'list': (0, 1),
+            'export': (0, 1)}
+
+
+class BatchError(Exception):
+    """ Raised when a command is invalid or fails, nothing is saved then
+    """
+
+    def __init__(self, message, code=errno.EINVAL):
+        """
+        :param message: Error shown to the user
+        :param code: Exit status of the program
+        """
+        super().__init__(message)
+        self.code = code
+
+
+def parse_command(args):
+    """ Checks a command and its arguments
+    :param args: Name of the command followed by its arguments
+    :return: The name of the command and the list of its arguments
+    :rtype: tuple
+    :raise BatchError: If the command is unknown or has wrong arguments
+    """
+    if len(args) == 0 or args[0] not in COMMANDS:
+        raise BatchError(_("unknown command: {0}")
+                         .format(args[0] if args else ""))
+    name, arguments = args[0], list(args[1:])
+    min_args, max_args = COMMANDS[name]
+    if not min_args <= len(arguments) <= max_args:
+        raise BatchError(_("wrong number of arguments for {0}").format(name))
+    return name, arguments
+
+
+def read_batch(file):
+    """ Reads the commands of a batch, one per line, with their arguments
+    quoted like in a shell. Empty lines and comments starting with # are
+    ignored.
+    :param file: Text file of the commands
+    :return: The list of the commands returned by parse_command()
+    :rtype: list
+    :raise BatchError: If a line is invalid, with its number
+    """
+    commands = []
+    for number, line in enumerate(file, 1):
+        try:
+            args = shlex.split(line, comments=True)
+            if args:
+                commands.append(parse_command(args))
+        except (ValueError, BatchError) as e:
+            raise BatchError(_("line {number}: {error}")
+                             .format(number=number, error=e))
+    return commands
+
+
+def read_password():
+    """ Reads the password of a new entry on the terminal, or from the first
+    line of the standard input if it is redirected
+    :rtype: str
+    """
+    if sys.stdin.isatty():
+        return getpass(_("Password for this account > "))
+    return sys.stdin.readline().rstrip("\n")
+
+
+class Batch(BaseInterface):
+    """ Executes commands without any interaction, for the scripts
+    """
+
+    def __init__(self, file_path, output=None):
+        """
+        :param output: Text file the results are written to, the standard
+        output by default
+        """
+        super().__init__(file_path)
+        self._output = output if output is not None else sys.stdout
+
+    def run(self, commands):
+        """ Executes commands, unlocking the file once and saving it once at
+        the end. If one of them fails, none of the modifications is saved.
+        Consecutive set and del commands are applied together.
+        :param commands: List of the commands returned by parse_command()
+        :raise BatchError: If a command fails
+        """
+        passwords = self._load_pass_file()
+
+        with self._transaction(passwords):
+            to_set = []
+            to_delete = {}
+            for name, args in commands:
+                if name != 'set' and to_set:
+                    passwords.set_many(to_set, replace=True)
+                    to_set = []
+                if name != 'del' and to_delete:
+                    passwords.delete_many(to_delete)
+                    to_delete = {}
+
+                if name == 'set':
+                    to_set.append(tuple(args))
+                elif name == 'del':
+                    password_obj = passwords.get(*args)
+                    if password_obj is None or password_obj in to_delete:
+                        raise self._not_found(*args)
+                    to_delete[password_obj] = None
+                elif name == 'get':
+                    self._get(passwords, *args)
+                elif name == 'list':
+                    for password_obj in passwords.filter(*args):
+                        print(password_obj, file=self._output)
+                elif name == 'export':
+                    self._export(passwords, *args)
+
+            passwords.set_many(to_set, replace=True)
+            passwords.delete_many(to_delete)
+
+    def _get(self, passwords, domain, login=None):
+        """ Prints the password of an entry, the login being optional if
+        the domain has a single one
+        """
+        if login is not None:
+            password_obj = passwords.get(domain, login)
+        else:
+            matches = [p for p in passwords.filter(domain)
+                       if p.domain == domain]
+            if len(matches) > 1:
+                raise BatchError(_("several logins for {domain}, please "
+                                   "give one of them")
+                                 .format(domain=domain))
+            password_obj = matches[0] if matches else None
+
+        if password_obj is None:
+            raise self._not_found(domain, login)
+        print(password_obj.password, file=self._output)
+
+    def _export(self, passwords, file_path=None):
+        """ Writes the entries with their passwords in clear, in the Json
+        format of the older files. The file is only readable by the user.
+        """
+        exported = JsonCodec.dumps([{"domain": p.domain,
+                                     "login": p.login,
+                                     "password": p.password}
+                                    for p in passwords.filter()], indent=4)
+        if file_path is None:
+            print(exported, file=self._output)
+        else:
+            try:
+                fd = os.open(file_path, os.O_WRONLY | os.O_CREAT |
+                             os.O_TRUNC, 0o600)
+                with open(fd, 'w', encoding="utf-8") as file:
+                    if hasattr(os, "fchmod"):
+                        # The mode is only given to a new file
+                        os.fchmod(fd, 0o600)
+                    file.write(exported)
+            except OSError as e:
+                raise BatchError(_("unable to write {filename}: {error}")
+                                 .format(filename=file_path,
+                                         error=e.strerror), e.errno)
+
+    @staticmethod
+    def _not_found(domain, login=None):
+        return BatchError(_("no account for {domain} {login}")
+                          .format(domain=domain, login=login or "").strip(),
+                          errno.ENOENT)
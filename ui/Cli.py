@@ -66,6 +66,7 @@ except Exception as e:
           .format(error=e), file=sys.stderr)
     sys.exit(1)
 
+from Cryptography import CorruptedError
 from Keychain import Keychain
 from ui.BaseInterface import BaseInterface
 
@@ -105,7 +106,8 @@ class Cli(BaseInterface):
                 self._master_password = new_password
                 password_match = True
 
-        self._save_pass_file(Keychain())
+        self._save_pass_file(Keychain(), compact=True)
+        self._remember_key()
 
     def start(self):
         colorama.init(autoreset=True)
@@ -157,7 +159,12 @@ class Cli(BaseInterface):
                 number = -1
 
         # Put the password into the clipboard
-        pwd = match_passwords[number-1].password
+        try:
+            pwd = match_passwords[number-1].password
+        except CorruptedError:
+            print(_("mdp: Error: The password of this account seems to be "
+                    "corrupted."), file=sys.stderr)
+            return
         pyperclip.copy(pwd)
         print(_("The password have been copied in the clipboard."))
         # TODO: Ask the user if he wants to see the password
@@ -229,9 +236,6 @@ class Cli(BaseInterface):
             except ValueError:
                 numbers = ()
 
-        # Deletes the selected entries
-        for i in reversed(numbers):
-            passwords.delete(match_passwords[i-1])
-
-        # And finally save the changes
-        self._save_pass_file(passwords)
+        # Deletes the selected entries and saves the changes at once
+        with self._transaction(passwords):
+            passwords.delete_many(match_passwords[i-1] for i in numbers)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+#     mdp - Json-lines RPC interface, for the programs running mdp
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Lets another program use mdp as a co-process: the password file is
+unlocked once, then each line read on the standard input is a Json request,
+answered by a line on the standard output.
+
+A request is an object {"id": id, "method": name, "params": {...}}, the id
+being optional and returned in the response, which is either
+{"id": id, "result": value} or {"id": id, "error": message}.
+The methods are:
+ - get {domain, login}: the password of the account, or null,
+ - filter {pattern, ignore_case}: the [domain, login] of the accounts
+   matching the pattern, the parameters being optional,
+ - set {domain, login, password, replace}: defines a password, replacing
+   the existing one unless replace is false, returns if it has been stored,
+ - set {entries, replace}: the same for a list of [domain, login, password],
+   returns the number of passwords stored,
+ - delete {domain, login}: deletes an account, returns if it existed,
+ - delete {entries}: the same for a list of [domain, login], returns the
+   number of accounts deleted,
+ - save: writes the changes to the file.
+The changes not saved yet are saved at the end of the input. While there
+are none, the file is loaded again if another process modifies it.
+
+The password is asked on the terminal, never on the standard input, unless
+the agent knows the key of the file.
+"""
+
+import os
+import sys
+
+import JsonCodec
+from ui.BaseInterface import BaseInterface, LoadError
+
+
+# Terminal the password is asked on
+TERMINAL = "/dev/tty"
+
+
+class RpcError(Exception):
+    """ Raised when a request is invalid, its message is sent back
+    """
+
+
+def _param(params, name, types=str, default=None):
+    """ Gets a parameter of a request
+    :param types: Type or tuple of types expected
+    :param default: Value if the parameter is missing, it is required if None
+    :raise RpcError: If the parameter is missing or of another type
+    """
+    value = params.get(name, default)
+    if value is None or not isinstance(value, types):
+        raise RpcError("Invalid or missing parameter: {0}".format(name))
+    return value
+
+
+def _entries(params, size):
+    """ Gets the list of entries of a request, each one being a list of size
+    strings
+    :rtype: list
+    """
+    entries = _param(params, "entries", list)
+    if not all(isinstance(entry, list) and len(entry) == size and
+               all(isinstance(field, str) for field in entry)
+               for entry in entries):
+        raise RpcError("Invalid entries")
+    return entries
+
+
+class Rpc(BaseInterface):
+    """ Answers Json requests read line by line, see the module
+        documentation
+    """
+
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self._passwords = None
+        self._methods = {"get": self._get,
+                         "filter": self._filter,
+                         "set": self._set,
+                         "delete": self._delete,
+                         "save": self._save}
+
+    def serve(self, input_file=None, output_file=None):
+        """ Answers the requests until the end of the input
+        :param input_file: Binary file of the requests, the standard input
+        by default
+        :param output_file: Binary file of the responses, the standard
+        output by default
+        """
+        input_file = input_file if input_file is not None \
+            else sys.stdin.buffer
+        output_file = output_file if output_file is not None \
+            else sys.stdout.buffer
+
+        self._passwords = self._load_pass_file()
+        for line in input_file:
+            if not line.strip():
+                continue
+            response = self.handle(line)
+            output_file.write(JsonCodec.dumps(response).encode("utf-8") +
+                              b"\n")
+            output_file.flush()
+
+        if self._passwords.is_dirty:
+            self._save_pass_file(self._passwords)
+
+    def handle(self, line):
+        """ Executes a request
+        :param line: Json request
+        :return: The response
+        :rtype: dict
+        """
+        try:
+            request = JsonCodec.loads(line)
+        except ValueError:
+            return {"id": None, "error": "Invalid Json"}
+
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            method, params = self._parse(request)
+            if not self._passwords.is_dirty:
+                # Cheap while the file is unchanged
+                self._passwords = self._reload()
+            return {"id": request_id, "result": method(params)}
+        except RpcError as e:
+            return {"id": request_id, "error": str(e)}
+        except OSError as e:
+            return {"id": request_id,
+                    "error": "Unable to save: {0}".format(e.strerror)}
+
+    def _reload(self):
+        """ Loads the file again if another process has modified it, never
+        asking the password meanwhile
+        :rtype: Keychain
+        :raise RpcError: If the file can't be loaded, the keychain in memory
+        is kept then
+        """
+        try:
+            return self._read_pass_file(ask_password=False)
+        except LoadError as e:
+            raise RpcError(str(e))
+        except OSError as e:
+            raise RpcError("Unable to read the file: {0}".format(e.strerror))
+
+    def _parse(self, request):
+        """ Checks a request
+        :param request: Decoded Json request
+        :return: The function executing the method, and its parameters
+        :rtype: tuple
+        :raise RpcError: If the request is invalid
+        """
+        if not isinstance(request, dict):
+            raise RpcError("Expecting a Json object")
+        method = self._methods.get(request.get("method"))
+        if method is None:
+            raise RpcError("Unknown method: {0}"
+                           .format(request.get("method")))
+        params = request.get("params", {})
+        if not isinstance(params, dict):
+            raise RpcError("Expecting an object of parameters")
+        return method, params
+
+    def _get(self, params):
+        password_obj = self._passwords.get(_param(params, "domain"),
+                                           _param(params, "login"))
+        return password_obj.password if password_obj is not None else None
+
+    def _filter(self, params):
+        passwords = self._passwords.filter(
+            _param(params, "pattern", default=""),
+            _param(params, "ignore_case", bool, False))
+        return [[p.domain, p.login] for p in passwords]
+
+    def _set(self, params):
+        replace = _param(params, "replace", bool, True)
+        if "entries" in params:
+            return self._passwords.set_many(_entries(params, 3), replace)
+        return self._passwords.set(_param(params, "domain"),
+                                   _param(params, "login"),
+                                   _param(params, "password"), replace)
+
+    def _delete(self, params):
+        if "entries" in params:
+            return self._passwords.delete_many(
+                self._passwords.get(domain, login)
+                for domain, login in _entries(params, 2))
+        password_obj = self._passwords.get(_param(params, "domain"),
+                                           _param(params, "login"))
+        return password_obj is not None and \
+            self._passwords.delete(password_obj)
+
+    def _save(self, params):
+        self._save_pass_file(self._passwords)
+        return None
+
+    def _ask_password(self):
+        """ Asks the password on the terminal, as getpass() would read the
+        requests on the standard input without it
+        :raise RpcError: If the process has no terminal
+        """
+        if os.name == "posix":
+            try:
+                os.close(os.open(TERMINAL, os.O_RDWR | os.O_NOCTTY))
+            except OSError:
+                raise RpcError("No terminal to ask the password, start the "
+                               "agent with the key of the file")
+        return super()._ask_password()
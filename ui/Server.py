@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+
+#     mdp - Local secret service, over a Unix socket or HTTP
+#     Copyright (C) 2015 Pierre Faivre
+#
+#     This program is free software; you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation; either version 3 of the License, or
+#     any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License along
+#     with this program; if not, write to the Free Software Foundation, Inc.,
+#     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+""" Serves the requests of the Rpc interface to many local clients at once,
+keeping the password file unlocked.
+
+The clients connect either to a Unix domain socket only accessible to the
+user, sending a Json request per line like to the Rpc interface, or to an
+HTTP server only listening on the loopback interface, sending each request
+as the body of a POST, with the header "Authorization: Bearer <token>", the
+token being written in a file only readable by the user.
+
+The requests are served by asyncio: the reads run concurrently, the writes
+wait for them and run one at a time. The changes are saved in the
+background, those made by concurrent clients being saved together, and a
+write is only answered once it is saved. If saving fails, the client gets an
+error, but the change stays in memory, visible to the other clients, and is
+saved again with the next change or when the server stops.
+
+The password is only asked when the server starts. If another process makes
+the file unreadable with it, the requests are answered an error, the
+keychain in memory being kept.
+"""
+
+import asyncio
+import hmac
+import os
+from os import path
+import signal
+import socket
+import stat
+
+# l10n configuration
+# To generate POT file:
+# $ xgettext --language=Python --keyword=_ --add-comments="." --output=./locale/mdp.pot *.py ui/*.py
+import locale
+import gettext
+# ./../locale
+locale_dir = path.join(path.dirname(path.dirname(path.realpath(__file__))),
+                       'locale')
+USER_LOCALE = locale.getlocale()[0]
+USER_LOCALE = USER_LOCALE if USER_LOCALE is not None else 'en'
+try:
+    # Trying to get the translations given the user localization.
+    lang = gettext.translation('mdp',
+                               localedir=locale_dir,
+                               languages=[USER_LOCALE])
+    lang.install()
+except FileNotFoundError:
+    # If the localization is not found, fall back to the default strings.
+    _ = lambda s: s
+
+import Agent
+import JsonCodec
+from ui.BaseInterface import file_fingerprint
+from ui.Rpc import Rpc, RpcError
+
+
+# Time waited for other changes before saving, in seconds
+SAVE_DELAY = 0.01
+# Minimum time between two checks of the file for changes made by another
+# process, in seconds
+CHECK_INTERVAL = 0.1
+# Maximum size of a request, in bytes
+MAX_REQUEST_SIZE = 16 * 1024 * 1024
+_HTTP_STATUS = {200: "OK", 400: "Bad Request", 401: "Unauthorized",
+                405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+def default_socket_path():
+    """ Returns the path of the socket of the server by default
+    :rtype: str
+    """
+    return os.path.join(Agent.private_directory(), "server.sock")
+
+
+def token_path():
+    """ Returns the path of the file of the token of the HTTP server
+    :rtype: str
+    """
+    return os.path.join(Agent.private_directory(), "server.token")
+
+
+class _Locked:
+    """ Asynchronous context manager of ReadWriteLock
+    """
+
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    async def __aenter__(self):
+        await self._acquire()
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self._release()
+
+
+class ReadWriteLock:
+    """ Lock of asyncio letting in either many readers or a single writer.
+        The writers go first: once one is waiting, the next readers wait
+        too, so that a steady flow of reads can't delay the writes forever.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def reading(self):
+        """ Returns an asynchronous context manager holding the lock as a
+        reader
+        """
+        return _Locked(self._acquire_read, self._release_read)
+
+    def writing(self):
+        """ Returns an asynchronous context manager holding the lock as a
+        writer
+        """
+        return _Locked(self._acquire_write, self._release_write)
+
+    async def _acquire_read(self):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._writer and self._waiting_writers == 0)
+            self._readers += 1
+
+    async def _release_read(self):
+        async with self._condition:
+            self._readers -= 1
+            self._condition.notify_all()
+
+    async def _acquire_write(self):
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(
+                    lambda: not self._writer and self._readers == 0)
+            finally:
+                self._waiting_writers -= 1
+                # The readers waiting for it may go now if it is cancelled
+                self._condition.notify_all()
+            self._writer = True
+
+    async def _release_write(self):
+        async with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+
+class Server(Rpc):
+    """ Answers the requests of many clients, see the module documentation
+    """
+
+    # Methods modifying the keychain
+    WRITE_METHODS = ("set", "delete")
+
+    def __init__(self, file_path, save_delay=SAVE_DELAY):
+        """
+        :param save_delay: Time waited for other changes before saving, in
+        seconds
+        """
+        super().__init__(file_path)
+        self.save_delay = save_delay
+        self._loop = None
+        self._lock = None
+        # Save in progress or about to start
+        self._pending_save = None
+        self._last_check = 0
+        # Futures done at the end of the connections, by writer
+        self._connections = {}
+
+    def start(self, loop=None):
+        """ Loads the password file and prepares the server
+        :param loop: Event loop, the current one by default
+        """
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._lock = ReadWriteLock()
+        self._passwords = self._load_pass_file()
+        self._passwords.enable_substring_index()
+        # Sealing the passwords of the older files now, rather than in the
+        # background while they are read
+        self._passwords.seal(self._crypto.entry_cipher(self._master_password))
+        self._last_check = self._loop.time()
+
+    def _reload(self):
+        """ Loads the file again with the trigram index of its domains and
+        logins, which takes a few seconds on large files but speeds up every
+        filter request of the clients afterwards
+        :rtype: Keychain
+        :raise RpcError: If the file can't be loaded
+        """
+        passwords = super()._reload()
+        passwords.enable_substring_index()
+        return passwords
+
+    async def handle_request(self, data):
+        """ Executes a request
+        :param data: Json request
+        :return: The response
+        :rtype: dict
+        """
+        try:
+            request = JsonCodec.loads(data)
+        except ValueError:
+            return {"id": None, "error": "Invalid Json"}
+
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            method, params = self._parse(request)
+            name = request["method"]
+            await self._refresh()
+
+            if name == "save":
+                result = None
+            elif name in self.WRITE_METHODS:
+                async with self._lock.writing():
+                    result = method(params)
+            else:
+                async with self._lock.reading():
+                    result = method(params)
+
+            if name == "save" or name in self.WRITE_METHODS:
+                # Answered once the change is saved
+                await self.save_changes()
+            return {"id": request_id, "result": result}
+        except RpcError as e:
+            return {"id": request_id, "error": str(e)}
+        except OSError as e:
+            # The changes stay in memory, to be saved with the next ones
+            return {"id": request_id,
+                    "error": "Unable to save: {0}, the change will be saved "
+                             "again later".format(e.strerror)}
+
+    def save_changes(self):
+        """ Saves the changes soon, with the ones made meanwhile
+        :return: A future done once the changes made so far are saved
+        """
+        if self._pending_save is None:
+            if not self._passwords.is_dirty:
+                future = self._loop.create_future()
+                future.set_result(None)
+                return future
+            self._pending_save = self._loop.create_task(self._save_later())
+        # Not cancelled with a client leaving
+        return asyncio.shield(self._pending_save)
+
+    async def _save_later(self):
+        await asyncio.sleep(self.save_delay)
+        # The changes made from now on are saved next time
+        self._pending_save = None
+        # The keychain is read by another thread, but not modified
+        async with self._lock.reading():
+            await self._loop.run_in_executor(None, self._save_pass_file,
+                                             self._passwords)
+
+    async def _refresh(self):
+        """ Loads the file again if another process has modified it, and
+        there are no changes to save
+        """
+        now = self._loop.time()
+        if now - self._last_check < CHECK_INTERVAL or \
+                self._pending_save is not None or self._passwords.is_dirty:
+            return
+        self._last_check = now
+
+        cache = self._cache
+        try:
+            if cache is not None and \
+                    cache[0] == file_fingerprint(self._file_path):
+                return
+        except OSError as e:
+            raise RpcError("Unable to read the file: {0}".format(e.strerror))
+        async with self._lock.writing():
+            # The keychain in memory is kept if it fails
+            passwords = await self._loop.run_in_executor(None, self._reload)
+            passwords.seal(self._crypto.entry_cipher(self._master_password))
+            self._passwords = passwords
+
+    def _tracked(self, handler):
+        """ Wraps a connection handler, to close the connection when the
+        server stops
+        """
+        async def tracked(reader, writer, *args):
+            done = self._loop.create_future()
+            self._connections[writer] = done
+            try:
+                await handler(reader, writer, *args)
+            finally:
+                del self._connections[writer]
+                done.set_result(None)
+        return tracked
+
+    async def _serve_lines(self, reader, writer):
+        """ Answers the requests of a client of the Unix domain socket
+        """
+        uid = Agent.peer_uid(writer.get_extra_info("socket"))
+        if uid is not None and uid != os.getuid():
+            writer.close()
+            return
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = await self.handle_request(line)
+                writer.write(JsonCodec.dumps(response).encode("utf-8") +
+                             b"\n")
+                await writer.drain()
+        except (ValueError, ConnectionError):
+            # Line too long, or client gone
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_http(self, reader, writer, token):
+        """ Answers the HTTP requests of a client
+        :param token: Token expected in the Authorization header
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = \
+                        request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._send_http(writer, 400, {"error": "Bad "
+                                                        "request"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = version == "HTTP/1.1" and \
+                    headers.get("connection", "").lower() != "close"
+
+                try:
+                    length = int(headers.get("content-length", "0"))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_REQUEST_SIZE:
+                    await self._send_http(writer, 413, {"error": "Invalid "
+                                                        "length"}, False)
+                    break
+                body = await reader.readexactly(length)
+
+                if method != "POST":
+                    status, response = 405, {"error": "Expecting POST"}
+                elif not hmac.compare_digest(
+                        headers.get("authorization", "").encode("latin-1"),
+                        "Bearer {0}".format(token).encode("latin-1")):
+                    status, response = 401, {"error": "Invalid token"}
+                else:
+                    status, response = 200, await self.handle_request(body)
+                await self._send_http(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _send_http(writer, status, response, keep_alive):
+        body = JsonCodec.dumps(response).encode("utf-8")
+        writer.write("HTTP/1.1 {0} {1}\r\n"
+                     "Content-Type: application/json\r\n"
+                     "Content-Length: {2}\r\n"
+                     "Connection: {3}\r\n\r\n"
+                     .format(status, _HTTP_STATUS[status], len(body),
+                             "keep-alive" if keep_alive else "close")
+                     .encode("latin-1") + body)
+        await writer.drain()
+
+    async def listen_unix(self, socket_path=None):
+        """ Starts serving on a Unix domain socket
+        :param socket_path: Path of the socket, default_socket_path() by
+        default
+        :return: The asyncio server
+        :raise FileExistsError: If the path is used, by another server,
+        another user or another kind of file
+        """
+        socket_path = socket_path if socket_path is not None \
+            else default_socket_path()
+        if os.path.lexists(socket_path):
+            st = os.lstat(socket_path)
+            if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid() or \
+                    _is_listening(socket_path):
+                raise FileExistsError(socket_path)
+            # Left by a server which didn't exit properly
+            os.remove(socket_path)
+        sock = Agent.bind_socket(socket_path)
+        return await asyncio.start_unix_server(self._tracked(self._serve_lines),
+                                               sock=sock,
+                                               limit=MAX_REQUEST_SIZE)
+
+    async def listen_http(self, port=0, token=None):
+        """ Starts serving HTTP on the loopback interface
+        :param port: Port, any free one by default
+        :param token: Token required from the clients, a random one by
+        default, written in token_path()
+        :return: The asyncio server, and the token
+        :rtype: tuple
+        """
+        if token is None:
+            token = os.urandom(32).hex()
+            # In a directory checked only accessible to the user
+            fd = os.open(token_path(), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd, "w") as file:
+                # The mode is only given to a new file
+                os.fchmod(fd, 0o600)
+                file.write(token)
+
+        serve_http = self._tracked(self._serve_http)
+        server = await asyncio.start_server(
+            lambda reader, writer: serve_http(reader, writer, token),
+            "127.0.0.1", port, limit=MAX_REQUEST_SIZE)
+        return server, token
+
+    async def stop(self, servers):
+        """ Stops the servers, closing the connections, and saves the
+        remaining changes
+        """
+        for server in servers:
+            server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await asyncio.gather(*self._connections.values())
+        for server in servers:
+            await server.wait_closed()
+        await self.save_changes()
+
+
+def _is_listening(socket_path):
+    """ Tells if a server accepts connections on a Unix domain socket
+    :rtype: bool
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+            return True
+        except OSError:
+            return False
+
+
+def run(file_path, socket_path=None, http_port=None):
+    """ Serves the password file until the process is interrupted
+    :param socket_path: Path of the Unix domain socket, default_socket_path()
+    by default
+    :param http_port: Port of the HTTP server instead of the socket, 0 for
+    any free port
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = Server(file_path)
+    server.start(loop)
+
+    if http_port is not None:
+        listener, token = loop.run_until_complete(
+            server.listen_http(http_port))
+        print(_("Listening on http://127.0.0.1:{port}/, the token is in "
+                "{filename}")
+              .format(port=listener.sockets[0].getsockname()[1],
+                      filename=token_path()), flush=True)
+    else:
+        socket_path = socket_path if socket_path is not None \
+            else default_socket_path()
+        listener = loop.run_until_complete(server.listen_unix(socket_path))
+        print(_("Listening on {path}").format(path=socket_path), flush=True)
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, loop.stop)
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(server.stop([listener]))
+        if http_port is None:
+            os.remove(socket_path)
+        else:
+            try:
+                os.remove(token_path())
+            except FileNotFoundError:
+                pass
+        loop.close()
@@ -59,10 +59,15 @@ except Exception as e:
           .format(error=e))
     pyperclip_available = False
 
+from Cryptography import CorruptedError
 from Keychain import Keychain, Password
 from ui.BaseInterface import BaseInterface
 
 
+# Maximum number of passwords listed for a search
+SEARCH_LIMIT = 200
+
+
 #
 # Custom widgets
 #
@@ -228,7 +233,8 @@ class Urwid(BaseInterface):
                 self._master_password = new_password
                 password_match = True
 
-        self._save_pass_file(Keychain())
+        self._save_pass_file(Keychain(), compact=True)
+        self._remember_key()
 
     def start(self, mode='interactive', domain=None, login=None):
 
@@ -281,8 +287,11 @@ class Urwid(BaseInterface):
         """ Updates the password list given the filter textbox
         """
         pattern = self.filter_textbox.edit_text.strip()
-        filtered = self._passwords.filter(pattern, True)
-        filtered = sorted(filtered)
+        if pattern:
+            # Fuzzy search, best matches first
+            filtered = self._passwords.search(pattern, SEARCH_LIMIT)
+        else:
+            filtered = self._passwords.filter()
 
         # Passwords buttons
         l = []
@@ -324,7 +333,7 @@ class Urwid(BaseInterface):
         if pyperclip_available:
             body.extend([
                 self._new_button(_("Copy the password in the clipboard"),
-                                 on_press=lambda b: pyperclip.copy(p.password)),
+                                 on_press=lambda b: self._copy_password(p)),
                 self._new_button(_("Copy the domain in the clipboard"),
                                  on_press=lambda b: pyperclip.copy(p.domain)),
                 self._new_button(_("Copy the login in the clipboard"),
@@ -357,9 +366,12 @@ class Urwid(BaseInterface):
         """
         p_obj = user_data['password'] if 'password' \
                                          in user_data else Password()
+        password = self._decrypt_password(p_obj)
+        if password is None:
+            return
         d = self._new_edit(_("Domain: "), edit_text=p_obj.domain)
         l = self._new_edit(_("Login: "), edit_text=p_obj.login)
-        p = self._new_edit(_("Password: "), edit_text=p_obj.password)
+        p = self._new_edit(_("Password: "), edit_text=password)
         replace = user_data['replace'] if 'replace' in user_data else False
 
         def dismiss(button=None):
@@ -367,10 +379,15 @@ class Urwid(BaseInterface):
 
         def save_entry(button):
             if d.edit_text != "" or l.edit_text != "":
-                if replace:
+                domain = d.edit_text.strip()
+                login = l.edit_text.strip()
+                # Replacing the password of the same entry in place, so
+                # that nothing is saved if it has not changed
+                if replace and \
+                        self._passwords.get(domain, login) is not p_obj:
                     self._passwords.delete(p_obj)
-                self._passwords.set(d.edit_text.strip(), l.edit_text.strip(),
-                                    p.edit_text.strip(), replace)
+                self._passwords.set(domain, login, p.edit_text.strip(),
+                                    replace)
                 self._save_pass_file(self._passwords)
                 self._refresh_list()
                 dismiss()
@@ -394,6 +411,49 @@ class Urwid(BaseInterface):
             left=2, right=2,
             top=2, bottom=2)
 
+    def _copy_password(self, password):
+        """ Copies a password in the clipboard
+        :type password: Password
+        """
+        clear_password = self._decrypt_password(password)
+        if clear_password is not None:
+            pyperclip.copy(clear_password)
+
+    def _decrypt_password(self, password):
+        """ Returns the password of an entry, or shows an error if it is
+        damaged in the file
+        :type password: Password
+        :return: The password, None if it can't be decrypted
+        :rtype: str
+        """
+        try:
+            return password.password
+        except CorruptedError:
+            self._show_error(_("The password of {domain} - {login} seems to "
+                               "be corrupted.")
+                             .format(domain=password.domain,
+                                     login=password.login))
+            return None
+
+    def _show_error(self, message):
+        """ Opens a dialog showing an error
+        """
+        def dismiss(button=None):
+            self.window.original_widget = self.window.original_widget.bottom_w
+
+        body = [urwid.Text(message, align='center'),
+                urwid.Divider('\u2500'),
+                #. TRANSLATORS: Back to the previous view.
+                self._new_button(_("Return"), on_press=dismiss)]
+
+        dialog = urwid.LineBox(urwid.ListBox(urwid.SimpleListWalker(body)))
+        self.window.original_widget = urwid.Overlay(
+            dialog,
+            self.window.original_widget,
+            align='center', width=('relative', 60),
+            valign='middle', height=('relative', 40),
+            min_width=24, min_height=6)
+
     def _delete_password(self, password):
         """ Deletes a password from the keychain and return True on success.
         :param password: Password object to delete